@@ -1,96 +1,617 @@
 ## This tool is used to extract standardised data from CoT documents using RegEx
-import tkinter as tk
-from tkinter import filedialog
-import numpy as np
-import pandas as pd
-import docx2txt
-import re
+import argparse
+import collections
+import concurrent.futures
+import hashlib
+import itertools
+import json
 import os
+import re
+import sys
+import tempfile
+import time
 
 # regex extractors
-regex_tenant = 'Company\smeans\s([^\n|^;|^:]+)'
-regex_landlord = 'Name\sand\saddress\sof\s[the\s]*present\slandlord,\sprovided\sby\sthe\sCompany:\s*([\w\W]+)Name\s[andres\s]*of\sany\spresent\sguarantor\sof\sthe\stenant'
-regex_guarantor = 'Name\s[andres\s]*of\sany\spresent\sguarantor\sof\sthe\stenant:\s*([^\n]+)'
-regex_property = 'Brief\s[Dd]escription\:?\s([\w\W]*?)Tenure\:?'
-regex_lease_title_num = '(Registered\s[Tt]itle\s|Folio\s)[Nn]umber:*?\s([\w\W]*?)(Conveyancing|Root\sof\stitle)'
-regex_lease_expiry_date = 'Contractual\sterm\sexpiry\sdate:\s*([^\n]+)'
-regex_tenant_termination_rights = 'Options\sand\srights\sof\sfirst\srefusal\s[\w\W]*?Disclosures:?\s+(Tenants\sRight\sto\sTerminate\s)?([\w\W]*?)(1995\sAct|Collateral\sassurances|Landlord[\W]s\sRight\sto\sTerminate)'
-regex_subject_to_charge = 'Charges\n[\w\W]*?Disclosures:?([\w\W]*?)(Agreements|Encumbrances)'
-regex_current_annual_rent = 'Current\sannual\srent\:?([\w\W]*?)Rent\sreview\sfrequency\:?'
-regex_rent_calculation = 'Original\sannual\srent\sincluding\sdetails\sof\sany\spremium\spaid\:?([\w\W]*?)Current\sannual\srent\:?'
-regex_index_linked_original_rent = 'Original\sannual\srent\sincluding\sdetails\sof\sany\spremium\spaid\:?([\w\W]*?)Current\sannual\srent\:?'
-regex_index_linked_rent_review_frequency = 'Rent\sreview\sfrequency\:?([\w\W]*?)Remaining\srent\sreview\sdates\:?'
-regex_tenant_indemnity = 'No\sother\smaterial\smatters\n[\w\W]*?Disclosures:?([\w\W]*?)(SCHEDULE\s5|PART\s5|THE\sLETTING\sDOCUMENTS|[\W]\sNOT\sUSED)'
-regex_change_of_control = 'Alienation([\w\W]*?Disclosures([\w\W]*?))Insurance\n'
-regex_landlord_consent = 'Alienation([\w\W]*?Disclosures([\w\W]*?))Insurance\n'
-regex_req_for_auth_guarantee = 'No\sother\smaterial\smatters\n[\w\W]*?Disclosures:?([\w\W]*?)(SCHEDULE\s5|PART\s5|THE\sLETTING\sDOCUMENTS|[\W]\sNOT\sUSED)'
-regex_lease_rights = 'Summary\sof\sthe\srights\sgranted\sto\sthe\stenant\:?\s([\w\W]*?)Summary\sof\sthe\srights\sreserved\sto\sthe\slandlord'
-regex_landlord_reservations = 'Summary\sof\sthe\srights\sreserved\sto\sthe\slandlord:?\s*([\w\W]*?)(Specified\sinsured\srisks|Name\sand\saddress\sof\s(the\s)?present\slandlord)'
-regex_access_public_road = 'Access\n[\w\W]*?Disclosures:?([\w\W]*?)Benefits\n'
-regex_repowering_application = 'Pending\sapplications\n([\w\W]*?Disclosures[\w\W]*?)(([\d]{1,2}\.)?Planning\sagreements)'
-regex_COT_liability = 'LIMITATION\sOF\sLIABILITY\n([\w\W]*?)(Schedule\s1|SCHEDULE\s1|Date:)'
-
-# regex list
-regex_list = [regex_tenant, regex_landlord, regex_guarantor, regex_property, regex_lease_title_num, regex_lease_expiry_date, \
-    regex_tenant_termination_rights, regex_subject_to_charge, regex_current_annual_rent, regex_rent_calculation, regex_index_linked_original_rent, \
-        regex_index_linked_rent_review_frequency, regex_tenant_indemnity, regex_change_of_control, regex_landlord_consent, \
-            regex_req_for_auth_guarantee, regex_lease_rights, regex_landlord_reservations, regex_access_public_road, regex_repowering_application, \
-                regex_COT_liability]
-
-# import word document(s)
-root = tk.Tk()
-root.withdraw()
-wordDocs = filedialog.askopenfilenames()
-
-# get filenames
-filenames = [[""] for x in range(len(wordDocs))]
-i = 0
-
-while (i < len(wordDocs)):
-    filenames[i] = os.path.basename(wordDocs[i])
-    i += 1
-
-## array for all results
-results = np.empty((len(wordDocs), 21), dtype=object)
-
-i = 0
-
-while (i < len(wordDocs)):
-
-    # get text from current word document
-    docText = docx2txt.process(wordDocs[i]) ## works for .docx, not .doc
-
-    # array that stores current word docs regex results
-    docResults = np.empty((21), dtype=object)
-
-    # iterates over list of regexes
-    j = 0
-
-    # following code extracts regex results from current word doc
-    while (j < len(regex_list)):
-        if (re.search(regex_list[j], docText) is None):
-            docResults[j] = '[Blank]'
-            j += 1
-        elif (j == 4 or j == 6):
-            docResults[j] = re.search(regex_list[j], docText).group(2).strip() # due to some awkwardness with lease_title_num regex, need to take group 2
-            j += 1
+regex_tenant = r'Company\smeans\s([^\n|^;|^:]+)'
+regex_landlord = r'Name\sand\saddress\sof\s[the\s]*present\slandlord,\sprovided\sby\sthe\sCompany:\s*([\w\W]+)Name\s[andres\s]*of\sany\spresent\sguarantor\sof\sthe\stenant'
+regex_guarantor = r'Name\s[andres\s]*of\sany\spresent\sguarantor\sof\sthe\stenant:\s*([^\n]+)'
+regex_property = r'Brief\s[Dd]escription\:?\s([\w\W]*?)Tenure\:?'
+regex_lease_title_num = r'(Registered\s[Tt]itle\s|Folio\s)[Nn]umber:*?\s([\w\W]*?)(Conveyancing|Root\sof\stitle)'
+regex_lease_expiry_date = r'Contractual\sterm\sexpiry\sdate:\s*([^\n]+)'
+regex_tenant_termination_rights = r'Options\sand\srights\sof\sfirst\srefusal\s[\w\W]*?Disclosures:?\s+(Tenants\sRight\sto\sTerminate\s)?([\w\W]*?)(1995\sAct|Collateral\sassurances|Landlord[\W]s\sRight\sto\sTerminate)'
+regex_subject_to_charge = r'Charges\n[\w\W]*?Disclosures:?([\w\W]*?)(Agreements|Encumbrances)'
+regex_current_annual_rent = r'Current\sannual\srent\:?([\w\W]*?)Rent\sreview\sfrequency\:?'
+regex_rent_calculation = r'Original\sannual\srent\sincluding\sdetails\sof\sany\spremium\spaid\:?([\w\W]*?)Current\sannual\srent\:?'
+regex_index_linked_original_rent = r'Original\sannual\srent\sincluding\sdetails\sof\sany\spremium\spaid\:?([\w\W]*?)Current\sannual\srent\:?'
+regex_index_linked_rent_review_frequency = r'Rent\sreview\sfrequency\:?([\w\W]*?)Remaining\srent\sreview\sdates\:?'
+regex_tenant_indemnity = r'No\sother\smaterial\smatters\n[\w\W]*?Disclosures:?([\w\W]*?)(SCHEDULE\s5|PART\s5|THE\sLETTING\sDOCUMENTS|[\W]\sNOT\sUSED)'
+regex_change_of_control = r'Alienation([\w\W]*?Disclosures([\w\W]*?))Insurance\n'
+regex_landlord_consent = r'Alienation([\w\W]*?Disclosures([\w\W]*?))Insurance\n'
+regex_req_for_auth_guarantee = r'No\sother\smaterial\smatters\n[\w\W]*?Disclosures:?([\w\W]*?)(SCHEDULE\s5|PART\s5|THE\sLETTING\sDOCUMENTS|[\W]\sNOT\sUSED)'
+regex_lease_rights = r'Summary\sof\sthe\srights\sgranted\sto\sthe\stenant\:?\s([\w\W]*?)Summary\sof\sthe\srights\sreserved\sto\sthe\slandlord'
+regex_landlord_reservations = r'Summary\sof\sthe\srights\sreserved\sto\sthe\slandlord:?\s*([\w\W]*?)(Specified\sinsured\srisks|Name\sand\saddress\sof\s(the\s)?present\slandlord)'
+regex_access_public_road = r'Access\n[\w\W]*?Disclosures:?([\w\W]*?)Benefits\n'
+regex_repowering_application = r'Pending\sapplications\n([\w\W]*?Disclosures[\w\W]*?)(([\d]{1,2}\.)?Planning\sagreements)'
+regex_COT_liability = r'LIMITATION\sOF\sLIABILITY\n([\w\W]*?)(Schedule\s1|SCHEDULE\s1|Date:)'
+
+
+# field registry: output label, regex, capture group holding the result, and the heading
+# the regex starts with (a regex can't match before its heading, so the search starts there)
+FieldSpec = collections.namedtuple("FieldSpec", ["label", "pattern", "group", "anchor"])
+
+FIELDS = [
+    FieldSpec('Tenant', regex_tenant, 1, r'Company\smeans\s'),
+    FieldSpec('Landlord', regex_landlord, 1, r'Name\sand\saddress\sof\s'),
+    FieldSpec('Guarantor', regex_guarantor, 1, r'Name\s[andres\s]*of\sany\spresent\sguarantor'),
+    FieldSpec('Property', regex_property, 1, r'Brief\s[Dd]escription'),
+    FieldSpec('Lease Title Num', regex_lease_title_num, 2, r'(Registered\s[Tt]itle\s|Folio\s)[Nn]umber'),
+    FieldSpec('Lease Expiry Date', regex_lease_expiry_date, 1, r'Contractual\sterm\sexpiry\sdate:'),
+    FieldSpec('Tenant Termnination Rights', regex_tenant_termination_rights, 2, r'Options\sand\srights\sof\sfirst\srefusal\s'),
+    FieldSpec('Subject to Charge', regex_subject_to_charge, 1, r'Charges\n'),
+    FieldSpec('Current Annual Rent', regex_current_annual_rent, 1, r'Current\sannual\srent'),
+    FieldSpec('Rent Calculation', regex_rent_calculation, 1, r'Original\sannual\srent\sincluding'),
+    FieldSpec('Index Linked (Original Rent)', regex_index_linked_original_rent, 1, r'Original\sannual\srent\sincluding'),
+    FieldSpec('Index Linked (Rent Review Frequency)', regex_index_linked_rent_review_frequency, 1, r'Rent\sreview\sfrequency'),
+    FieldSpec('Tenant Indemnity', regex_tenant_indemnity, 1, r'No\sother\smaterial\smatters\n'),
+    FieldSpec('Change of Control', regex_change_of_control, 1, r'Alienation'),
+    FieldSpec('Landlord Consent to Charge Req', regex_landlord_consent, 1, r'Alienation'),
+    FieldSpec('Req for Auth Guarantee', regex_req_for_auth_guarantee, 1, r'No\sother\smaterial\smatters\n'),
+    FieldSpec('Lease Rights', regex_lease_rights, 1, r'Summary\sof\sthe\srights\sgranted'),
+    FieldSpec('Landlord Reservations', regex_landlord_reservations, 1, r'Summary\sof\sthe\srights\sreserved'),
+    FieldSpec('Access to Public Road', regex_access_public_road, 1, r'Access\n'),
+    FieldSpec('Repowering Application Submittee', regex_repowering_application, 1, r'Pending\sapplications\n'),
+    FieldSpec('COT Liability', regex_COT_liability, 1, r'LIMITATION\sOF\sLIABILITY\n'),
+]
+
+# output row labels
+row_labels = [field.label for field in FIELDS]
+
+# bump when results change in a way the field specs don't show (2: patterns compiled DOTALL and deduplicated)
+EXTRACTION_VERSION = 2
+
+
+def field_fingerprint(field):
+    """Return a short hash of everything that determines a field's result."""
+    spec = "\0".join([field.pattern, str(field.group), field.anchor])
+
+    return hashlib.sha1(spec.encode('utf-8')).hexdigest()[:16]
+
+
+class ExtractionEngine:
+    """Extracts a fixed set of fields from document text with regexes.
+
+    The patterns are compiled once, in DOTALL mode so the "[\\w\\W]" any-character
+    spans become the faster ".". Identical patterns (and identical headings) are
+    only compiled and searched once per document, however many fields use them.
+
+    Each document gets a heading index: the first position of every heading,
+    found with one cheap search per distinct heading. A field whose heading is
+    missing is blank without running its regex, and the others search from
+    their heading onwards instead of from the start of the document.
+
+    Attributes:
+        timings (list): Total seconds spent searching for each field.
+        counts (list): Number of searches made for each field.
+
+    """
+
+    def __init__(self, fields):
+        """
+        Args:
+            fields (list): FieldSpec for each field to extract, in output order.
+
+        """
+        unique_patterns = {}
+        unique_anchors = {}
+
+        for field in fields:
+            unique_patterns.setdefault(field.pattern, len(unique_patterns))
+            unique_anchors.setdefault(field.anchor, len(unique_anchors))
+
+        self.labels = [field.label for field in fields]
+        self.compiled = [re.compile(pattern.replace(r'[\w\W]', '.'), re.DOTALL) for pattern in unique_patterns]
+        self.compiled_anchors = [re.compile(anchor) for anchor in unique_anchors]
+
+        #: list: (pattern id, anchor id, group) for each field.
+        self.fields = [(unique_patterns[field.pattern], unique_anchors[field.anchor], field.group)
+                       for field in fields]
+
+        self.timings = [0.0] * len(self.fields)
+        self.counts = [0] * len(self.fields)
+
+
+    def heading_index(self, text):
+        """Return the position of the first match of every heading, or None."""
+        index = []
+
+        for anchor in self.compiled_anchors:
+            found = anchor.search(text)
+            index.append(found.start() if found is not None else None)
+
+        return index
+
+
+    def extract(self, text):
+        """Return the stripped result of every field, or '[Blank]' if not found."""
+        headings = self.heading_index(text)
+        matches = {}
+        results = []
+
+        for field, (pattern_id, anchor_id, group) in enumerate(self.fields):
+            start = headings[anchor_id]
+
+            if start is None:
+                results.append('[Blank]')
+                continue
+
+            if pattern_id not in matches:
+                tic = time.perf_counter()
+                matches[pattern_id] = self.compiled[pattern_id].search(text, start)
+                self.timings[field] += time.perf_counter() - tic
+                self.counts[field] += 1
+
+            match = matches[pattern_id]
+
+            if match is None or match.group(group) is None:
+                results.append('[Blank]')
+            else:
+                results.append(match.group(group).strip())
+
+        return results
+
+
+    def extract_fields(self, text):
+        """Return the extracted fields as a dict keyed by label."""
+        return dict(zip(self.labels, self.extract(text)))
+
+
+    def timing_report(self):
+        """Return (label, searches, total seconds) for each field, slowest first."""
+        report = zip(self.labels, self.counts, self.timings)
+
+        return sorted(report, key = lambda row: row[2], reverse = True)
+
+
+    def take_timings(self):
+        """Return (label, searches, total seconds) for each field and reset the counters."""
+        taken = list(zip(self.labels, self.counts, self.timings))
+
+        self.timings = [0.0] * len(self.fields)
+        self.counts = [0] * len(self.fields)
+
+        return taken
+
+
+    def add_timings(self, timings):
+        """Add (label, searches, seconds) rows, e.g. from take_timings() in a worker, to this engine's counters."""
+        positions = {label: field for field, label in enumerate(self.labels)}
+
+        for label, searches, seconds in timings:
+            if label in positions:
+                self.counts[positions[label]] += searches
+                self.timings[positions[label]] += seconds
+
+
+#: namedtuple: Outcome of extracting one document; fields (a dict keyed by label) is None if it failed.
+DocumentResult = collections.namedtuple("DocumentResult", ["path", "fields", "error"])
+
+# engine, text cache and reader set up once in each worker process
+_worker_engine = None
+_worker_text_cache = None
+_worker_reader = 'docx2txt'
+
+
+def default_engine(labels = None):
+    """Return an engine for the registered CoT fields, or only those labelled."""
+    if labels is None:
+        return ExtractionEngine(FIELDS)
+
+    labels = set(labels)
+
+    return ExtractionEngine([field for field in FIELDS if field.label in labels])
+
+
+def _init_worker(text_cache_options = None, labels = None, reader = 'docx2txt'):
+    global _worker_engine, _worker_text_cache, _worker_reader
+    _worker_engine = default_engine(labels)
+    _worker_reader = reader
+
+    if text_cache_options is not None:
+        from docxTextCache import TextCache
+        _worker_text_cache = TextCache(**text_cache_options)
+
+
+def get_document_text(path, text_cache = None, reader = 'docx2txt'):
+    """Return a document's text, from the text cache if one is given, otherwise with the named reader."""
+    if text_cache is not None:
+        return text_cache.get_text(path)
+
+    from docxTextCache import READERS
+
+    return READERS[reader](path) ## works for .docx, not .doc
+
+
+def extract_document(path, engine = None, text_cache = None, reader = None):
+    """Parse and extract one .docx, recording any failure instead of raising."""
+    engine = engine or _worker_engine or default_engine()
+    text_cache = text_cache or _worker_text_cache
+    reader = reader or _worker_reader
+
+    try:
+        docText = get_document_text(path, text_cache, reader)
+        return DocumentResult(path, engine.extract_fields(docText), None)
+    except Exception as error:
+        return DocumentResult(path, None, f"{type(error).__name__}: {error}")
+
+
+def _extract_chunk(paths):
+    results = [extract_document(path) for path in paths]
+
+    return results, _worker_engine.take_timings()                               # counters would otherwise die with the worker
+
+
+def _chunks(paths, chunksize):
+    chunk = []
+
+    for path in paths:
+        chunk.append(path)
+
+        if len(chunk) == chunksize:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
+
+
+def extract_batch(paths, processes = None, chunksize = 8, ordered = True, max_pending = None,
+                  text_cache_options = None, labels = None, reader = 'docx2txt', totals = None):
+    """Extract many documents in parallel, yielding a DocumentResult for each.
+
+    Documents are handed to a pool of worker processes in chunks. At most
+    max_pending chunks (default: two per process) are in flight or waiting to be
+    collected at once, so memory stays bounded however many paths are given.
+
+    Args:
+        paths (iterable): .docx paths. Consumed lazily.
+        processes (int): Worker processes. Defaults to the number of CPUs.
+        chunksize (int): Documents sent to a worker at a time.
+        ordered (bool): Yield results in input order. If False, chunks are
+            yielded as soon as they finish.
+        max_pending (int): Chunks allowed in flight at once.
+        text_cache_options (dict): TextCache arguments. If given, each worker
+            reads document text through a TextCache built with them.
+        labels (iterable): Only extract the fields with these labels.
+            Defaults to every registered field.
+        reader (str): Text reader used without a text cache, a key of
+            ``docxTextCache.READERS``.
+        totals (ExtractionEngine): If given, the workers' per-field search
+            counts and timings are added to it as chunks complete.
+
+    Yields:
+        DocumentResult: One per path. Documents that fail have error set.
+
+    """
+    processes = processes or os.cpu_count() or 1
+    max_pending = max_pending or 2 * processes
+    chunks = _chunks(paths, chunksize)
+
+    with concurrent.futures.ProcessPoolExecutor(processes, initializer = _init_worker,
+                                                initargs = (text_cache_options, labels, reader)) as pool:
+        pending = collections.deque()
+
+        for chunk in itertools.islice(chunks, max_pending):
+            pending.append(pool.submit(_extract_chunk, chunk))
+
+        while pending:
+            if ordered:
+                future = pending.popleft()
+            else:
+                done, _ = concurrent.futures.wait(pending, return_when = concurrent.futures.FIRST_COMPLETED)
+                future = done.pop()
+                pending.remove(future)
+
+            for chunk in itertools.islice(chunks, 1):
+                pending.append(pool.submit(_extract_chunk, chunk))
+
+            results, timings = future.result()
+
+            if totals is not None:
+                totals.add_timings(timings)
+
+            yield from results
+
+
+def document_stamp(path):
+    """Return a string that changes whenever the file at path is modified."""
+    stat = os.stat(path)
+
+    return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+
+class ResultStore:
+    """Extracted field values from earlier runs, kept in a JSON file.
+
+    Alongside each document's values the store keeps the document's stamp
+    (mtime, size, text reader and EXTRACTION_VERSION) and, for every value,
+    the fingerprint of the pattern, group and heading it was extracted with. On the next run an unchanged
+    document only needs the fields it has no value for, or whose spec has
+    changed since its value was stored; everything else is reused as it is.
+    Fingerprints are kept per document because a run may only cover some of
+    the documents in the store.
+
+    Attributes:
+        documents (dict): {"stamp": ..., "values": {label: value},
+            "fields": {label: fingerprint}} keyed by absolute path.
+
+    """
+
+    def __init__(self, path, reader = 'docx2txt'):
+        """
+        Args:
+            path (str): Location of the JSON file. Read if it exists.
+            reader (str): Text reader the values are extracted with. Values
+                stored with another reader are extracted again.
+
+        """
+        self.path = path
+        self.reader = reader
+        self.documents = {}
+
+        if os.path.exists(path):
+            with open(path, 'r', encoding = 'utf-8') as store:
+                saved = json.load(store)
+
+            self.documents = saved.get("documents", {})
+
+            # stores written before fingerprints were kept per document
+            for entry in self.documents.values():
+                entry.setdefault("fields", dict(saved.get("fields", {})))
+
+
+    def stamp(self, path):
+        """Return the document's stamp, combined with the reader and extraction version."""
+        return f"{document_stamp(path)}|{self.reader}|{EXTRACTION_VERSION}"
+
+
+    def stale_labels(self, path, fields):
+        """Return the labels of fields to extract for a document.
+
+        Every label is stale for a document that is new or has changed. For
+        an unchanged document, fields without a stored value or whose spec
+        has changed since the value was stored are stale.
+
+        """
+        entry = self.documents.get(os.path.abspath(path))
+
+        if self.stored_values(path) is None:
+            return [field.label for field in fields]
+
+        return [field.label for field in fields
+                if field.label not in entry["values"]
+                or entry["fields"].get(field.label) != field_fingerprint(field)]
+
+
+    def stored_values(self, path):
+        """Return the stored values of a document, or None if it is new or has changed."""
+        entry = self.documents.get(os.path.abspath(path))
+
+        try:
+            if entry is None or entry["stamp"] != self.stamp(path):
+                return None
+        except OSError:
+            return None
+
+        return entry["values"]
+
+
+    def update(self, path, values, fields):
+        """Store values for a document, merging them over any it already has.
+
+        Args:
+            path (str): The document.
+            values (dict): Extracted values keyed by label.
+            fields (list): FieldSpec of every registered field, to record the
+                fingerprints the values were extracted with.
+
+        """
+        key = os.path.abspath(path)
+        stamp = self.stamp(path)
+        entry = self.documents.get(key)
+
+        if entry is None or entry["stamp"] != stamp:
+            entry = self.documents[key] = {"stamp": stamp, "values": {}, "fields": {}}
+
+        entry["values"].update(values)
+        entry["fields"].update((field.label, field_fingerprint(field)) for field in fields
+                               if field.label in values)
+
+
+    def forget(self, path):
+        """Drop a document, so it is extracted in full next time."""
+        self.documents.pop(os.path.abspath(path), None)
+
+
+    def save(self, fields):
+        """Write the store atomically, dropping values of fields no longer registered."""
+        labels = {field.label for field in fields}
+
+        for entry in self.documents.values():
+            entry["values"] = {label: value for label, value in entry["values"].items() if label in labels}
+            entry["fields"] = {label: value for label, value in entry["fields"].items() if label in labels}
+
+        handle, temp_path = tempfile.mkstemp(dir = os.path.dirname(os.path.abspath(self.path)), suffix = '.tmp')
+
+        with os.fdopen(handle, 'w', encoding = 'utf-8') as store:
+            json.dump({"documents": self.documents}, store)
+
+        os.replace(temp_path, self.path)
+
+
+def extract_incremental(paths, store, processes = None, chunksize = 8, text_cache_options = None,
+                        reader = 'docx2txt', totals = None):
+    """Extract every registered field for paths, reusing what the store already has.
+
+    New and modified documents are extracted in full. Unchanged documents only
+    have their stale fields (missing, or with a changed spec) extracted, and
+    skip the text reader and regexes altogether when nothing is stale.
+
+    Args:
+        paths (list): .docx paths.
+        store (ResultStore): Values from earlier runs. Updated, not saved.
+
+    The other arguments are passed on to extract_batch.
+
+    Yields:
+        DocumentResult: One per path, in order, with every registered field.
+
+    """
+    # documents needing the same fields are extracted together
+    batches = collections.defaultdict(list)
+
+    for path in paths:
+        stale = store.stale_labels(path, FIELDS)
+
+        if stale:
+            batches[None if len(stale) == len(FIELDS) else tuple(stale)].append(path)
+
+    for labels, batch in batches.items():
+        if labels is not None:
+            print(f"Re-extracting {len(labels)} field(s) from {len(batch)} unchanged document(s): "
+                  + ", ".join(labels))
+
+    results = {}
+
+    for labels, batch in batches.items():
+        for result in extract_batch(batch, processes, chunksize, text_cache_options = text_cache_options,
+                                    labels = labels, reader = reader, totals = totals):
+            if result.error is None:
+                store.update(result.path, result.fields, FIELDS)
+            else:
+                store.forget(result.path)
+
+            results[result.path] = result
+
+    for path in paths:
+        if path in results and results[path].error is not None:
+            yield results[path]
         else:
-            docResults[j] = re.search(regex_list[j], docText).group(1).strip()
-            j += 1
+            values = store.stored_values(path)
+            yield DocumentResult(path, {label: values[label] for label in row_labels}, None)
+
+
+def find_documents(paths):
+    """Expand directories into the .docx files they contain, recursively."""
+    for path in paths:
+        if os.path.isdir(path):
+            for dirPath, subDirs, files in os.walk(path):
+                for currentFile in sorted(files):
+                    if currentFile.lower().endswith(".docx") and not currentFile.startswith("~$"):
+                        yield os.path.join(dirPath, currentFile)
+        else:
+            yield path
+
+
+def default_output_path(path):
+    """Return the default output file for a run whose first input is path."""
+    path = os.path.abspath(path)
+
+    if os.path.isdir(path):
+        return os.path.join(os.path.dirname(path), os.path.basename(path) + "_CoT_Output.xlsx")
+
+    return os.path.join(os.path.dirname(path), "CoT_Output.xlsx")
+
+
+def main(argv = None):
+    import pandas as pd
+
+    from spreadsheetIO import write_tables
+
+    parser = argparse.ArgumentParser(description = "Extract standardised fields from CoT .docx documents.")
+    parser.add_argument("paths", nargs = "*", help = ".docx files or directories (default: choose with file explorer)")
+    parser.add_argument("-o", "--output",
+                        help = "output .xlsx file (default: <first directory>_CoT_Output.xlsx beside the first directory, "
+                               "or CoT_Output.xlsx beside the first document)")
+    parser.add_argument("--processes", type = int, default = None, help = "worker processes (default: one per CPU)")
+    parser.add_argument("--chunksize", type = int, default = 8, help = "documents per worker task (default: 8)")
+    parser.add_argument("--text-cache", help = "directory to cache extracted document text in between runs")
+    parser.add_argument("--text-cache-mb", type = int, default = 1024, help = "size limit of the text cache (default: 1024)")
+    parser.add_argument("--text-cache-key", choices = ["stat", "hash"], default = "stat",
+                        help = "identify documents by path, mtime and size (stat) or by content hash (default: stat)")
+    parser.add_argument("--fast-reader", action = "store_true",
+                        help = "stream the document body only, skipping headers and footers")
+    parser.add_argument("--store", help = "JSON file of values from earlier runs, so only new documents and "
+                        "changed fields are re-extracted (default: next to the output file)")
+    parser.add_argument("--full", action = "store_true", help = "re-extract every field of every document")
+    args = parser.parse_args(argv)
+
+    wordDocs = args.paths
+
+    if not wordDocs:
+        import tkinter as tk
+        from tkinter import filedialog
+
+        # import word document(s)
+        root = tk.Tk()
+        root.withdraw()
+        wordDocs = filedialog.askopenfilenames()
+
+    if not wordDocs:
+        sys.exit("No documents chosen")
+
+    if args.output is None:
+        args.output = default_output_path(wordDocs[0])
+        print("Writing results to " + args.output)
+
+    ## results for all documents, one list per document
+    filenames = []
+    results = []
+    failures = []
+
+    reader = "stream" if args.fast_reader else "docx2txt"
+    text_cache_options = None
+
+    if args.text_cache:
+        text_cache_options = {"directory": args.text_cache,
+                              "max_bytes": args.text_cache_mb * 1024 * 1024,
+                              "key_mode": args.text_cache_key,
+                              "reader": reader}
+
+    store = ResultStore(args.store or os.path.splitext(args.output)[0] + ".fields.json", reader)
+
+    if args.full:
+        store.documents = {}
+
+    totals = default_engine()                                                   # collects the workers' per-field timings
+
+    for result in extract_incremental(list(find_documents(wordDocs)), store, args.processes, args.chunksize,
+                                      text_cache_options = text_cache_options, reader = reader, totals = totals):
+        if result.error is None:
+            filenames.append(os.path.basename(result.path))
+            results.append([result.fields[label] for label in row_labels])
+        else:
+            print("Failed: " + result.path + " | " + result.error)
+            failures.append((result.path, result.error))
+
+    print(str(len(results)) + " documents extracted, " + str(len(failures)) + " failed")
+
+    # show which regexes are slowest
+    for label, searches, seconds in totals.timing_report():
+        print(f"{label}: {searches} searches, {seconds:0.4f} seconds")
+
+    store.save(FIELDS)
+
+    # pandas dataframe
+    df = pd.DataFrame(results, index = filenames, columns = row_labels).T
+
+    # write to excel, with any failures on a second sheet
+    sheets = [("Results", df, True)]
 
-    # add current doc results to all results
-    results[i] = docResults
+    if failures:
+        sheets.append(("Failures", pd.DataFrame(failures, columns = ["Path", "Error"]), False))
 
-    # iterate counter to get next document results
-    i += 1
+    write_tables(args.output, sheets)
 
-# pandas dataframe
-df = pd.DataFrame(results.T, index = ['Tenant', 'Landlord', 'Guarantor', 'Property', 'Lease Title Num', 'Lease Expiry Date', \
-    'Tenant Termnination Rights', 'Subject to Charge', 'Current Annual Rent', 'Rent Calculation', \
-        'Index Linked (Original Rent)', 'Index Linked (Rent Review Frequency)', 'Tenant Indemnity', \
-            'Change of Control', 'Landlord Consent to Charge Req', 'Req for Auth Guarantee', \
-                'Lease Rights', 'Landlord Reservations', 'Access to Public Road', \
-                    'Repowering Application Submittee', 'COT Liability'], columns = [filenames])
 
-# write to excel
-df.to_excel("C:\\Users\\om11\\Documents\\Python\\Testing\\CoT_Test_Output.xlsx")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
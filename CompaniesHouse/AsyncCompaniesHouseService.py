@@ -0,0 +1,556 @@
+## This is an asyncio counterpart to CompaniesHouseService which fetches many companies at once ##
+
+import asyncio
+import collections
+import time
+
+import aiohttp
+
+from CompaniesHouseMetrics import endpoint_of
+from CompaniesHouseRateLimiter import TokenBucket
+from CompaniesHouseService import CompaniesHouseError, CompaniesHouseService
+from CompaniesHouseService import RequestTiming
+from CompaniesHouseService import format_charge, is_director, last_page
+from CompaniesHouseService import page_query, _decode_json
+
+
+class AsyncCompaniesHouseService:
+    """An asyncio wrapper around the companies house API.
+
+    Has the same method surface as CompaniesHouseService, but every method
+    is a coroutine. Lookups run concurrently, bounded by ``concurrency``
+    in-flight requests and by the shared rate limiter, so once the limiter
+    is saturated the run time is set by the API quota rather than by the
+    round trip latency of each request.
+
+    The aiohttp session is created on first use inside the running event
+    loop. Use the service as an async context manager, or await ``close()``
+    when finished.
+
+    Attributes:
+        api_root (str): Scheme and host of the Companies House API.
+        search_url (str): Base url for Companies House search query.
+        company_url (str): Base url for Companies House company query.
+        root_url (str): Base url for paths returned in API "links".
+
+    """
+    api_root = CompaniesHouseService.api_root
+    search_url = CompaniesHouseService.search_url
+    company_url = CompaniesHouseService.company_url
+    root_url = CompaniesHouseService.root_url
+
+    retry_status_codes = CompaniesHouseService.retry_status_codes
+
+
+    def __init__(self, key, concurrency = 10, max_retries = 3,
+                 backoff_factor = 0.5, timeout = 30, timing_history = 10000,
+                 api_root = None, rate_limiter = None, cache = None,
+                 hooks = None, snapshot = None, raise_on_error = False):
+        """
+        Args:
+            key (str): The API key issued in the Companies House API
+                applications.
+            concurrency (int): Maximum number of requests in flight at once,
+                which is also the size of the keep-alive connection pool.
+            max_retries (int): Number of times a request is retried after a
+                connection error or a 429/5xx response.
+            backoff_factor (float): Exponential backoff factor in seconds
+                between retries. A "Retry-After" header sent by the API
+                takes precedence.
+            timeout (float): Seconds to wait for the API to respond.
+            timing_history (int): Number of recent request timings to keep
+                in ``request_timings``.
+            api_root (str): Overrides the API scheme and host, e.g. to point
+                the service at a local stub server.
+            rate_limiter (TokenBucket): Limiter to draw request tokens from.
+                Share one limiter between services, sync or async, to keep
+                them within a single API budget.
+            cache (ResponseCache): Persistent cache consulted before every
+                request. Fresh entries are returned without touching the
+                API and stale ones are revalidated by ETag.
+            hooks (ServiceHooks): Receives an event for every request,
+                cache lookup and JSON decode, e.g. a MetricsCollector.
+            snapshot (SnapshotIndex): Offline index of the bulk company
+                snapshot, consulted before the API for company profiles.
+            raise_on_error (bool): Raise CompaniesHouseError for failed
+                responses other than 404 instead of returning an empty
+                dictionary.
+
+        """
+        self.key = key
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.timeout = timeout
+        self.raise_on_error = raise_on_error
+
+        if api_root is not None:
+            self.api_root = api_root.rstrip("/")
+            self.search_url = self.api_root + "/search/companies?q={}"
+            self.company_url = self.api_root + "/company/{}"
+            self.root_url = self.api_root + "{}"
+
+        if rate_limiter is None:
+            rate_limiter = TokenBucket()
+
+        #: TokenBucket: Limiter shared by every request from this service.
+        self.rate_limiter = rate_limiter
+
+        #: ResponseCache: Cache of previous responses, or None.
+        self.cache = cache
+
+        #: ServiceHooks: Instrumentation hooks, or None.
+        self.hooks = hooks
+
+        #: SnapshotIndex: Offline source of company profiles, or None.
+        self.snapshot = snapshot
+
+        #: deque: The most recent RequestTiming records, oldest first.
+        self.request_timings = collections.deque(maxlen=timing_history)
+
+        #: aiohttp.ClientSession: Created lazily inside the event loop.
+        self.session = None
+        self._semaphore = None
+
+
+    async def __aenter__(self):
+        self._open()
+        return self
+
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+
+    def _open(self):
+        """Create the session and semaphore if they do not exist yet."""
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=self.concurrency)
+
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                auth=aiohttp.BasicAuth(self.key, ''),
+                timeout=aiohttp.ClientTimeout(total=self.timeout))
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+
+    async def close(self):
+        """Close the session and every pooled connection it holds."""
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+            self._semaphore = None
+
+
+    timing_summary = CompaniesHouseService.timing_summary
+
+
+    _retry_delay = CompaniesHouseService._retry_delay
+    _prepare_retry = CompaniesHouseService._prepare_retry
+
+
+    async def _send(self, url, headers = None):
+        """Send a GET request, retrying on 429/5xx, and time it.
+
+        Every retry takes a token from the rate limiter like a new request,
+        and a 429 holds back every request sharing the limiter.
+
+        Args:
+            url (str): The fully formatted url to request.
+            headers (dict): Extra request headers.
+
+        Returns:
+            tuple: The final status code, headers, body text and the number
+                of retries made.
+
+        """
+        self._open()
+        attempt = 0
+
+        while True:
+            attempt += 1
+
+            async with self._semaphore:
+                tic = time.perf_counter()
+
+                try:
+                    async with self.session.get(url,
+                                                headers=headers) as response:
+                        text = await response.text()
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                    if attempt > self.max_retries:
+                        raise
+                    response = None
+                else:
+                    self.request_timings.append(RequestTiming(
+                        url, response.status, time.perf_counter() - tic,
+                        None))
+
+            if response is not None and (
+                    response.status not in self.retry_status_codes
+                    or attempt > self.max_retries):
+                return response.status, response.headers, text, attempt - 1
+
+            if response is None:
+                delay = self._prepare_retry(attempt)
+            else:
+                delay = self._prepare_retry(attempt, response.status,
+                                            response.headers)
+
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            await self.rate_limiter.acquire_async()
+
+
+    async def _query_ch_api(self, url, query):
+        """Sends a request to the Companies House API.
+
+        Args:
+            url (str): The specific url to be queried depending on the type
+                of request (search, profile etc.).
+            query (str): The query parameter to be sent alongside the url.
+
+        Returns:
+            dict: A structured dictionary containing all of the information
+                returned by the API, or an empty dictionary on failure.
+
+        Raises:
+            CompaniesHouseError: For a failure other than 404, if the service
+                was created with ``raise_on_error=True``.
+
+        """
+        url = url.format(query)
+        cache_key = url[len(self.api_root):]
+        cached = None
+        request_headers = None
+        hooks = self.hooks
+        endpoint = endpoint_of(cache_key) if hooks is not None else None
+
+        if self.cache is not None:
+            cached = self.cache.get(cache_key)
+
+            if hooks is not None:
+                hooks.on_cache(endpoint, "miss" if cached is None
+                               else "hit" if cached.fresh else "stale")
+
+            if cached is not None and cached.fresh:
+                return cached.body
+
+            if cached is not None and cached.etag is not None:
+                request_headers = {"If-None-Match": cached.etag}
+
+        throttled = await self.rate_limiter.acquire_async()
+
+        tic = time.perf_counter()
+        status, headers, text, retries = await self._send(url, request_headers)
+
+        if hooks is not None:
+            hooks.on_request(endpoint, url, status, time.perf_counter() - tic,
+                             throttled, retries)
+
+        self.rate_limiter.update_from_headers(headers)
+
+        #200 is the authorised code for RESTful API calls
+        if status == 200:
+            if hooks is None:
+                result = _decode_json(text)
+            else:
+                tic = time.perf_counter()
+                result = _decode_json(text)
+                hooks.on_decode(endpoint, time.perf_counter() - tic)
+
+            if self.cache is not None:
+                self.cache.put(cache_key, result, headers.get("ETag"))
+        #304 means the cached copy is still current
+        elif status == 304 and cached is not None:
+            self.cache.refresh(cache_key)
+            result = cached.body
+
+            if hooks is not None:
+                hooks.on_cache(endpoint, "revalidated")
+        elif status != 404 and self.raise_on_error:
+            raise CompaniesHouseError(url, status)
+        else:
+            result = {}
+
+        return result
+
+
+    _remove_problem_characters = \
+        CompaniesHouseService._remove_problem_characters
+
+
+    async def search_companies(self, company_name, items_per_page = 20):
+        """Search for a company by name.
+
+        Args:
+            company_name (str): The company to search for.
+            items_per_page (int): Maximum number of results to return.
+
+        Returns:
+            list: Search result items, best API match first.
+
+        """
+        query = (self._remove_problem_characters(company_name) +
+                 f"&items_per_page={items_per_page}")
+        search_result = await self._query_ch_api(self.search_url, query)
+
+        return search_result.get("items", [])
+
+
+    async def get_first_company_search(self, company_name):
+        """Search for a company and return the top result.
+
+        Args:
+            company_name (str): The company to search for.
+
+        Returns:
+            dict: The profile of the first result found from the API search,
+                or None if nothing was found.
+
+        """
+        items = await self.search_companies(company_name)
+
+        return items[0] if items else None
+
+
+    async def get_company_profile(self, company_number):
+        """Return a company profile from the company number.
+
+        Args:
+            company_number (str): The unique company number as defined on
+                Companies House.
+
+        Returns:
+            dict: The profile of the corresponding company
+
+        """
+        if self.snapshot is not None:
+            # an indexed lookup takes microseconds, so it is not worth a thread
+            company_profile = self.snapshot.get_profile(company_number)
+
+            if company_profile is not None:
+                if self.hooks is not None:
+                    self.hooks.on_cache("profile", "snapshot")
+
+                return company_profile
+
+        return await self._query_ch_api(self.company_url, company_number)
+
+
+    async def _iter_items(self, path):
+        """Lazily walk every page of a paged API list.
+
+        Args:
+            path (str): API path of the list, e.g. a company's officers link.
+
+        Yields:
+            dict: Each item of the list, in API order.
+
+        """
+        start_index = 0
+
+        while True:
+            page = await self._query_ch_api(self.root_url,
+                                            page_query(path, start_index))
+            items = page.get('items', [])
+
+            for item in items:
+                yield item
+
+            start_index += len(items)
+
+            if last_page(page, items, start_index):
+                break
+
+
+    def iter_officers(self, officers_path):
+        """Yield every officer of a company, fetching pages on demand."""
+        return self._iter_items(officers_path)
+
+
+    async def iter_directors(self, officers_path, limit = None,
+                             active_only = False):
+        """Yield director names, stopping early once ``limit`` are found."""
+        if limit is not None and limit <= 0:
+            return
+
+        found = 0
+
+        async for officer in self.iter_officers(officers_path):
+            if is_director(officer, active_only):
+                yield officer['name']
+
+                found += 1
+                if found == limit:
+                    break
+
+
+    def iter_charges(self, charges_path):
+        """Yield every charge of a company, fetching pages on demand."""
+        return self._iter_items(charges_path)
+
+
+    async def iter_unsatisfied_charges(self, charges_path, limit = None):
+        """Yield unsatisfied charges, stopping early once ``limit`` are found."""
+        if limit is not None and limit <= 0:
+            return
+
+        found = 0
+
+        async for charge in self.iter_charges(charges_path):
+            if charge['status'] != 'fully-satisfied':
+                yield format_charge(charge)
+
+                found += 1
+                if found == limit:
+                    break
+
+
+    async def get_company_directors(self, officers_path, limit = None,
+                                    active_only = False):
+        return [name async for name in
+                self.iter_directors(officers_path, limit, active_only)]
+
+
+    async def get_company_charges(self, charges_path, limit = None):
+        return [charge async for charge in
+                self.iter_unsatisfied_charges(charges_path, limit)]
+
+
+    async def get_company_details(self, company_number, officers = False,
+                                  charges = False):
+        """Fetch a company profile and, concurrently, its officers and charges.
+
+        Args:
+            company_number (str): The unique company number as defined on
+                Companies House.
+            officers (bool): Also fetch the company's directors.
+            charges (bool): Also fetch the company's unsatisfied charges.
+
+        Returns:
+            dict: "profile", plus "directors" and "charges" when requested.
+                Directors and charges are None when the profile has no link
+                to them.
+
+        """
+        profile = await self.get_company_profile(company_number)
+        details = {"profile": profile}
+
+        links = profile.get('links', {})
+        lookups = {}
+
+        if officers:
+            details["directors"] = None
+            if 'officers' in links:
+                lookups["directors"] = self.get_company_directors(
+                    links['officers'])
+
+        if charges:
+            details["charges"] = None
+            if 'charges' in links:
+                lookups["charges"] = self.get_company_charges(
+                    links['charges'])
+
+        results = await asyncio.gather(*lookups.values())
+        details.update(zip(lookups.keys(), results))
+
+        return details
+
+
+    async def iter_company_details(self, company_numbers, officers = False,
+                                   charges = False, return_exceptions = False):
+        """Fetch many companies concurrently, yielding each as it completes.
+
+        A fixed number of workers pull from the input, so memory use does
+        not grow with the number of companies.
+
+        Args:
+            company_numbers (iterable): Company numbers to look up.
+            officers (bool): Also fetch each company's directors.
+            charges (bool): Also fetch each company's unsatisfied charges.
+            return_exceptions (bool): Yield a failed lookup's exception in
+                place of its details and carry on with the others.
+
+        Yields:
+            tuple: The company number and its ``get_company_details`` dict
+                (or exception), in completion order.
+
+        Raises:
+            Exception: Unless ``return_exceptions`` is set, the first error
+                raised by a lookup, e.g. an ``aiohttp.ClientConnectionError``
+                once retries are spent. The remaining lookups are cancelled.
+
+        """
+        pending = iter(company_numbers)
+        results = asyncio.Queue()
+        finished = object()
+        failed = object()
+
+        async def worker():
+            try:
+                for company_number in pending:
+                    try:
+                        details = await self.get_company_details(
+                            company_number, officers, charges)
+                    except Exception as error:
+                        if not return_exceptions:
+                            raise
+                        details = error
+                    results.put_nowait((company_number, details))
+            except Exception as error:
+                results.put_nowait((failed, error))
+            finally:
+                results.put_nowait(finished)                # always, or the consumer waits forever
+
+        workers = [asyncio.ensure_future(worker())
+                   for _ in range(self.concurrency)]
+        running = len(workers)
+
+        try:
+            while running:
+                item = await results.get()
+                if item is finished:
+                    running -= 1
+                elif item[0] is failed:
+                    raise item[1]
+                else:
+                    yield item
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+
+    async def get_many_company_details(self, company_numbers,
+                                       officers = False, charges = False):
+        """Fetch many companies concurrently.
+
+        Args:
+            company_numbers (iterable): Company numbers to look up.
+            officers (bool): Also fetch each company's directors.
+            charges (bool): Also fetch each company's unsatisfied charges.
+
+        Returns:
+            dict: ``get_company_details`` results keyed by company number.
+
+        """
+        return {company_number: details async for company_number, details
+                in self.iter_company_details(company_numbers, officers,
+                                             charges)}
+
+
+if __name__ == "__main__":
+    key = "vLmk-4YxYS-QH8nMi8767zJSlcPlo3MKn41-d" #Fake key - insert your key here
+
+    async def main():
+        async with AsyncCompaniesHouseService(key) as ch_api:
+            tic = time.perf_counter()
+            details = await ch_api.get_many_company_details(
+                ["00445790", "00002065", "02723534"], officers=True)
+            toc = time.perf_counter()
+
+        print(f"Fetched {len(details)} companies in {toc - tic:0.2f} seconds")
+
+    asyncio.run(main())
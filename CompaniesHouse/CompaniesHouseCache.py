@@ -0,0 +1,301 @@
+## Persistent response cache for the Companies House API wrappers ##
+
+import collections
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+#: namedtuple: A cached API response.
+CacheEntry = collections.namedtuple(
+    "CacheEntry", ["body", "etag", "fetched_at", "fresh"])
+
+
+class ResponseCache:
+    """A single-file SQLite cache of Companies House API responses.
+
+    Responses are keyed by their API path, i.e. the endpoint plus the company
+    number (and query string, for searches and paged lists), so overlapping
+    runs only spend rate limit budget on companies that are new or stale.
+
+    Each endpoint has its own time to live. Stale entries are kept along
+    with their ETag so they can be revalidated with a conditional request
+    rather than downloaded again. The store is bounded to ``max_entries``
+    and evicts the least recently used entries, and an optional in-memory
+    LRU tier in front of SQLite serves repeated lookups within a run.
+
+    Lookups do not write to the database: the time each entry was last used
+    is held in memory and written for ``recency_batch`` entries at a time,
+    in a transaction that is committed straight away, so other processes
+    sharing the file are not locked out between writes.
+
+    Attributes:
+        default_ttls (dict): Time to live in seconds for each endpoint.
+        hits (int): Lookups answered with a fresh entry.
+        misses (int): Lookups with no entry at all.
+        stale (int): Lookups which found an expired entry.
+        revalidated (int): Stale entries confirmed unchanged by the API.
+
+    """
+    default_ttls = {"profile": 7 * 24 * 3600,
+                    "officers": 7 * 24 * 3600,
+                    "charges": 7 * 24 * 3600,
+                    "search": 24 * 3600,
+                    "other": 24 * 3600}
+
+
+    def __init__(self, path, ttls = None, max_entries = 1000000,
+                 memory_entries = 0, clock = time.time, recency_batch = 100):
+        """
+        Args:
+            path (str): Location of the SQLite database file. Created if it
+                does not exist.
+            ttls (dict): Overrides for ``default_ttls``, keyed by endpoint.
+            max_entries (int): Maximum number of responses kept on disk.
+            memory_entries (int): Size of the in-memory tier. 0 disables it.
+            clock (callable): Epoch clock used for expiry and recency.
+            recency_batch (int): Entries whose last use is held in memory
+                before it is written to the database.
+
+        """
+        self.path = path
+        self.ttls = dict(self.default_ttls)
+        self.ttls.update(ttls or {})
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.clock = clock
+        self.recency_batch = recency_batch
+
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.revalidated = 0
+
+        self._lock = threading.Lock()
+        self._memory = collections.OrderedDict()
+
+        #: dict: Last use of entries looked up since the last write, by key.
+        self._accessed = {}
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS responses (
+                                key TEXT PRIMARY KEY,
+                                endpoint TEXT NOT NULL,
+                                body TEXT NOT NULL,
+                                etag TEXT,
+                                fetched_at REAL NOT NULL,
+                                accessed_at REAL NOT NULL)""")
+        self._db.execute("""CREATE INDEX IF NOT EXISTS responses_accessed
+                            ON responses (accessed_at)""")
+        self._db.commit()
+
+        #: int: Number of rows in the store, tracked to avoid COUNT(*) scans.
+        self._count = self._db.execute(
+            "SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+    def close(self):
+        """Write outstanding recency updates and close the database."""
+        with self._lock:
+            self._write_recency()
+            self._db.commit()
+            self._db.close()
+
+
+    @staticmethod
+    def endpoint(key):
+        """Classify an API path into the endpoint it belongs to.
+
+        Args:
+            key (str): An API path such as "/company/00445790/officers".
+
+        Returns:
+            str: One of "search", "profile", "officers", "charges" or
+                "other".
+
+        """
+        parts = key.split("?", 1)[0].strip("/").split("/")
+
+        if parts[0] == "search":
+            return "search"
+        if parts[0] == "company" and len(parts) == 2:
+            return "profile"
+        if parts[0] == "company" and len(parts) == 3 and \
+                parts[2] in ("officers", "charges"):
+            return parts[2]
+
+        return "other"
+
+
+    def _write_recency(self):
+        """Write the held last-use times to the database. Caller holds the lock."""
+        if self._accessed:
+            self._db.executemany(
+                "UPDATE responses SET accessed_at = ? WHERE key = ?",
+                [(accessed_at, key) for key, accessed_at
+                 in self._accessed.items()])
+            self._accessed.clear()
+
+
+    def _remember(self, key, row):
+        """Add a row to the in-memory tier. Caller holds the lock."""
+        if self.memory_entries <= 0:
+            return
+
+        self._memory[key] = row
+        self._memory.move_to_end(key)
+
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+
+    def get(self, key):
+        """Look up a cached response.
+
+        Args:
+            key (str): The API path of the request.
+
+        Returns:
+            CacheEntry: The cached response, with ``fresh`` set if it is
+                within its time to live, or None if nothing is cached.
+
+        """
+        now = self.clock()
+
+        with self._lock:
+            row = self._memory.get(key)
+
+            if row is not None:
+                self._memory.move_to_end(key)
+            else:
+                row = self._db.execute(
+                    "SELECT endpoint, body, etag, fetched_at FROM responses "
+                    "WHERE key = ?", (key,)).fetchone()
+
+                if row is None:
+                    self.misses += 1
+                    return None
+
+                row = (row[0], json.loads(row[1]), row[2], row[3])
+                self._remember(key, row)
+
+            self._accessed[key] = now
+
+            if len(self._accessed) >= self.recency_batch:
+                self._write_recency()
+                self._db.commit()
+
+            endpoint, body, etag, fetched_at = row
+            fresh = now - fetched_at < self.ttls[endpoint]
+
+            if fresh:
+                self.hits += 1
+            else:
+                self.stale += 1
+
+        return CacheEntry(body, etag, fetched_at, fresh)
+
+
+    def put(self, key, body, etag = None):
+        """Store a response, evicting the least recently used if full.
+
+        Args:
+            key (str): The API path of the request.
+            body (dict): The decoded response.
+            etag (str): The response's ETag header, if any.
+
+        """
+        now = self.clock()
+        endpoint = self.endpoint(key)
+
+        with self._lock:
+            self._write_recency()
+
+            existing = self._db.execute(
+                "SELECT 1 FROM responses WHERE key = ?", (key,)).fetchone()
+            if existing is None:
+                self._count += 1
+
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses "
+                "(key, endpoint, body, etag, fetched_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, endpoint, json.dumps(body), etag, now, now))
+            self._remember(key, (endpoint, body, etag, now))
+            self._evict()
+            self._db.commit()
+
+
+    def refresh(self, key):
+        """Mark a stale entry as fresh after the API reported it unchanged.
+
+        Args:
+            key (str): The API path of the request.
+
+        """
+        now = self.clock()
+
+        with self._lock:
+            self._write_recency()
+            self._db.execute("UPDATE responses SET fetched_at = ?, "
+                             "accessed_at = ? WHERE key = ?", (now, now, key))
+
+            row = self._memory.get(key)
+            if row is not None:
+                self._memory[key] = row[:3] + (now,)
+
+            self.revalidated += 1
+            self._db.commit()
+
+
+    def _evict(self):
+        """Delete the least recently used entries over the size bound.
+
+        Caller holds the lock.
+
+        """
+        excess = self._count - self.max_entries
+
+        if excess > 0:
+            evicted = self._db.execute(
+                "SELECT key FROM responses ORDER BY accessed_at LIMIT ?",
+                (excess,)).fetchall()
+            self._db.executemany("DELETE FROM responses WHERE key = ?",
+                                 evicted)
+            self._count -= len(evicted)
+
+            for (key,) in evicted:
+                self._memory.pop(key, None)
+
+
+    def stats(self):
+        """Return the hit and miss counters.
+
+        Returns:
+            dict: Counters plus the hit ratio over all lookups, and the
+                number of entries currently stored.
+
+        """
+        lookups = self.hits + self.misses + self.stale
+
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "revalidated": self.revalidated,
+                "hit_ratio": self.hits / lookups if lookups else None,
+                "entries": self._count}
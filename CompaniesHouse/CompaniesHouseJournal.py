@@ -0,0 +1,120 @@
+## Append-only journal which lets long CompaniesHouseRead runs resume after a crash ##
+
+import json
+import os
+
+
+class Journal:
+    """A durable JSON Lines journal of completed company lookups.
+
+    Every completed company is appended as one line and flushed to disk
+    straight away, so a run that is interrupted loses at most the company
+    it was working on. On restart the journal is read back and companies
+    already in it are not fetched again.
+
+    A line that was only half written when the process died is ignored.
+
+    Attributes:
+        path (str): Location of the journal file.
+
+    """
+
+    def __init__(self, path, sync_every = 1):
+        """
+        Args:
+            path (str): Location of the journal file. Created if it does not
+                exist, appended to if it does.
+            sync_every (int): Number of appends between calls to fsync.
+                1 makes every record durable before the next request.
+
+        """
+        self.path = path
+        self.sync_every = sync_every
+
+        #: dict: Records already in the journal, keyed by company number.
+        self.completed = self._load()
+
+        self._file = open(path, "a", encoding="utf-8")
+        self._unsynced = 0
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+    def _load(self):
+        """Read the records from an existing journal.
+
+        Returns:
+            dict: Records keyed by company number. Later lines win.
+
+        """
+        completed = {}
+
+        if not os.path.exists(self.path):
+            return completed
+
+        with open(self.path, "r", encoding="utf-8") as journal_file:
+            for line in journal_file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue # partial line from an interrupted write
+
+                completed[entry["company_number"]] = entry["record"]
+
+        self._terminate_partial_line()
+
+        return completed
+
+
+    def _terminate_partial_line(self):
+        """Make sure the file ends with a newline before appending to it."""
+        with open(self.path, "rb+") as journal_file:
+            journal_file.seek(0, os.SEEK_END)
+
+            if journal_file.tell() == 0:
+                return
+
+            journal_file.seek(-1, os.SEEK_END)
+
+            if journal_file.read(1) != b"\n":
+                journal_file.write(b"\n")
+
+
+    def __contains__(self, company_number):
+        return company_number in self.completed
+
+
+    def append(self, company_number, record):
+        """Record a completed company.
+
+        Args:
+            company_number (str): The company looked up.
+            record (dict): The output columns for that company.
+
+        """
+        line = json.dumps({"company_number": company_number,
+                           "record": record})
+
+        self._file.write(line + "\n")
+        self._file.flush()
+
+        self._unsynced += 1
+        if self._unsynced >= self.sync_every:
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+
+        self.completed[company_number] = record
+
+
+    def close(self):
+        """Flush and close the journal file."""
+        if not self._file.closed:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
@@ -0,0 +1,237 @@
+## Instrumentation hooks for the Companies House services, with Prometheus and JSON export ##
+
+import bisect
+import collections
+import json
+import threading
+
+from CompaniesHouseCache import ResponseCache
+
+
+#: tuple: Upper bounds in seconds of the request latency histogram buckets.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+#: callable: Classifies an API path as "search", "profile", "officers", "charges" or "other".
+endpoint_of = ResponseCache.endpoint
+
+
+class ServiceHooks:
+    """Receives events from CompaniesHouseService and AsyncCompaniesHouseService.
+
+    Subclass this and override the events you need, then pass an instance as
+    the service's ``hooks`` argument. Services built without hooks skip the
+    extra timing and classification work entirely.
+
+    Hooks are called from whichever thread or task made the request, so
+    implementations shared between threads must do their own locking.
+
+    """
+
+    def on_request(self, endpoint, url, status_code, wire_seconds,
+                   throttle_seconds, retries):
+        """Called once for every request sent to the API.
+
+        Args:
+            endpoint (str): "search", "profile", "officers", "charges" or
+                "other".
+            url (str): The url requested.
+            status_code (int): Status of the final response.
+            wire_seconds (float): Time from sending the request to receiving
+                the final response, including any transport-level retries.
+            throttle_seconds (float): Time spent waiting on the rate limiter
+                before the request was sent.
+            retries (int): Number of retries before the final response.
+
+        """
+
+
+    def on_cache(self, endpoint, outcome):
+        """Called when the response cache is consulted.
+
+        Args:
+            endpoint (str): The endpoint of the request.
+            outcome (str): "hit" (fresh entry, no request sent), "stale"
+                (entry revalidated with the API), "revalidated" (the API
+                answered 304 to a stale entry), "miss", or "snapshot" (a
+                profile answered by the offline snapshot index).
+
+        """
+
+
+    def on_decode(self, endpoint, seconds):
+        """Called after a response body has been decoded from JSON."""
+
+
+class Histogram:
+    """A cumulative histogram with fixed bucket bounds, as Prometheus uses."""
+
+    def __init__(self, buckets = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)                     # last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+
+    def cumulative(self):
+        """Return (upper bound, observations at or below it) pairs, ending with +Inf."""
+        bounds = [str(bound) for bound in self.buckets] + ["+Inf"]
+
+        return list(zip(bounds, _running_total(self.counts)))
+
+
+def _running_total(values):
+    total = 0
+
+    for value in values:
+        total += value
+        yield total
+
+
+class MetricsCollector(ServiceHooks):
+    """Hooks which aggregate service events into metrics.
+
+    Collects, per endpoint: a request latency histogram, request counts by
+    status code, time on the wire, time throttled by the rate limiter,
+    retries, JSON decode time and cache outcomes. The most recent failed
+    requests are kept too, so a run whose lookups come back empty can be
+    explained afterwards.
+
+    Attributes:
+        failures (deque): (url, status code) of the most recent requests
+            which did not return 200 or 304.
+
+    """
+
+    def __init__(self, buckets = LATENCY_BUCKETS, failure_history = 100):
+        """
+        Args:
+            buckets (tuple): Latency histogram bucket bounds in seconds.
+            failure_history (int): Number of failed requests to remember.
+
+        """
+        self.buckets = buckets
+        self.latency = {}
+        self.statuses = collections.Counter()
+        self.wire_seconds = collections.Counter()
+        self.throttle_seconds = collections.Counter()
+        self.retries = collections.Counter()
+        self.decode_seconds = collections.Counter()
+        self.cache = collections.Counter()
+        self.failures = collections.deque(maxlen=failure_history)
+
+        self._lock = threading.Lock()
+
+
+    def on_request(self, endpoint, url, status_code, wire_seconds,
+                   throttle_seconds, retries):
+        with self._lock:
+            if endpoint not in self.latency:
+                self.latency[endpoint] = Histogram(self.buckets)
+
+            self.latency[endpoint].observe(wire_seconds)
+            self.statuses[endpoint, status_code] += 1
+            self.wire_seconds[endpoint] += wire_seconds
+            self.throttle_seconds[endpoint] += throttle_seconds
+            self.retries[endpoint] += retries
+
+            if status_code not in (200, 304):
+                self.failures.append((url, status_code))
+
+
+    def on_cache(self, endpoint, outcome):
+        with self._lock:
+            self.cache[endpoint, outcome] += 1
+
+
+    def on_decode(self, endpoint, seconds):
+        with self._lock:
+            self.decode_seconds[endpoint] += seconds
+
+
+    def cache_hit_ratio(self):
+        """Return the share of cache lookups answered without a full response, or None."""
+        lookups = sum(count for (endpoint, outcome), count in self.cache.items()
+                      if outcome in ("hit", "stale", "miss", "snapshot"))
+        hits = sum(count for (endpoint, outcome), count in self.cache.items()
+                   if outcome in ("hit", "revalidated", "snapshot"))
+
+        return hits / lookups if lookups else None
+
+
+    def to_dict(self):
+        """Return every metric as a JSON-serialisable dict keyed by endpoint."""
+        with self._lock:
+            endpoints = sorted(set(self.latency) | {endpoint for endpoint, outcome in self.cache})
+            report = {}
+
+            for endpoint in endpoints:
+                histogram = self.latency.get(endpoint) or Histogram(self.buckets)
+
+                report[endpoint] = {
+                    "requests": histogram.count,
+                    "status_codes": {str(status): count for (name, status), count
+                                     in sorted(self.statuses.items()) if name == endpoint},
+                    "wire_seconds": round(self.wire_seconds[endpoint], 6),
+                    "throttle_seconds": round(self.throttle_seconds[endpoint], 6),
+                    "decode_seconds": round(self.decode_seconds[endpoint], 6),
+                    "retries": self.retries[endpoint],
+                    "latency_buckets": dict(histogram.cumulative()),
+                    "cache": {outcome: count for (name, outcome), count
+                              in sorted(self.cache.items()) if name == endpoint}}
+
+            return {"endpoints": report,
+                    "cache_hit_ratio": self.cache_hit_ratio(),
+                    "recent_failures": [list(failure) for failure in self.failures]}
+
+
+    def to_prometheus(self, prefix = "companies_house"):
+        """Return every metric in the Prometheus text exposition format."""
+        lines = []
+
+        def family(name, kind, description):
+            lines.append(f"# HELP {prefix}_{name} {description}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+
+        with self._lock:
+            family("request_duration_seconds", "histogram", "Time on the wire per request, including retries.")
+            for endpoint, histogram in sorted(self.latency.items()):
+                for bound, count in histogram.cumulative():
+                    lines.append(f'{prefix}_request_duration_seconds_bucket{{endpoint="{endpoint}",le="{bound}"}} {count}')
+                lines.append(f'{prefix}_request_duration_seconds_sum{{endpoint="{endpoint}"}} {histogram.sum}')
+                lines.append(f'{prefix}_request_duration_seconds_count{{endpoint="{endpoint}"}} {histogram.count}')
+
+            family("requests_total", "counter", "Requests by final status code.")
+            for (endpoint, status), count in sorted(self.statuses.items()):
+                lines.append(f'{prefix}_requests_total{{endpoint="{endpoint}",status="{status}"}} {count}')
+
+            counters = (("throttle_seconds_total", self.throttle_seconds, "Time spent waiting on the rate limiter."),
+                        ("decode_seconds_total", self.decode_seconds, "Time spent decoding JSON responses."),
+                        ("retries_total", self.retries, "Requests retried after a 429/5xx or connection error."))
+
+            for name, values, description in counters:
+                family(name, "counter", description)
+                for endpoint, value in sorted(values.items()):
+                    lines.append(f'{prefix}_{name}{{endpoint="{endpoint}"}} {value}')
+
+            family("cache_lookups_total", "counter", "Response cache lookups by outcome.")
+            for (endpoint, outcome), count in sorted(self.cache.items()):
+                lines.append(f'{prefix}_cache_lookups_total{{endpoint="{endpoint}",outcome="{outcome}"}} {count}')
+
+        return "\n".join(lines) + "\n"
+
+
+    def dump(self, path):
+        """Write the metrics to path: Prometheus text for .prom/.txt, JSON otherwise."""
+        if path.lower().endswith((".prom", ".txt")):
+            text = self.to_prometheus()
+        else:
+            text = json.dumps(self.to_dict(), indent=2)
+
+        with open(path, "w", encoding="utf-8") as metrics_file:
+            metrics_file.write(text)
@@ -0,0 +1,324 @@
+## Resolves lists of company names (e.g. CoTExtractor tenants and guarantors) to company numbers ##
+
+import collections
+import re
+import unicodedata
+
+
+#: namedtuple: A candidate company for a name, with a similarity score.
+NameMatch = collections.namedtuple(
+    "NameMatch", ["company_number", "company_name", "company_status", "score"])
+
+#: list: Legal suffixes and common words, mapped to one canonical spelling.
+_CANONICAL_WORDS = [(r"\bpublic limited company\b", "plc"),
+                    (r"\blimited liability partnership\b", "llp"),
+                    (r"\blimited\b", "ltd"),
+                    (r"\bcompany\b", "co"),
+                    (r"\bcorporation\b", "corp"),
+                    (r"\bincorporated\b", "inc"),
+                    (r"\bp\s?l\s?c\b", "plc"),
+                    (r"\bl\s?l\s?p\b", "llp"),
+                    (r"&", " and ")]
+
+_CANONICAL_PATTERNS = [(re.compile(pattern), replacement)
+                       for pattern, replacement in _CANONICAL_WORDS]
+_LEGAL_SUFFIX = re.compile(r"( (ltd|plc|llp|lp|co|corp|inc))+$")
+_NUMBER = re.compile(r"\w*\d\w*")
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalise_company_name(name):
+    """Reduce a company name to a canonical form for matching.
+
+    Case, accents, punctuation and spacing are ignored, "&" is read as
+    "and", and legal suffixes are spelt one way, so "Acme Holdings Limited"
+    and "ACME HOLDINGS LTD." normalise to the same string.
+
+    Args:
+        name (str): The company name as written.
+
+    Returns:
+        str: The normalised name.
+
+    """
+    name = unicodedata.normalize("NFKD", str(name))
+    name = name.encode("ascii", "ignore").decode("ascii").lower()
+    name = name.replace(".", "")
+
+    for pattern, replacement in _CANONICAL_PATTERNS:
+        name = pattern.sub(replacement, name)
+
+    name = _PUNCTUATION.sub(" ", name)
+
+    return _WHITESPACE.sub(" ", name).strip()
+
+
+def trigrams(normalised_name):
+    """Return the character trigrams of a normalised name, legal suffix included."""
+    padded = "  " + normalised_name + " "
+
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def distinguishing_parts(normalised_name):
+    """Return the parts of a name that tell otherwise similar companies apart.
+
+    Returns:
+        tuple: (the set of words containing digits, e.g. {"2"} for "Acme
+            (No. 2) Ltd", and the trailing legal suffix or "").
+
+    """
+    suffix = _LEGAL_SUFFIX.search(" " + normalised_name)
+
+    return (frozenset(_NUMBER.findall(normalised_name)),
+            suffix.group(0).strip() if suffix else "")
+
+
+#: float: Highest score given to names whose numbers or legal suffixes differ.
+MISMATCH_SCORE_CAP = 0.75
+
+
+def similarity(query_grams, query_parts, grams, parts, common):
+    """Return the Dice coefficient of two trigram sets, capped if the names' numbers or suffixes differ.
+
+    A suffix only counts as different when both names have one, so "Acme
+    Holdings" can still score highly against "ACME HOLDINGS LTD".
+
+    """
+    score = 2 * common / (len(query_grams) + len(grams))
+
+    numbers_differ = query_parts[0] != parts[0]
+    suffixes_differ = query_parts[1] and parts[1] and query_parts[1] != parts[1]
+
+    if numbers_differ or suffixes_differ:
+        score = min(score, MISMATCH_SCORE_CAP)
+
+    return score
+
+
+class TrigramIndex:
+    """An inverted trigram index of candidate company names.
+
+    Looking a name up only scores candidates that share at least one
+    trigram with it, so the index stays fast as it grows to many thousands
+    of companies. Scores are the Dice coefficient of the two trigram sets,
+    between 0 (nothing in common) and 1 (identical normalised names), capped
+    at ``MISMATCH_SCORE_CAP`` when the names carry different numbers or
+    legal suffixes, e.g. "(No. 2) Ltd" and "(No. 3) Ltd".
+
+    """
+
+    def __init__(self):
+        self._postings = collections.defaultdict(set)
+        self._trigrams = {}
+        self._parts = {}
+
+        #: dict: Company numbers of the candidates, keyed by normalised name.
+        self.by_name = collections.defaultdict(list)
+
+        #: dict: Candidate search items, keyed by company number.
+        self.candidates = {}
+
+
+    def __len__(self):
+        return len(self.candidates)
+
+
+    def add(self, item):
+        """Add a company search result item to the index.
+
+        Args:
+            item (dict): A search item with "company_number" and "title".
+
+        """
+        company_number = item["company_number"]
+
+        if company_number in self.candidates:
+            return
+
+        normalised = normalise_company_name(item["title"])
+        grams = trigrams(normalised)
+
+        self.candidates[company_number] = item
+        self._trigrams[company_number] = grams
+        self._parts[company_number] = distinguishing_parts(normalised)
+        self.by_name[normalised].append(company_number)
+
+        for gram in grams:
+            self._postings[gram].add(company_number)
+
+
+    def search(self, normalised_name, limit = 5):
+        """Return the best scoring candidates for a normalised name.
+
+        Args:
+            normalised_name (str): Output of ``normalise_company_name``.
+            limit (int): Maximum number of matches to return.
+
+        Returns:
+            list: NameMatch tuples, best first. Active companies win ties.
+
+        """
+        grams = trigrams(normalised_name)
+        parts = distinguishing_parts(normalised_name)
+        shared = collections.Counter()
+
+        for gram in grams:
+            for company_number in self._postings.get(gram, ()):
+                shared[company_number] += 1
+
+        matches = []
+
+        for company_number, common in shared.items():
+            score = similarity(grams, parts, self._trigrams[company_number],
+                               self._parts[company_number], common)
+            item = self.candidates[company_number]
+
+            matches.append(NameMatch(company_number, item["title"],
+                                     item.get("company_status"), score))
+
+        matches.sort(key=lambda match: (-match.score,
+                                        match.company_status != "active"))
+
+        return matches[:limit]
+
+
+class NameResolver:
+    """Resolves many company names to ranked, scored company numbers.
+
+    Names are normalised and de-duplicated before anything is sent to the
+    API. Every search result is added to a shared trigram index, and a name
+    is only searched for when the index does not already hold a company with
+    exactly the same normalised name, so related names (e.g. a tenant and
+    its guarantor group) and repeated runs cost as few API calls as
+    possible without a near miss ever standing in for a search.
+
+    Attributes:
+        service (CompaniesHouseService): Used for the searches.
+        index (TrigramIndex): Every candidate seen so far.
+        resolved (dict): Matches already found, keyed by normalised name.
+            Only names settled by a search that returned results (or by a
+            candidate of exactly the same name) are kept, so a failed
+            search is retried on the next call.
+        failed (dict): The error raised by the last search for each name
+            that ``resolve`` could not settle, keyed by normalised name.
+        searches (int): Number of API searches made.
+
+    """
+
+    def __init__(self, service, items_per_page = 20):
+        """
+        Args:
+            service (CompaniesHouseService): Used for the searches.
+            items_per_page (int): Results requested per search. More results
+                fill the index faster at no extra rate limit cost.
+
+        """
+        self.service = service
+        self.items_per_page = items_per_page
+
+        self.index = TrigramIndex()
+        self.resolved = {}
+        self.failed = {}
+        self.searches = 0
+
+
+    def resolve_one(self, name, limit = 5):
+        """Resolve a single company name.
+
+        Args:
+            name (str): The company name as written.
+            limit (int): Maximum number of matches to return.
+
+        Returns:
+            list: NameMatch tuples, best first. Empty if nothing matched.
+
+        Raises:
+            CompaniesHouseError: If the search fails and the service was
+                created with ``raise_on_error=True``.
+
+        """
+        normalised = normalise_company_name(name)
+
+        if not normalised:
+            return []
+
+        if normalised in self.resolved:
+            return self.resolved[normalised][:limit]
+
+        settled = normalised in self.index.by_name
+
+        if not settled:                                                         # a near miss may be a different company
+            items = self.service.search_companies(name, self.items_per_page)
+            self.searches += 1
+
+            for item in items:
+                self.index.add(item)
+
+            settled = bool(items)                                               # no items may also mean the request failed
+
+        matches = self.index.search(normalised, max(limit, self.items_per_page))
+
+        if settled:
+            self.resolved[normalised] = matches
+            self.failed.pop(normalised, None)
+
+        return matches[:limit]
+
+
+    def resolve(self, names, limit = 5):
+        """Resolve a batch of company names.
+
+        Args:
+            names (iterable): Company names as written. Blanks and repeats
+                are allowed.
+            limit (int): Maximum number of matches per name.
+
+        Returns:
+            dict: Lists of NameMatch tuples, best first, keyed by the names
+                as given. A name whose search raised an error gets an empty
+                list, and the error is kept in ``failed``.
+
+        """
+        unique = {}
+
+        for name in names:
+            if name not in unique:
+                unique[name] = normalise_company_name(name)
+
+        queries = {}
+
+        for name, normalised in unique.items():
+            queries.setdefault(normalised, name)
+
+        found = {}
+
+        for normalised, name in queries.items():
+            try:
+                found[normalised] = self.resolve_one(name, limit)
+            except Exception as error:                                          # e.g. a 503 with raise_on_error: the rest carry on
+                self.failed[normalised] = error
+                found[normalised] = []
+
+        return {name: found.get(normalised, [])[:limit]
+                for name, normalised in unique.items()}
+
+
+    def best_matches(self, names, min_score = 0.0):
+        """Return the top match for each name.
+
+        Args:
+            names (iterable): Company names as written.
+            min_score (float): Matches scoring less than this are dropped.
+
+        Returns:
+            dict: The best NameMatch, or None, keyed by the names as given.
+
+        """
+        best = {}
+
+        for name, matches in self.resolve(names, limit=1).items():
+            best[name] = matches[0] if matches and matches[0].score >= min_score else None
+
+        return best
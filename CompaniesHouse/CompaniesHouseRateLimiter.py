@@ -0,0 +1,213 @@
+## Rate limiters shared by the Companies House API wrappers ##
+
+import asyncio
+import threading
+import time
+
+
+class TokenBucket:
+    """A monotonic-clock token bucket matching the Companies House quota.
+
+    The API allows 600 requests in any 5 minute window, so the bucket holds
+    up to 600 tokens and refills at 2 tokens per second. A full bucket can
+    be spent in one burst, after which callers are paced at the refill rate.
+
+    Tokens are reserved under a lock and the caller sleeps outside of it, so
+    one bucket can be shared by several threads, several asyncio tasks, or a
+    mixture of both, and waiting callers are served in arrival order.
+
+    Attributes:
+        capacity (float): Maximum number of tokens the bucket can hold.
+        period (float): Seconds taken to refill an empty bucket.
+
+    """
+
+    def __init__(self, capacity = 600, period = 300, clock = time.monotonic,
+                 sleep = time.sleep, wall_clock = time.time, api_window = 300):
+        """
+        Args:
+            capacity (float): Requests allowed per window.
+            period (float): Length of the window in seconds.
+            clock (callable): Monotonic clock returning seconds. Can be
+                replaced with a fake clock for testing and benchmarking.
+            sleep (callable): Blocking sleep used by ``acquire``.
+            wall_clock (callable): Epoch clock used to interpret the
+                "X-Ratelimit-Reset" header.
+            api_window (float): Length in seconds of the API's rate limit
+                window, which "X-Ratelimit-Limit" is counted over.
+
+        """
+        self.capacity = float(capacity)
+        self.period = float(period)
+        self.clock = clock
+        self.sleep = sleep
+        self.wall_clock = wall_clock
+        self.api_window = float(api_window)
+
+        self._lock = threading.Lock()
+        self._tokens = self.capacity
+        self._last_refill = clock()
+
+        #: float: Monotonic time before which no request may be sent.
+        self._blocked_until = None
+
+
+    @property
+    def rate(self):
+        """float: Tokens added to the bucket per second."""
+        if self.period <= 0:
+            return float("inf")
+
+        return self.capacity / self.period
+
+
+    def _refill(self, now):
+        """Add the tokens earned since the last refill. Caller holds the lock."""
+        elapsed = now - self._last_refill
+
+        if elapsed > 0:
+            self._tokens = min(self.capacity,
+                               self._tokens + elapsed * self.rate)
+            self._last_refill = now
+
+
+    def reserve(self, tokens = 1):
+        """Take tokens from the bucket and return how long to wait for them.
+
+        The bucket is allowed to go into debt, which is what queues callers
+        behind each other: the n-th caller past an empty bucket is told to
+        wait n / rate seconds.
+
+        Args:
+            tokens (float): Number of tokens to take.
+
+        Returns:
+            float: Seconds the caller must wait before sending its request.
+
+        """
+        with self._lock:
+            now = self.clock()
+            self._refill(now)
+            self._tokens -= tokens
+
+            wait_time = max(-self._tokens / self.rate, 0)
+
+            if self._blocked_until is not None:
+                wait_time = max(wait_time, self._blocked_until - now)
+
+        return wait_time
+
+
+    def acquire(self, tokens = 1):
+        """Block until the tokens are available.
+
+        Args:
+            tokens (float): Number of tokens to take.
+
+        Returns:
+            float: Seconds spent waiting.
+
+        """
+        wait_time = self.reserve(tokens)
+
+        if wait_time > 0:
+            self.sleep(wait_time)
+
+        return wait_time
+
+
+    async def acquire_async(self, tokens = 1):
+        """Wait without blocking the event loop until the tokens are available.
+
+        Args:
+            tokens (float): Number of tokens to take.
+
+        Returns:
+            float: Seconds spent waiting.
+
+        """
+        wait_time = self.reserve(tokens)
+
+        if wait_time > 0:
+            await asyncio.sleep(wait_time)
+
+        return wait_time
+
+
+    def block_for(self, seconds):
+        """Hold back every caller for a number of seconds, e.g. after a 429.
+
+        Args:
+            seconds (float): Seconds from now before the next request may be
+                sent. An existing longer block is kept.
+
+        """
+        with self._lock:
+            until = self.clock() + max(seconds, 0)
+
+            if self._blocked_until is None or until > self._blocked_until:
+                self._blocked_until = until
+
+
+    def update_from_headers(self, headers):
+        """Adapt the bucket to the rate limit headers returned by the API.
+
+        Companies House reports the quota in "X-Ratelimit-Limit", the
+        requests left in the current window in "X-Ratelimit-Remain" and the
+        epoch second the window resets at in "X-Ratelimit-Reset". The bucket
+        never holds more tokens than the API says remain, and when the API
+        says none remain every caller waits for the reset. A "Retry-After"
+        header, sent with a 429, also holds every caller back.
+
+        The limit is counted over the API's window, so it is only adopted
+        together with that window: a bucket already using the API window
+        follows the API's limit, and any other bucket switches to the API's
+        limit and window only if that is slower than its own rate. A rate
+        the caller configured is never raised.
+
+        Args:
+            headers (Mapping): Response headers. Missing or malformed rate
+                limit headers are ignored.
+
+        """
+        limit = _header_number(headers, "X-Ratelimit-Limit")
+        remain = _header_number(headers, "X-Ratelimit-Remain")
+        reset = _header_number(headers, "X-Ratelimit-Reset")
+        retry_after = _header_number(headers, "Retry-After")
+
+        with self._lock:
+            now = self.clock()
+            self._refill(now)
+
+            if limit is not None and limit > 0 and (
+                    self.period == self.api_window
+                    or limit / self.api_window < self.rate):
+                self.capacity = limit
+                self.period = self.api_window
+                self._tokens = min(self._tokens, self.capacity)
+
+            if remain is not None:
+                self._tokens = min(self._tokens, remain)
+
+                if remain <= 0 and reset is not None:
+                    self._blocked_until = now + max(reset - self.wall_clock(),
+                                                    0)
+                else:
+                    self._blocked_until = None
+
+            if retry_after is not None and retry_after > 0:
+                self._blocked_until = max(self._blocked_until or now,
+                                          now + retry_after)
+
+
+def _header_number(headers, name):
+    """Return a numeric header value, or None if it is missing or malformed."""
+    value = headers.get(name)
+
+    if value is None:
+        return None
+
+    try:
+        return float(value)
+    except ValueError:
+        return None
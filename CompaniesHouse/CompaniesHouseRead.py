@@ -1,173 +1,299 @@
 ## This application allows us to fetch company names from Companies House API by inputting company numbers ##
-
-from CompaniesHouseService import CompaniesHouseService                         # class required to open API connection
-import pandas as pd                                                             # Pandas allows us to open and save .csv/.xlsx
-from math import isnan                                                          #
+##
+## Headless:     python CompaniesHouseRead.py input.xlsx -o output.xlsx --officers --charges
+## Interactive:  python CompaniesHouseRead.py --interactive
+##
+## The API key is read from the COMPANIES_HOUSE_API_KEY environment variable (or a local CompaniesHouseKey.py).
+
+import argparse
+import asyncio
+import json
+import os
+import sys
 import time
-import tkinter as tk                                                            #
-from tkinter import filedialog                                                  # allows us to open file explorer
-from urllib.error import HTTPError                                              # enables HTTP error handling
-import pprint
-from CompaniesHouseKey import api_key
-
-# Flags for fetching supplemental data
-getOfficers = False
-getCharges = False
-getInsolvency = True
-
-print("Hello! \nThis program allows you to input a CSV/Excel file with Companies House company numbers and returns a file with the corresponding company names.\
-\nSelect a file once with file explorer window opens. Please ensure the file has a column titled 'Company Number'.")
- 
-root = tk.Tk()
-root.withdraw()
-companyIDs = filedialog.askopenfilename()  
 
-print("\nFile selected: " + companyIDs)                                         
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from spreadsheetIO import read_table, write_table                               # fast .csv/.xlsx/.parquet reading and writing
+from CompaniesHouseService import CompaniesHouseService, CompaniesHouseError    # class required to open API connection
+from CompaniesHouseRateLimiter import TokenBucket                               # shared request budget
+from CompaniesHouseJournal import Journal                                       # durable record of completed companies
+from CompaniesHouseResults import compact_record, results_frame, merge_results  # batch formatting of output columns
 
-# condition for when input file is .csv
-if companyIDs[(len(companyIDs) - 4) : (len(companyIDs))] == ".csv": 
-    df = pd.read_csv(companyIDs, skiprows = 0, dtype = {'Company Number': str, 'Company Name': str})
+KEY_ENVIRONMENT_VARIABLE = "COMPANIES_HOUSE_API_KEY"
 
-# condition for when input file is .xlsx
-elif companyIDs[(len(companyIDs) - 5) : (len(companyIDs))] == ".xlsx": 
-    df = pd.read_excel(companyIDs, skiprows = 0, dtype = {'Company Number': str, 'Company Name': str})
 
-df.index.name = 'Index'                                                         # Name index column for dataframe
+def required_fields(officers, charges, insolvency):
+    """Return the record fields needed for the requested enrichment."""
+    fields = set()
 
-companyHouseAPI = CompaniesHouseService(api_key)                                # create instance of wrapper class
+    if officers:
+        fields.add("directors")
+    if charges:
+        fields.add("charges")
+    if insolvency:
+        fields.add("insolvency")
 
-print('\nFetching company information...')
+    return fields
 
 
-# get company name from CH API
-for index, row in df.iterrows():
-    # for tracking progress
-    percentage_complete = int(((index+1) * 100)/len(df.index))
+def is_complete(record, fields):
+    """Return whether a journaled record has all of the required fields."""
+    if record is None:
+        return False
 
-    company_number = str(row["Company Number"])                                 # get company number from panda dataframe
+    return not record["found"] or fields.issubset(record)
 
-    if company_number == "nan":                                                 # skip empty rows
-        print("\n" + str(index+1) + "/" + str(len(df.index)) + " (" + str(percentage_complete) + "%): [No Result]")
-        continue
 
-    company_profile = companyHouseAPI.get_company_profile(company_number)       # get company profile, returned as JSON file
+def enrich_company(api, company_number, officers = False, charges = False, insolvency = False):
+    """Fetch one company and return its compact record."""
+    company_profile = api.get_company_profile(company_number)                   # get company profile, returned as JSON file
 
     if company_profile == {}:                                                   # if error code 404 is returned, profile will be empty
-        df.at[index, "Company Name"] = "[No Result]"
-        df.at[index, "Jurisdiction"] = "[No Result]"
-        df.at[index, "Type"] = "[No Result]"
-        df.at[index, "Registered Office Address"] = "[No Result]"
-        print("\n" + str(index+1) + "/" + str(len(df.index)) + " (" + str(percentage_complete) + "%): " + company_number + " | [No Result]")
-        continue
-
-    else:
-        df.at[index, "Company Name"] = str(company_profile['company_name'])                 # get company name from JSON data
-        df.at[index, "Jurisdiction"] = str(company_profile['jurisdiction']).title()         # get jurisdiction 
-        df.at[index, "Type"] = str(company_profile['type']).upper()                         # get company type
-
-        # The below chunk of code fetches address
-        df.at[index, "Registered Office Address"] = ""
-        
-        if 'address_line_1' in company_profile['registered_office_address']:
-            df.at[index, "Registered Office Address"] += str(company_profile['registered_office_address']['address_line_1'])
-        if 'address_line_2' in company_profile['registered_office_address']:
-           df.at[index, "Registered Office Address"] += ", " + str(company_profile['registered_office_address']['address_line_2'])
-        if 'locality' in company_profile['registered_office_address']:
-           df.at[index, "Registered Office Address"] += ", " + str(company_profile['registered_office_address']['locality'])
-        if 'region' in company_profile['registered_office_address']:
-           df.at[index, "Registered Office Address"] += ", " + str(company_profile['registered_office_address']['region'])
-        if 'postal_code' in company_profile['registered_office_address']:
-           df.at[index, "Registered Office Address"] += ", " + str(company_profile['registered_office_address']['postal_code'])
-        if 'country' in company_profile['registered_office_address']:
-           df.at[index, "Registered Office Address"] += ", " + str(company_profile['registered_office_address']['country'])
+        return compact_record(company_profile)
 
+    links = company_profile['links']
+    directors = None
+    company_charges = None
 
     ## get officer information
-    if getOfficers == True:
-        if ('officers' not in company_profile['links']):
-            df.at[index, "Directors"] = "[No Directors]"
-            print("\n" + str(index+1) + "/" + str(len(df.index)) + " (" + str(percentage_complete) + "%): " + company_number + " | " + str(company_profile['company_name']))
-            continue
+    if officers and 'officers' in links:
+        directors = api.get_company_directors(str(links['officers']))          # get company directors
 
-        else:
-            officers_path = str(company_profile['links']['officers']) # URL to company officers
-    
-            directors = companyHouseAPI.get_company_directors(officers_path) # get company directors
+    ## get charge information
+    if charges and 'charges' in links:
+        company_charges = api.get_company_charges(str(links['charges']))       # get unsatisfied charges
 
-            director_index = 0
-            directors_string = ""
+    return compact_record(company_profile, directors, company_charges, insolvency)
 
-            # Create a long string full of the directors names
-            while director_index < len(directors):
-                directors_string += directors[director_index] + " | "
-                director_index = director_index + 1
 
-            df.at[index, "Directors"] = directors_string
+def emit(event, **fields):
+    """Write one machine-readable progress line to stderr."""
+    fields["event"] = event
+    sys.stderr.write(json.dumps(fields) + "\n")
+    sys.stderr.flush()
 
-            print("Company Number: " + df.at[index, 'Company Number'] + " | Company Name: " + df.at[index, 'Company Name'])
 
-    ## get charge information
-    if getCharges == True:
-        if ('charges' not in company_profile['links']):
-            df.at[index, "Charges"] = "[No Charges]"
-            print("\n" + str(index+1) + "/" + str(len(df.index)) + " (" + str(percentage_complete) + "%): " + company_number + " | " + str(company_profile['company_name']))
+def load_api_key():
+    """Return the API key from the environment, falling back to CompaniesHouseKey.py."""
+    key = os.environ.get(KEY_ENVIRONMENT_VARIABLE)
+
+    if key:
+        return key
+
+    try:
+        from CompaniesHouseKey import api_key
+    except ImportError:
+        sys.exit("No API key: set " + KEY_ENVIRONMENT_VARIABLE + " or create CompaniesHouseKey.py")
+
+    return api_key
+
+
+def read_input(path):
+    """Read the input spreadsheet, keeping company numbers as strings."""
+    try:
+        df = read_table(path, text_columns = ['Company Number', 'Company Name'])
+    except ValueError as error:
+        sys.exit("Input must be a .csv, .xlsx or .parquet file: " + str(error))
+
+    df.index.name = 'Index'                                                     # Name index column for dataframe
+
+    return df
+
+
+def write_output(df, path):
+    """Write the enriched rows as .csv, .xlsx or .parquet depending on the extension."""
+    try:
+        write_table(df, path)
+    except ValueError as error:
+        sys.exit("Output must be a .csv, .xlsx or .parquet file: " + str(error))
+
+
+def run_sequential(api, pending, journal, args, report, report_failure):
+    """Fetch the pending companies one at a time."""
+    for company_number in pending:
+        try:
+            record = enrich_company(api, company_number, args.officers, args.charges, args.insolvency)
+        except (CompaniesHouseError, requests.RequestException) as error:     # 429/5xx after retries, timeouts: try again next run
+            report_failure(company_number, error)
             continue
 
-        else:
-            charges_path = str(company_profile['links']['charges']) # URL to company charges
+        journal.append(company_number, record)                                  # write to disk before moving on
+        report(company_number, record)
+
+
+async def run_concurrent(key, pending, journal, args, limiter, cache, hooks, snapshot, report, report_failure):
+    """Fetch the pending companies concurrently with the async client."""
+    import aiohttp
+    from AsyncCompaniesHouseService import AsyncCompaniesHouseService
+
+    async with AsyncCompaniesHouseService(key, concurrency = args.concurrency, rate_limiter = limiter,
+                                          cache = cache, api_root = args.api_root, hooks = hooks,
+                                          snapshot = snapshot, raise_on_error = True) as api:
+        async for company_number, details in api.iter_company_details(pending, args.officers, args.charges,
+                                                                      return_exceptions = True):
+            if isinstance(details, (CompaniesHouseError, aiohttp.ClientError, asyncio.TimeoutError)):
+                report_failure(company_number, details)                         # left out of the journal so it is retried
+                continue
+            elif isinstance(details, Exception):
+                raise details
+
+            record = compact_record(details["profile"], details.get("directors"),
+                                    details.get("charges"), args.insolvency)
+
+            journal.append(company_number, record)                              # write to disk before moving on
+            report(company_number, record)
+
+
+def parse_args(argv = None):
+    parser = argparse.ArgumentParser(
+        description = "Add Companies House details to a CSV/Excel file with a 'Company Number' column.")
+    parser.add_argument("input", nargs = "?", help = "input .csv or .xlsx file")
+    parser.add_argument("-o", "--output", help = "output .csv or .xlsx file")
+    parser.add_argument("--interactive", action = "store_true",
+                        help = "choose the input and output files with file explorer windows")
+    parser.add_argument("--officers", action = argparse.BooleanOptionalAction, default = False,
+                        help = "fetch directors")
+    parser.add_argument("--charges", action = argparse.BooleanOptionalAction, default = False,
+                        help = "fetch unsatisfied charges")
+    parser.add_argument("--insolvency", action = argparse.BooleanOptionalAction, default = True,
+                        help = "report insolvency history")
+    parser.add_argument("--concurrency", type = int, default = 1,
+                        help = "number of requests in flight at once (default: 1)")
+    parser.add_argument("--rate", type = float, default = 600,
+                        help = "requests allowed per rate window (default: 600)")
+    parser.add_argument("--rate-window", type = float, default = 300,
+                        help = "length of the rate window in seconds (default: 300)")
+    parser.add_argument("--journal",
+                        help = "journal file used to resume interrupted runs, removed once the output is written "
+                               "(default: <input>.journal.jsonl)")
+    parser.add_argument("--cache", help = "SQLite file used to cache API responses between runs")
+    parser.add_argument("--snapshot",
+                        help = "SQLite index of the bulk company snapshot (see CompaniesHouseSnapshot.py) used for "
+                               "profiles before the API; insolvency history is only known for insolvent statuses")
+    parser.add_argument("--api-root", help = "override the API host, e.g. to run against a stub server")
+    parser.add_argument("--progress-every", type = int, default = 1,
+                        help = "emit a progress line every N companies (default: 1)")
+    parser.add_argument("--metrics",
+                        help = "write request metrics to this file: Prometheus text for .prom, JSON otherwise")
+
+    args = parser.parse_args(argv)
+
+    if not args.interactive and (args.input is None or args.output is None):
+        parser.error("input and --output are required unless --interactive is given")
+
+    return args
+
+
+def main(argv = None):
+    args = parse_args(argv)
+
+    if args.interactive:
+        import tkinter as tk                                                    # only needed when a window is shown
+        from tkinter import filedialog                                          # allows us to open file explorer
+
+        print("Hello! \nThis program allows you to input a CSV/Excel file with Companies House company numbers and returns a file with the corresponding company names.\
+\nSelect a file once with file explorer window opens. Please ensure the file has a column titled 'Company Number'.")
 
-            charges = companyHouseAPI.get_company_charges(charges_path) # get charges
+        root = tk.Tk()
+        root.withdraw()
 
-            charges_string = "" # empty string which we will append all charges to
+        if args.input is None:
+            args.input = filedialog.askopenfilename()
 
-            chargeIndex = 1 # used to point to charge
-            fieldIndex = 0 # used to point to field in charge
+    key = load_api_key()
+    df = read_input(args.input)
 
-            # the below chunk of code iterates over each field in each charge and appends to string
-            while (chargeIndex < len(charges) + 1):
-                charges_string += str(chargeIndex) + ":\n"
-                while (fieldIndex < len(charges[0])):
-                    charges_string += str(charges[chargeIndex-1][fieldIndex]) + "\n"
-                    fieldIndex += 1 # iterate over field
-                
-                chargeIndex += 1 # iterate over charge
-                fieldIndex = 0 # reset field index
-                charges_string += "\n"
-        
-            charges_string = charges_string.strip() # trim whitespace at end of string
+    journal = Journal(args.journal or args.input + ".journal.jsonl")           # results are saved here as they arrive so a run can resume
+    fields = required_fields(args.officers, args.charges, args.insolvency)
 
-            df.at[index, "Charges"] = charges_string
+    # each company number is only fetched once, however many times it appears in the input
+    company_numbers = list(df["Company Number"].dropna().astype(str).unique())
+    pending = [number for number in company_numbers
+               if not is_complete(journal.completed.get(number), fields)]
 
-    if getInsolvency == True:
-        if ('involvency' not in company_profile['links']):
-            df.at[index, "Insolvency"] = "[No Insolvency Data]"
-            print("\n" + str(index+1) + "/" + str(len(df.index)) + " (" + str(percentage_complete) + "%): " + company_number + " | " + str(company_profile['company_name']))
-            continue 
+    emit("start", input = args.input, companies = len(company_numbers),
+         already_journaled = len(company_numbers) - len(pending), journal = journal.path)
 
-        else:
-            hasInsolvencyHistory = company_profile['has_insolvency_history']
-            print("has insolvency history: " + hasInsolvencyHistory)
-            
+    limiter = TokenBucket(capacity = args.rate, period = args.rate_window)
+    cache = None
 
+    if args.cache:
+        from CompaniesHouseCache import ResponseCache
+        cache = ResponseCache(args.cache)
 
+    metrics = None
+    snapshot = None
 
-    print("\n" + str(index+1) + "/" + str(len(df.index)) + " (" + str(percentage_complete) + "%): " + company_number + " | " + str(company_profile['company_name']))
+    if args.metrics:
+        from CompaniesHouseMetrics import MetricsCollector
+        metrics = MetricsCollector()
 
-# Select save location for output file
-print("\nSelect location to save output file.\
+    if args.snapshot:
+        from CompaniesHouseSnapshot import SnapshotIndex
+        snapshot = SnapshotIndex(args.snapshot)
+
+    tic = time.perf_counter()
+    done = 0
+    failed = []
+
+    def report(company_number, record):
+        nonlocal done
+        done += 1
+
+        if done % args.progress_every == 0 or done == len(pending):
+            emit("progress", done = done, total = len(pending), company_number = company_number,
+                 found = record["found"], elapsed = round(time.perf_counter() - tic, 3))
+
+    def report_failure(company_number, error):
+        failed.append(company_number)
+        emit("failed", company_number = company_number, error = f"{type(error).__name__}: {error}")
+
+    try:
+        if args.concurrency > 1:
+            asyncio.run(run_concurrent(key, pending, journal, args, limiter, cache, metrics, snapshot,
+                                       report, report_failure))
+        else:
+            with CompaniesHouseService(key, rate_limiter = limiter, cache = cache, api_root = args.api_root,
+                                       hooks = metrics, snapshot = snapshot, raise_on_error = True) as api:
+                run_sequential(api, pending, journal, args, report, report_failure)
+    finally:
+        journal.close()
+
+        if cache is not None:
+            cache.close()
+
+        if snapshot is not None:
+            snapshot.close()
+
+        if metrics is not None:
+            metrics.dump(args.metrics)                                          # written even if the run failed part way
+
+    if failed:
+        emit("incomplete", failed = len(failed), journal = journal.path)
+        sys.exit(f"{len(failed)} companies could not be fetched; run again to retry them "
+                 f"(the others are kept in {journal.path})")
+
+    # build every output column in one pass and join onto the input rows
+    results = results_frame({number: journal.completed[number] for number in company_numbers},
+                            args.officers, args.charges, args.insolvency)
+    df = merge_results(df, results)
+
+    if args.output is None:
+        # Select save location for output file
+        print("\nSelect location to save output file.\
 \nPlease take note that when opening .csv files, excel will truncate leading zeros from 'Company Number', \
 hence .xlsx is the optimal file format. \nHowever if you still desire to save as .csv, applications like Notepad, Notepad++ etc. can still view the data with no issue.")
 
-# Let's see if we can provide options for .csv/.xlsx to save user typing ext
-saveLocation = filedialog.asksaveasfilename()                                               # opens file explorer where user can decide where to save output file
+        args.output = filedialog.asksaveasfilename()                            # opens file explorer where user can decide where to save output file
+
+    write_output(df, args.output)
+    os.remove(journal.path)                                                     # a rerun fetches afresh, honouring the cache TTLs
 
-# condition for saving as .csv
-if saveLocation[(len(saveLocation) - 4) : (len(saveLocation))] == ".csv":             
-    df.to_csv(saveLocation)
+    emit("finish", output = args.output, fetched = done, elapsed = round(time.perf_counter() - tic, 3))
 
-# condition for saving as .xlsx
-elif saveLocation[(len(saveLocation) - 5) : (len(saveLocation))] == ".xlsx":
-    df.to_excel(saveLocation)   
 
-#test comment
-# #test                                                
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -1,39 +1,327 @@
 ## This is a wrapper class for Companies House API which allows us to fetch information on UK companies ##
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import collections
+import itertools
 import json
 import datetime
 import time
 import pprint
+import urllib.parse
+
+from CompaniesHouseMetrics import endpoint_of
+from CompaniesHouseNames import NameResolver
+from CompaniesHouseRateLimiter import TokenBucket
+
+#: callable: One JSON decoder shared by every response.
+_decode_json = json.JSONDecoder().decode
+
+
+#: namedtuple: Timing information recorded for every request sent to the API.
+RequestTiming = collections.namedtuple(
+    "RequestTiming", ["url", "status_code", "elapsed", "new_connection"])
+
+
+class CompaniesHouseError(Exception):
+    """An API response that is neither data nor a definitive "not found".
+    
+    Only raised by services created with ``raise_on_error=True``, e.g. for
+    a 429 or 5xx that is still failing once the retries are spent.
+    
+    Attributes:
+        url (str): The url that was requested.
+        status_code (int): The final HTTP status code.
+    
+    """
+
+    def __init__(self, url, status_code):
+        super().__init__(f"{status_code} from {url}")
+        self.url = url
+        self.status_code = status_code
+
 
 class CompaniesHouseService:
     """A wrapper around the companies house API.
     
+    The service owns a pooled ``requests.Session`` so that consecutive calls
+    reuse the same keep-alive connection instead of paying for a new TCP and
+    TLS handshake every time. Use it as a context manager, or call
+    ``close()`` when finished, to release the pooled connections.
+    
     Attributes:
+        api_root (str): Scheme and host of the Companies House API.
         search_url (str): Base url for Companies House search query.
         company_url (str): Base url for Companies House company query.
+        root_url (str): Base url for paths returned in API "links".
         
     """
-    search_url = "https://api.companieshouse.gov.uk/search/companies?q={}"
-    company_url = "https://api.companieshouse.gov.uk/company/{}"
-    root_url = "https://api.companieshouse.gov.uk{}"
+    api_root = "https://api.companieshouse.gov.uk"
+    search_url = api_root + "/search/companies?q={}"
+    company_url = api_root + "/company/{}"
+    root_url = api_root + "{}"
+
+    #: tuple: Status codes which are retried, each retry taking a token.
+    retry_status_codes = (429, 500, 502, 503, 504)
     
     
-    def __init__(self, key, time_between_requests = 0.6):
+    def __init__(self, key, time_between_requests = None, pool_size = 10,
+                 max_retries = 3, backoff_factor = 0.5, timeout = 30,
+                 timing_history = 10000, api_root = None,
+                 rate_limiter = None, cache = None, hooks = None,
+                 snapshot = None, raise_on_error = False):
         """
         Args:
             key (str): The API key issued in the Companies House API 
                 applications.
-            time_between_requests (float): Time in seconds between requests to 
-                the API to prevent spam. Default is 0.5 to prevent calls 
-                exceeding the 600 per 5 minutes limit.
+            time_between_requests (float): Fixed time in seconds between
+                requests to the API. Only used when no ``rate_limiter`` is
+                given; by default requests may burst up to the 600 per 5
+                minutes limit instead.
+            pool_size (int): Maximum number of keep-alive connections held
+                open to the API host.
+            max_retries (int): Number of times a request is retried after a
+                connection error or a 429/5xx response.
+            backoff_factor (float): Exponential backoff factor in seconds
+                between retries. A "Retry-After" header sent by the API
+                takes precedence, and holds back every request sharing
+                the rate limiter.
+            timeout (float): Seconds to wait for the API to respond.
+            timing_history (int): Number of recent request timings to keep
+                in ``request_timings``.
+            api_root (str): Overrides the API scheme and host, e.g. to point
+                the service at a local stub server.
+            rate_limiter (TokenBucket): Limiter to draw request tokens from.
+                Pass the same limiter to several services to make them share
+                one API budget.
+            cache (ResponseCache): Persistent cache consulted before every
+                request. Fresh entries are returned without touching the
+                API and stale ones are revalidated by ETag.
+            hooks (ServiceHooks): Receives an event for every request,
+                cache lookup and JSON decode, e.g. a MetricsCollector.
+                Without hooks none of the extra timing is done.
+            snapshot (SnapshotIndex): Offline index of the bulk company
+                snapshot. Company profiles found in it are returned without
+                touching the API; misses, officers and charges still use
+                the API.
+            raise_on_error (bool): Raise CompaniesHouseError for failed
+                responses other than 404, instead of returning an empty
+                dictionary, so callers can tell "not found" from "try again".
             
         """
         self.key = key
         self.time_between_requests = time_between_requests
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.timeout = timeout
+        self.raise_on_error = raise_on_error
+
+        if rate_limiter is None:
+            if time_between_requests is None:
+                rate_limiter = TokenBucket()
+            else:
+                rate_limiter = TokenBucket(capacity=1,
+                                           period=time_between_requests)
+
+        #: TokenBucket: Limiter shared by every request from this service.
+        self.rate_limiter = rate_limiter
+
+        #: ResponseCache: Cache of previous responses, or None.
+        self.cache = cache
+
+        #: NameResolver: Created on the first call to resolve_company_names.
+        self.name_resolver = None
+
+        #: ServiceHooks: Instrumentation hooks, or None.
+        self.hooks = hooks
+
+        #: SnapshotIndex: Offline source of company profiles, or None.
+        self.snapshot = snapshot
+
+        if api_root is not None:
+            self.api_root = api_root.rstrip("/")
+            self.search_url = self.api_root + "/search/companies?q={}"
+            self.company_url = self.api_root + "/company/{}"
+            self.root_url = self.api_root + "{}"
+
+        # only connection errors are retried by urllib3; 429/5xx retries are
+        # made by _send, so that each one goes through the rate limiter
+        retries = Retry(total=max_retries,
+                        backoff_factor=backoff_factor,
+                        allowed_methods=frozenset(["GET"]),
+                        respect_retry_after_header=False,
+                        raise_on_status=False)
+
+        #: HTTPAdapter: Connection pool shared by every request.
+        self.adapter = HTTPAdapter(pool_connections=1,
+                                   pool_maxsize=pool_size,
+                                   max_retries=retries,
+                                   pool_block=True)
+
+        #: requests.Session: Keep-alive session used for all API calls.
+        self.session = requests.Session()
+        self.session.auth = (self.key, '')
+        self.session.headers.update({"Connection": "keep-alive"})
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+
+        #: deque: The most recent RequestTiming records, oldest first.
+        self.request_timings = collections.deque(maxlen=timing_history)
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+    def close(self):
+        """Close the session and every pooled connection it holds."""
+        self.session.close()
+
+
+    def _connection_count(self):
+        """Return the number of connections the pool has opened so far.
         
-        #: datetime: Timestamp instantiated as NoneType 
-        self.last_request_timestamp = None
+        Returns:
+            int: Connections opened across every host in the pool.
+        
+        """
+        pools = self.adapter.poolmanager.pools
+        
+        return sum(pools[key].num_connections for key in pools.keys())
+
+
+    def _retry_delay(self, attempt, headers = None):
+        """Return the seconds to wait before retrying a failed request.
+
+        Args:
+            attempt (int): Number of attempts made so far, starting at 1.
+            headers (Mapping): Headers of the failed response, if one was
+                received.
+
+        Returns:
+            float: The "Retry-After" header if present, otherwise an
+                exponential backoff.
+
+        """
+        if headers is not None:
+            retry_after = headers.get("Retry-After")
+
+            try:
+                return max(float(retry_after), 0)
+            except (TypeError, ValueError):
+                pass
+
+        return self.backoff_factor * (2 ** (attempt - 1))
+
+
+    def _prepare_retry(self, attempt, status = None, headers = None):
+        """Tell the rate limiter about a failed request before it is retried.
+
+        A 429 holds back every request sharing the limiter until the
+        "Retry-After" time (or the backoff) has passed. Other failures only
+        back off the request that failed.
+
+        Args:
+            attempt (int): Number of attempts made so far, starting at 1.
+            status (int): Status code of the failed response, or None after
+                a connection error.
+            headers (Mapping): Headers of the failed response, or None.
+
+        Returns:
+            float: Seconds this request should wait before taking a token
+                from the limiter for its retry.
+
+        """
+        delay = self._retry_delay(attempt, headers)
+
+        if headers is not None:
+            self.rate_limiter.update_from_headers(headers)
+
+        if status == 429:
+            self.rate_limiter.block_for(delay)
+            return 0
+
+        return delay
+
+
+    def _send(self, url, headers = None):
+        """Send a GET request through the pooled session, retrying on 429/5xx, and time it.
+        
+        Every retry takes a token from the rate limiter like a new request.
+        
+        Args:
+            url (str): The fully formatted url to request.
+            headers (dict): Extra request headers.
+            
+        Returns:
+            tuple: The final requests.Response and the number of retries
+                made, including urllib3's retries of connection errors.
+        
+        """
+        attempt = 0
+
+        while True:
+            attempt += 1
+            connections_before = self._connection_count()
+            tic = time.perf_counter()
+
+            response = self.session.get(url, headers=headers,
+                                        timeout=self.timeout)
+
+            elapsed = time.perf_counter() - tic
+            new_connection = self._connection_count() > connections_before
+
+            self.request_timings.append(RequestTiming(
+                url, response.status_code, elapsed, new_connection))
+
+            if response.status_code not in self.retry_status_codes or \
+                    attempt > self.max_retries:
+                retry_state = response.raw.retries if response.raw is not None else None
+                transport_retries = len(retry_state.history) if retry_state is not None else 0
+
+                return response, attempt - 1 + transport_retries
+
+            delay = self._prepare_retry(attempt, response.status_code,
+                                        response.headers)
+
+            if delay > 0:
+                time.sleep(delay)
+
+            self._rate_limiting()
+
+
+    def timing_summary(self):
+        """Summarise the recorded request timings.
+        
+        Splitting the requests by whether they had to open a new connection
+        shows how much handshake time the connection pool is saving. Timings
+        whose connection reuse is unknown only count towards the totals.
+        
+        Returns:
+            dict: Request counts and mean latency in seconds, overall and for
+                new versus reused connections.
+        
+        """
+        elapsed = [t.elapsed for t in self.request_timings]
+        new = [t.elapsed for t in self.request_timings 
+               if t.new_connection is True]
+        reused = [t.elapsed for t in self.request_timings 
+                  if t.new_connection is False]
+        
+        def mean(values):
+            return sum(values) / len(values) if values else None
+        
+        return {"requests": len(elapsed),
+                "mean_elapsed": mean(elapsed),
+                "new_connections": len(new),
+                "mean_elapsed_new_connection": mean(new),
+                "reused_connections": len(reused),
+                "mean_elapsed_reused_connection": mean(reused)}
 
 
     def _query_ch_api(self, url, query):
@@ -46,14 +334,43 @@ class CompaniesHouseService:
         
         Returns:
             dict: A structured dictionary containing all of the information
-                returned by the API.
+                returned by the API, or an empty dictionary on failure.
+        
+        Raises:
+            CompaniesHouseError: For a failure other than 404, if the service
+                was created with ``raise_on_error=True``.
                 
         """
-        #query = self._remove_problem_characters(query)
+        url = url.format(query)
+        cache_key = url[len(self.api_root):]
+        cached = None
+        headers = None
+        hooks = self.hooks
+        endpoint = endpoint_of(cache_key) if hooks is not None else None
+
+        if self.cache is not None:
+            cached = self.cache.get(cache_key)
+
+            if hooks is not None:
+                hooks.on_cache(endpoint, "miss" if cached is None
+                               else "hit" if cached.fresh else "stale")
+
+            if cached is not None and cached.fresh:
+                return cached.body
+
+            if cached is not None and cached.etag is not None:
+                headers = {"If-None-Match": cached.etag}
         
-        self._rate_limiting()
+        throttled = self._rate_limiting()
 
-        resultQuery = requests.get(url.format(query), auth=(self.key,''))
+        tic = time.perf_counter()
+        resultQuery, retries = self._send(url, headers)
+
+        if hooks is not None:
+            hooks.on_request(endpoint, url, resultQuery.status_code,
+                             time.perf_counter() - tic, throttled, retries)
+
+        self.rate_limiter.update_from_headers(resultQuery.headers)
 
         ## Testing
         #print("\n")
@@ -64,9 +381,25 @@ class CompaniesHouseService:
 
         #200 is the authorised code for RESTful API calls
         if resultQuery.status_code == 200:
-            result = json.JSONDecoder().decode(resultQuery.text)
-        #elif resultQuery.status_code == 404:
-        #    result = 
+            if hooks is None:
+                result = _decode_json(resultQuery.text)
+            else:
+                tic = time.perf_counter()
+                result = _decode_json(resultQuery.text)
+                hooks.on_decode(endpoint, time.perf_counter() - tic)
+
+            if self.cache is not None:
+                self.cache.put(cache_key, result,
+                               resultQuery.headers.get("ETag"))
+        #304 means the cached copy is still current
+        elif resultQuery.status_code == 304 and cached is not None:
+            self.cache.refresh(cache_key)
+            result = cached.body
+
+            if hooks is not None:
+                hooks.on_cache(endpoint, "revalidated")
+        elif resultQuery.status_code != 404 and self.raise_on_error:
+            raise CompaniesHouseError(url, resultQuery.status_code)
         else:
             #print(f"Failed with error code: {resultQuery.status_code} | "\
             #      f"Reason: {resultQuery.reason}")
@@ -78,37 +411,20 @@ class CompaniesHouseService:
     
 
     def _rate_limiting(self):
-        """Waits up to the defined time between requests.
+        """Waits until the rate limiter allows another request.
         
-        If more than the defined "time_between_requests" has passed (in 
-        seconds) since the last call, this function will not wait any time.
-        The last_request_timestamp class variable is reset to the current
-        time every time this method is called.
+        Returns:
+            float: Seconds spent waiting.
         
         """
-        if self.last_request_timestamp is None:
-            self.last_request_timestamp = datetime.datetime.now()
-            
-        else:
-            current_time = datetime.datetime.now()
-            
-            time_since_request = (current_time - 
-                                  self.last_request_timestamp
-                                  ).total_seconds()
-            
-            wait_time = max(self.time_between_requests - 
-                            time_since_request,
-                            0)
-            
-            time.sleep(wait_time)
-            self.last_request_timestamp = datetime.datetime.now()   
+        return self.rate_limiter.acquire()
 
 
     def _remove_problem_characters(self, string):
         """Remove invalid query parameters from the url query
         
-        Spaces and the "&" sign will cause issues in an HTTP request so are
-        replaced.
+        Spaces, the "&" sign and other reserved characters will cause issues
+        in an HTTP request so are percent-encoded.
         
         Args:
             string (str): The query to be "cleaned".
@@ -117,18 +433,33 @@ class CompaniesHouseService:
             str: An equivalent string in HTTP GET format
         
         """
+        return urllib.parse.quote_plus(string)
+    
 
-        string = string.replace(" ","+")
-        string = string.replace("&","%26")
+    def search_companies(self, company_name, items_per_page = 20):
+        """Search for a company by name.
+        
+        Args:
+            company_name (str): The company to search for.
+            items_per_page (int): Maximum number of results to return.
+            
+        Returns:
+            list: Search result items, best API match first. Empty if
+                nothing was found or the request failed.
         
-        return string
+        """
+        query = (self._remove_problem_characters(company_name) + 
+                 f"&items_per_page={items_per_page}")
+        search_result = self._query_ch_api(self.search_url, query)
+        
+        return search_result.get("items", [])
     
 
     def get_first_company_search(self, company_name):
         """Search for a company and return the top result.
         
         If no results are returned from the Companies House API then returns
-        NoneType using a try block.
+        NoneType.
         
         Args:
             companyName (str): The company to search for.
@@ -137,14 +468,33 @@ class CompaniesHouseService:
             dict: The profile of the first result found from the API search.
         
         """
-        search_result = self._query_ch_api(self.search_url, company_name)
+        items = self.search_companies(company_name)
+        
+        return items[0] if items else None
+    
+
+    def resolve_company_names(self, company_names, limit = 5):
+        """Map many company names to ranked, confidence scored matches.
         
-        try: 
-            first_result = search_result["items"][0]
-        except IndexError:
-            first_result = None
+        Names are normalised (case, punctuation, Ltd/Limited etc.) and
+        de-duplicated, and candidates from earlier searches are reused, so
+        each distinct company costs at most one search. Results are kept
+        on the service for later calls.
         
-        return first_result
+        Args:
+            company_names (iterable): Company names as written.
+            limit (int): Maximum number of matches per name.
+            
+        Returns:
+            dict: Lists of NameMatch tuples (company_number, company_name,
+                company_status, score), best first, keyed by the names as
+                given. Scores run from 0 to 1.
+        
+        """
+        if self.name_resolver is None:
+            self.name_resolver = NameResolver(self)
+        
+        return self.name_resolver.resolve(company_names, limit)
     
 
     def get_company_profile(self, company_number):
@@ -158,78 +508,207 @@ class CompaniesHouseService:
             dict: The profile of the corresponding company
         
         """
+        if self.snapshot is not None:
+            company_profile = self.snapshot.get_profile(company_number)
+
+            if company_profile is not None:
+                if self.hooks is not None:
+                    self.hooks.on_cache("profile", "snapshot")
+
+                return company_profile
+
         company_profile = self._query_ch_api(self.company_url, company_number)
         
         return company_profile
 
-    def get_company_directors(self, officers_path):
-        officers = self._query_ch_api(self.root_url, officers_path + "?items_per_page=200?start_index=0")
+    def _iter_items(self, path):
+        """Lazily walk every page of a paged API list.
+        
+        Pages are only requested as the caller consumes items, so breaking
+        out of the loop early stops any further requests.
+        
+        Args:
+            path (str): API path of the list, e.g. a company's officers link.
+            
+        Yields:
+            dict: Each item of the list, in API order.
+        
+        """
+        start_index = 0
+
+        while True:
+            page = self._query_ch_api(self.root_url,
+                                      page_query(path, start_index))
+            items = page.get('items', [])
+
+            yield from items
+
+            start_index += len(items)
+
+            if last_page(page, items, start_index):
+                break
+
+    def iter_officers(self, officers_path):
+        """Yield every officer of a company, fetching pages on demand.
+        
+        Args:
+            officers_path (str): The "officers" link from a company profile.
+            
+        Yields:
+            dict: Officer items as returned by the API.
+        
+        """
+        return self._iter_items(officers_path)
+
+    def iter_directors(self, officers_path, limit = None, active_only = False):
+        """Yield director names, stopping early once ``limit`` are found.
+        
+        Args:
+            officers_path (str): The "officers" link from a company profile.
+            limit (int): Stop after this many directors. None reads all pages.
+            active_only (bool): Skip directors who have resigned.
+            
+        Yields:
+            str: Director names.
+        
+        """
+        officers = (officer for officer in self.iter_officers(officers_path)
+                    if is_director(officer, active_only))
+        
+        for officer in itertools.islice(officers, limit):
+            yield officer['name']
+
+    def iter_charges(self, charges_path):
+        """Yield every charge of a company, fetching pages on demand.
+        
+        Args:
+            charges_path (str): The "charges" link from a company profile.
+            
+        Yields:
+            dict: Charge items as returned by the API.
+        
+        """
+        return self._iter_items(charges_path)
 
-        officer_list = officers['items']
+    def iter_unsatisfied_charges(self, charges_path, limit = None):
+        """Yield unsatisfied charges, stopping early once ``limit`` are found.
+        
+        Args:
+            charges_path (str): The "charges" link from a company profile.
+            limit (int): Stop after this many charges. None reads all pages.
+            
+        Yields:
+            list: ``format_charge`` fields of each outstanding charge.
+        
+        """
+        charges = (charge for charge in self.iter_charges(charges_path)
+                   if charge['status'] != 'fully-satisfied')
+        
+        for charge in itertools.islice(charges, limit):
+            yield format_charge(charge)
 
-        directors = []
+    def get_company_directors(self, officers_path, limit = None,
+                              active_only = False):
+        return list(self.iter_directors(officers_path, limit, active_only))
 
-        for officer in officer_list:
-            if officer['officer_role'] == 'director':
-                directors.append(officer['name'])
+    def get_company_charges(self, charges_path, limit = None):
+        return list(self.iter_unsatisfied_charges(charges_path, limit))
 
-        return directors
 
-    def get_company_charges(self, charges_path):
-        charges = self._query_ch_api(self.root_url, charges_path + "?items_per_page=200?start_index=0")
+def page_query(path, start_index, items_per_page = 100):
+    """Return the path of one page of a paged API list.
+    
+    Args:
+        path (str): API path of the list.
+        start_index (int): Index of the first item on the page.
+        items_per_page (int): Page size. 100 is the most the API returns.
+        
+    Returns:
+        str: The path with its paging query string.
+    
+    """
+    return f"{path}?items_per_page={items_per_page}&start_index={start_index}"
 
-        charges_list = charges['items']
 
-        requiredLength = 0
+def last_page(page, items, fetched):
+    """Return whether a paged API list has been read to the end.
+    
+    Officer lists report their length in "total_results" and charge lists in
+    "total_count". An empty page also ends the list.
+    
+    Args:
+        page (dict): The page just received.
+        items (list): The items on that page.
+        fetched (int): Items received so far, including this page.
         
-        ## get required length of array
-        for charge in charges_list:
-            if charge['status'] != 'fully-satisfied':
-              requiredLength += 1  
+    Returns:
+        bool: True if there are no more pages to request.
+    
+    """
+    total = page.get('total_results', page.get('total_count'))
+
+    return not items or total is None or fetched >= total
 
-        rows = requiredLength
-        columns = 6
-        unsatisfiedCharges = [["" for x in range(columns)] for y in range(rows)]
 
-        index = 0
+def is_director(officer, active_only = False):
+    """Return whether an officer is a director.
+    
+    Args:
+        officer (dict): An officer item as returned by the API.
+        active_only (bool): Exclude directors who have resigned.
+        
+    Returns:
+        bool: True for (active) directors.
+    
+    """
+    if officer['officer_role'] != 'director':
+        return False
+
+    return not (active_only and 'resigned_on' in officer)
 
-        for charge in charges_list:
-            if charge['status'] != 'fully-satisfied':
-                unsatisfiedCharges[index][0] = "Description: " + charge['classification']['description']
-                unsatisfiedCharges[index][1] = "Created: " + charge['created_on']
-                unsatisfiedCharges[index][2] = "Delivered: " + charge['delivered_on']
-                unsatisfiedCharges[index][3] = "Status: " + charge['status']
-                unsatisfiedCharges[index][4] = "Persons entitled: " + charge['persons_entitled'][0]['name'] ## what if more than one entry here??
-                if ('description' in charge['particulars']):
-                    unsatisfiedCharges[index][5] = "Short particulars: " + charge['particulars']['description'][0:100] + "..."
-                else:
-                    unsatisfiedCharges[index][5] = "[No Result]"
 
-                index += 1
+def format_charge(charge):
+    """Return the six display fields of a single charge.
+    
+    Args:
+        charge (dict): A charge item as returned by the API.
+        
+    Returns:
+        list: Description, created, delivered, status, persons entitled and
+            short particulars, each as a labelled string.
+    
+    """
+    fields = ["Description: " + charge['classification']['description'],
+              "Created: " + charge['created_on'],
+              "Delivered: " + charge['delivered_on'],
+              "Status: " + charge['status'],
+              "Persons entitled: " + charge['persons_entitled'][0]['name']] ## what if more than one entry here??
 
-                if (index == requiredLength):
-                    break
+    if ('description' in charge['particulars']):
+        fields.append("Short particulars: " + charge['particulars']['description'][0:100] + "...")
+    else:
+        fields.append("[No Result]")
 
-            else:
-                continue
+    return fields
 
-        return unsatisfiedCharges
 
 if __name__ == "__main__":
     key = "vLmk-4YxYS-QH8nMi8767zJSlcPlo3MKn41-d" #Fake key - insert your key here
-    ch_api = CompaniesHouseService(key)
     iterations = 10
     
-    tic = datetime.datetime.now()
-    
-    for company in range(iterations): 
-        ch_profile = ch_api.get_company_profile("00445790")
+    with CompaniesHouseService(key) as ch_api:
+        tic = datetime.datetime.now()
         
-    toc = datetime.datetime.now()
+        for company in range(iterations): 
+            ch_profile = ch_api.get_company_profile("00445790")
+            
+        toc = datetime.datetime.now()
+
+        pprint.pprint(ch_api.timing_summary())
     
     time_taken = (toc - tic).total_seconds()
     print(f"Average time per iteration: "\
-          f"{time_taken/(iterations-1):0.2f} seconds")
+          f"{time_taken/iterations:0.2f} seconds")
 
 
 #test comment
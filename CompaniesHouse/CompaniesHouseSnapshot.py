@@ -0,0 +1,419 @@
+## Offline index of the Companies House bulk company snapshot ("Free Company Data Product") ##
+##
+## Build:  python CompaniesHouseSnapshot.py BasicCompanyDataAsOneFile-2024-05-01.zip -o snapshot.sqlite
+##
+## The snapshot is published monthly as one large CSV (or several parts), zipped. The importer streams it
+## into a compact SQLite file keyed by company number, and SnapshotIndex answers company profile lookups
+## from that file in the same shape as the API's /company/{number} response.
+
+import argparse
+import csv
+import io
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+import zipfile
+
+
+#: tuple: Columns of the index, in table order. "type" and "company_status"
+#: hold API codes rather than the snapshot's descriptions.
+COLUMNS = ("company_number", "company_name", "type", "company_status",
+           "jurisdiction", "care_of", "po_box", "address_line_1",
+           "address_line_2", "locality", "region", "country", "postal_code",
+           "date_of_creation", "date_of_cessation", "sic_codes", "charges")
+
+#: dict: Snapshot CSV header for each stored address column.
+ADDRESS_HEADERS = {"care_of": "RegAddress.CareOf",
+                   "po_box": "RegAddress.POBox",
+                   "address_line_1": "RegAddress.AddressLine1",
+                   "address_line_2": "RegAddress.AddressLine2",
+                   "locality": "RegAddress.PostTown",
+                   "region": "RegAddress.County",
+                   "country": "RegAddress.Country",
+                   "postal_code": "RegAddress.PostCode"}
+
+#: tuple: Snapshot CSV headers of the SIC code columns.
+SIC_HEADERS = tuple("SICCode.SicText_" + str(n) for n in range(1, 5))
+
+#: dict: API "type" code for each snapshot CompanyCategory, lower-cased.
+COMPANY_TYPES = {
+    "private limited company": "ltd",
+    "public limited company": "plc",
+    "old public company": "old-public-company",
+    "private unlimited company": "private-unlimited",
+    "private unlimited": "private-unlimited",
+    "pri/ltd by guar/nsc (private, limited by guarantee, no share capital)":
+        "private-limited-guarant-nsc",
+    "pri/lbg/nsc (private, limited by guarantee, no share capital, use of 'limited' exemption)":
+        "private-limited-guarant-nsc-limited-exemption",
+    "priv ltd sect. 30 (private limited company, section 30 of the companies act)":
+        "private-limited-shares-section-30-exemption",
+    "limited liability partnership": "llp",
+    "limited partnership": "limited-partnership",
+    "scottish partnership": "scottish-partnership",
+    "charitable incorporated organisation": "charitable-incorporated-organisation",
+    "scottish charitable incorporated organisation":
+        "scottish-charitable-incorporated-organisation",
+    "community interest company": "ltd",                                       # the API reports CICs by their legal form
+    "investment company with variable capital": "investment-company-with-variable-capital",
+    "industrial and provident society": "industrial-and-provident-society",
+    "registered society": "registered-society-non-jurisdictional",
+    "royal charter company": "royal-charter",
+    "european public limited-liability company (se)":
+        "european-public-limited-liability-company-se",
+    "further education and sixth form college corps":
+        "further-education-or-sixth-form-college-corporation",
+    "protected cell company": "protected-cell-company",
+    "unregistered company": "unregistered-company",
+    "overseas entity": "registered-overseas-entity",
+    "converted/closed": "converted-or-closed",
+    "other company type": "other"}
+
+#: dict: API "company_status" code for each snapshot CompanyStatus, lower-cased.
+COMPANY_STATUSES = {
+    "active": "active",
+    "active - proposal to strike off": "active",
+    "live but receiver manager on at least one charge": "active",
+    "dissolved": "dissolved",
+    "liquidation": "liquidation",
+    "in administration": "administration",
+    "administration order": "administration",
+    "administrative receiver": "receivership",
+    "receivership": "receivership",
+    "receiver action": "receivership",
+    "voluntary arrangement": "voluntary-arrangement",
+    "insolvency proceedings": "insolvency-proceedings",
+    "converted/closed": "converted-closed",
+    "removed": "removed",
+    "closed": "closed",
+    "open": "open"}
+
+#: frozenset: Statuses which can only follow an insolvency event.
+INSOLVENT_STATUSES = frozenset(["liquidation", "administration", "receivership",
+                                "voluntary-arrangement", "insolvency-proceedings"])
+
+#: tuple: Company number prefixes of companies registered in Scotland.
+SCOTTISH_PREFIXES = ("SC", "SA", "SE", "SF", "SG", "SI", "SL", "SO", "SP", "SR", "SZ")
+
+#: tuple: Company number prefixes of companies registered in Northern Ireland.
+NORTHERN_IRISH_PREFIXES = ("NI", "NA", "NC", "NF", "NL", "NO", "NP", "NR", "NZ", "R0")
+
+
+def _slug(text):
+    """Turn an unmapped snapshot description into an API-style code."""
+    return re.sub(r"[^a-z0-9]+", "-", text.lower()).strip("-")
+
+
+def _iso_date(text):
+    """Convert the snapshot's dd/mm/yyyy dates to the API's yyyy-mm-dd."""
+    day, month, year = (text.split("/") + ["", "", ""])[:3]
+
+    if not (day.isdigit() and month.isdigit() and year.isdigit()):
+        return None
+
+    return f"{year}-{month.zfill(2)}-{day.zfill(2)}"
+
+
+def jurisdiction(company_number):
+    """Return the API jurisdiction implied by a company number's prefix."""
+    if company_number.startswith(SCOTTISH_PREFIXES):
+        return "scotland"
+    if company_number.startswith(NORTHERN_IRISH_PREFIXES):
+        return "northern-ireland"
+
+    return "england-wales"
+
+
+def snapshot_row(record):
+    """Convert one snapshot CSV record to a row of ``COLUMNS``.
+
+    Args:
+        record (dict): The record, keyed by header with surrounding spaces
+            removed (the published headers have stray leading spaces).
+
+    Returns:
+        tuple: The row, or None for a record without a company number.
+
+    """
+    number = record.get("CompanyNumber", "").strip().upper()
+
+    if not number:
+        return None
+
+    category = record.get("CompanyCategory", "").strip()
+    status = record.get("CompanyStatus", "").strip()
+    sic_codes = [record.get(header, "").split(" - ", 1)[0].strip()
+                 for header in SIC_HEADERS]
+    charges = record.get("Mortgages.NumMortCharges", "").strip()
+
+    return ((number,
+             record.get("CompanyName", "").strip(),
+             COMPANY_TYPES.get(category.lower()) or _slug(category),
+             COMPANY_STATUSES.get(status.lower()) or _slug(status),
+             jurisdiction(number))
+            + tuple(record.get(header, "").strip() or None
+                    for header in ADDRESS_HEADERS.values())
+            + (_iso_date(record.get("IncorporationDate", "").strip()),
+               _iso_date(record.get("DissolutionDate", "").strip()),
+               ",".join(code for code in sic_codes
+                        if code and code != "None Supplied") or None,
+               int(charges) if charges.isdigit() else 0))
+
+
+def iter_snapshot_records(path):
+    """Stream the records of a snapshot .csv, or of every .csv inside a .zip.
+
+    Yields:
+        dict: One record per company, keyed by stripped header.
+
+    """
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for name in sorted(archive.namelist()):
+                if name.lower().endswith(".csv"):
+                    with archive.open(name) as member:
+                        yield from _csv_records(io.TextIOWrapper(member, encoding="utf-8-sig", newline=""))
+    else:
+        with open(path, "r", encoding="utf-8-sig", newline="") as csv_file:
+            yield from _csv_records(csv_file)
+
+
+def _csv_records(text_file):
+    reader = csv.reader(text_file)
+    header = [name.strip() for name in next(reader, [])]
+
+    for values in reader:
+        yield dict(zip(header, values))
+
+
+def snapshot_date(path):
+    """Return the yyyy-mm-dd date in a snapshot file name, or None."""
+    match = re.search(r"(\d{4}-\d{2}-\d{2})", os.path.basename(path))
+
+    return match.group(1) if match else None
+
+
+def build_snapshot_index(paths, index_path, batch_size = 10000, progress = None):
+    """Stream snapshot files into a new SQLite index.
+
+    The rows are first loaded into a temporary staging table and then copied
+    into the index in company number order, so the index's B-tree is
+    written sequentially and stays compact. The index is built next to
+    ``index_path`` and only moved into place once complete, so a reader
+    never sees a half-built file and an interrupted import leaves any
+    previous index untouched.
+
+    Args:
+        paths (list): Snapshot .csv or .zip files, e.g. every part of a
+            multi-part snapshot.
+        index_path (str): Where to write the index.
+        batch_size (int): Rows inserted per executemany call.
+        progress (callable): Called with the number of rows read so far
+            after every batch.
+
+    Returns:
+        int: Number of companies in the index.
+
+    """
+    temporary_path = index_path + ".building"
+
+    if os.path.exists(temporary_path):
+        os.remove(temporary_path)
+
+    db = sqlite3.connect(temporary_path)
+    placeholders = ", ".join("?" * len(COLUMNS))
+
+    try:
+        db.execute("PRAGMA journal_mode=OFF")                                   # the file is discarded if the import fails
+        db.execute("PRAGMA synchronous=OFF")
+        db.execute("PRAGMA cache_size=-200000")
+        db.execute("CREATE TEMP TABLE staging (" + ", ".join(COLUMNS) + ")")
+
+        read = 0
+
+        for path in paths:
+            rows = (snapshot_row(record) for record in iter_snapshot_records(path))
+            batch = []
+
+            for row in rows:
+                if row is None:
+                    continue
+
+                batch.append(row)
+
+                if len(batch) >= batch_size:
+                    db.executemany(f"INSERT INTO staging VALUES ({placeholders})", batch)
+                    read += len(batch)
+                    batch = []
+
+                    if progress is not None:
+                        progress(read)
+
+            db.executemany(f"INSERT INTO staging VALUES ({placeholders})", batch)
+            read += len(batch)
+
+        db.execute("CREATE TABLE companies (company_number TEXT PRIMARY KEY, "
+                   + ", ".join(COLUMNS[1:]) + ") WITHOUT ROWID")
+        db.execute("INSERT OR REPLACE INTO companies SELECT * FROM staging "   # later parts win for repeated numbers
+                   "ORDER BY company_number, rowid")
+        db.execute("DROP TABLE staging")
+
+        count = db.execute("SELECT COUNT(*) FROM companies").fetchone()[0]
+
+        db.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+        db.executemany("INSERT INTO meta VALUES (?, ?)",
+                       [("snapshot_date", max((snapshot_date(path) or "" for path in paths), default="") or None),
+                        ("source", ";".join(os.path.basename(path) for path in paths)),
+                        ("companies", str(count)),
+                        ("imported_at", time.strftime("%Y-%m-%dT%H:%M:%S"))])
+        db.commit()
+    finally:
+        db.close()
+
+    os.replace(temporary_path, index_path)
+
+    return count
+
+
+class SnapshotIndex:
+    """Company profiles looked up in a snapshot index instead of the API.
+
+    The snapshot carries the basic profile fields: name, type, status,
+    jurisdiction, registered office address, dates and SIC codes. Profiles
+    are returned in the API's shape, with "links" synthesised so officers
+    and charges can still be fetched from the API: an "officers" link for
+    every company and a "charges" link when the snapshot counts any charges.
+    Insolvency history is not in the snapshot, so only companies whose
+    status implies it get an "insolvency" link and
+    ``has_insolvency_history``. Every profile is marked ``"source":
+    "snapshot"`` so it can be told apart from a live API response.
+
+    Companies missing from the snapshot (it lists live companies only, and is
+    refreshed monthly) return None, and the services then ask the API.
+
+    Attributes:
+        path (str): Location of the index.
+        snapshot_date (str): Date of the snapshot the index was built from.
+        companies (int): Number of companies in the index.
+        hits (int): Lookups answered from the index.
+        misses (int): Lookups not in the index.
+
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): An index written by ``build_snapshot_index``.
+
+        """
+        if not os.path.exists(path):
+            raise FileNotFoundError("No snapshot index at " + path)
+
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect("file:" + os.path.abspath(path) + "?mode=ro",
+                                   uri=True, check_same_thread=False)
+
+        meta = dict(self._db.execute("SELECT key, value FROM meta"))
+
+        self.snapshot_date = meta.get("snapshot_date")
+        self.companies = int(meta.get("companies") or 0)
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+    def __contains__(self, company_number):
+        return self.get_profile(company_number) is not None
+
+
+    def get_profile(self, company_number):
+        """Return a company profile in the API's shape, or None if not indexed.
+
+        Args:
+            company_number (str): The company number, exactly as it would be
+                sent to the API.
+
+        Returns:
+            dict: The profile, or None.
+
+        """
+        with self._lock:
+            row = self._db.execute("SELECT * FROM companies WHERE company_number = ?",
+                                   (company_number.strip().upper(),)).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+
+        return snapshot_profile(row)
+
+
+def snapshot_profile(row):
+    """Build an API-shaped company profile from an index row."""
+    (number, name, company_type, status, jurisdiction, *address,
+     date_of_creation, date_of_cessation, sic_codes, charges) = row
+    path = "/company/" + number
+
+    profile = {"company_number": number,
+               "company_name": name,
+               "type": company_type,
+               "company_status": status,
+               "jurisdiction": jurisdiction,
+               "registered_office_address":
+                   {key: value for key, value in zip(ADDRESS_HEADERS, address) if value},
+               "links": {"self": path, "officers": path + "/officers"},
+               "source": "snapshot"}
+
+    if date_of_creation:
+        profile["date_of_creation"] = date_of_creation
+    if date_of_cessation:
+        profile["date_of_cessation"] = date_of_cessation
+    if sic_codes:
+        profile["sic_codes"] = sic_codes.split(",")
+    if charges:
+        profile["links"]["charges"] = path + "/charges"
+    if status in INSOLVENT_STATUSES:
+        profile["links"]["insolvency"] = path + "/insolvency"
+        profile["has_insolvency_history"] = True
+
+    return profile
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Build a company profile index from the Companies House bulk snapshot.")
+    parser.add_argument("snapshot", nargs = "+", help = "snapshot .zip or .csv files (every part of a multi-part snapshot)")
+    parser.add_argument("-o", "--output", required = True, help = "SQLite index to write, replacing any existing one")
+    args = parser.parse_args(argv)
+
+    tic = time.perf_counter()
+
+    def progress(rows):
+        sys.stderr.write(f"\r{rows:,} companies read")
+        sys.stderr.flush()
+
+    count = build_snapshot_index(args.snapshot, args.output, progress = progress)
+
+    sys.stderr.write(f"\r{count:,} companies indexed in {time.perf_counter() - tic:.1f}s -> {args.output}\n")
+
+
+if __name__ == "__main__":
+    main()
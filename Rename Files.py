@@ -1,19 +1,361 @@
 ## This script allows you to rename a directory of files using an excel table containing both the original filenames and desired filenames.
 ## Simply enter the directory below, accompanies by an excel file containing headers 'Input Filename' and Output Filename' and execute.
+##
+## Usage:  python "Rename Files.py" [directory] [rename table] [--dry-run] [--workers N]
+##
+## The whole table is checked against the directory before anything is renamed. Swaps and longer cycles
+## (A -> B, B -> A) go through temporary names, and every completed rename is journaled, so a run that is
+## interrupted can be started again and picks up where it stopped. The journal is removed once every rename is done,
+## so running the same table again later plans it afresh.
 
-import pandas as pd
+import argparse
+import collections
+import concurrent.futures
+import hashlib
+import json
 import os
+import sys
+import threading
+
+from spreadsheetIO import read_table
 
 dir = r''                                                                                               ## Enter directory where files are
 
-filenameTable = pd.read_excel(r'C:\Users\om11\Documents\Rename Table.xlsx',                             ## Rename excel table
-    dtype = {'Input Filename': str, 'Output Filename': str})   
+renameTable = r'C:\Users\om11\Documents\Rename Table.xlsx'                                              ## Rename excel table
+
+#: namedtuple: One rename in a plan, from source to target (names within the directory).
+RenameStep = collections.namedtuple("RenameStep", ["source", "target"])
+
+
+def list_directory(directory):
+    """Return the names in a directory, read with one listing."""
+    with os.scandir(directory) as entries:
+        return [entry.name for entry in entries]
+
+
+def plan_renames(pairs, existing, key = os.path.normcase):
+    """Check a rename table against a directory listing and order the renames.
+
+    Renames are ordered so that no file is renamed onto a name that is still
+    in use: in a chain (A -> B, B -> C) B is moved first. What is left once no
+    rename can go ahead is a cycle, which is broken by moving one of its files
+    to a temporary name and moving it to its real target last.
+
+    Args:
+        pairs (list): (input name, output name) for each row of the table.
+        existing (iterable): Names currently in the directory.
+        key (callable): Maps a name to what the file system compares, so that
+            on Windows "a.pdf" and "A.pdf" are the same file.
+
+    Returns:
+        tuple: (list of RenameStep in the order they must run, list of
+            problems). The plan must not be run if there are problems.
+
+    """
+    existing = {key(name): name for name in existing}
+    problems = []
+    targets = {}                                                                # key(source) -> target
+    claimed = {}                                                                # key(target) -> source
+
+    for source, target in pairs:
+        if os.path.basename(target) != target or target in ('', '.', '..'):
+            problems.append(f"Invalid output filename for {source}: {target!r}")
+            continue
+
+        if key(source) not in existing:
+            problems.append("Input file not found: " + source)
+            continue
+
+        if key(source) in targets:
+            if targets[key(source)] != target:
+                problems.append(f"{source} is renamed twice: to {targets[key(source)]} and {target}")
+            continue
+
+        if key(target) in claimed:
+            problems.append(f"{claimed[key(target)]} and {source} are both renamed to {target}")
+            continue
+
+        if source == target:
+            continue                                                            # nothing to do
+
+        targets[key(source)] = target
+        claimed[key(target)] = source
+
+    for source_key, target in targets.items():
+        if key(target) in existing and key(target) not in targets and key(target) != source_key:
+            problems.append(f"Cannot rename {existing[source_key]} to {target}: a file with that name already exists")
+
+    if problems:
+        return [], problems
+
+    # key(source) -> (source name, target) for every rename still to schedule
+    pending = {source_key: (existing[source_key], target) for source_key, target in targets.items()}
+    waiting_for = {key(target): source_key for source_key, (source, target) in pending.items()}
+    ready = collections.deque(source_key for source_key, (source, target) in pending.items()
+                              if key(target) not in pending)
+
+    taken = set(existing) | {key(target) for source, target in pending.values()}
+    steps = []
+    temporary_count = 0
+
+    while pending:
+        while ready:
+            source_key = ready.popleft()
+            source, target = pending.pop(source_key)
+            steps.append(RenameStep(source, target))
+
+            # the name just freed may be the target someone else is waiting for
+            waiter = waiting_for.get(source_key)
+
+            if waiter in pending:
+                ready.append(waiter)
+
+        if pending:
+            # only cycles are left: park the first file under a temporary name
+            source_key = next(iter(pending))
+            source, target = pending.pop(source_key)
+
+            while True:
+                temporary_count += 1
+                temporary = f"~rename-{temporary_count}-{source}"
+
+                if key(temporary) not in taken:
+                    break
+
+            taken.add(key(temporary))
+            steps.append(RenameStep(source, temporary))
+
+            pending[key(temporary)] = (temporary, target)
+            waiting_for[key(target)] = key(temporary)
+
+            waiter = waiting_for.get(source_key)
+
+            if waiter in pending:
+                ready.append(waiter)
+
+    return steps, problems
+
+
+def step_waves(steps, key = os.path.normcase):
+    """Group plan steps into waves whose renames don't depend on each other.
+
+    A step must wait for any earlier step that uses either of its names, so
+    running the waves in order, and each wave's steps in any order, is the
+    same as running the plan one step at a time.
+
+    """
+    wave_of = []
+    last_use = {}
+
+    for step in steps:
+        names = (key(step.source), key(step.target))
+        wave = 1 + max([wave_of[last_use[name]] for name in names if name in last_use] + [-1])
+
+        wave_of.append(wave)
+
+        for name in names:
+            last_use[name] = len(wave_of) - 1
+
+    waves = collections.defaultdict(list)
+
+    for index, wave in enumerate(wave_of):
+        waves[wave].append(index)
+
+    return [waves[wave] for wave in sorted(waves)]
+
+
+class RenameJournal:
+    """A JSON Lines record of a rename plan and which of its steps are done.
+
+    The first line holds the plan and a fingerprint of the table it was made
+    from, and each later line is the index of a finished step, flushed to
+    disk before the next rename starts.
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.fingerprint = None
+        self.steps = None
+        self.done = set()
+        self._file = None
+        self._lock = threading.Lock()
+
+        if os.path.exists(path):
+            self._load()
+
+
+    def _load(self):
+        with open(self.path, 'r', encoding = 'utf-8') as journal:
+            for line in journal:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue # partial line from an interrupted write
+
+                if "plan" in entry:
+                    self.fingerprint = entry["fingerprint"]
+                    self.steps = [RenameStep(*step) for step in entry["plan"]]
+                elif "done" in entry:
+                    self.done.add(entry["done"])
+
+
+    def start(self, fingerprint, steps):
+        """Begin a new journal for a plan, replacing any old one."""
+        self.fingerprint = fingerprint
+        self.steps = steps
+        self.done = set()
+
+        self._file = open(self.path, 'w', encoding = 'utf-8')
+        self._write({"fingerprint": fingerprint, "plan": [list(step) for step in steps]})
+
+
+    def resume(self):
+        """Reopen the journal to record the remaining steps."""
+        self._file = open(self.path, 'a', encoding = 'utf-8')
+        self._file.write("\n")                                                  # ends any partial line
+
+
+    def _write(self, entry):
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+
+    def mark_done(self, index):
+        with self._lock:
+            self._write({"done": index})
+            self.done.add(index)
+
+
+    def close(self):
+        if self._file is not None and not self._file.closed:
+            self._file.close()
+
+
+def table_fingerprint(directory, pairs):
+    """Return a hash identifying a rename table applied to a directory."""
+    digest = hashlib.sha256(os.path.abspath(directory).encode('utf-8'))
+
+    for source, target in pairs:
+        digest.update(b"\0" + source.encode('utf-8') + b"\0" + target.encode('utf-8'))
+
+    return digest.hexdigest()
+
+
+def run_step(directory, step, index, journal):
+    """Run one rename and journal it. Returns an error message, or None."""
+    source = os.path.join(directory, step.source)
+    target = os.path.join(directory, step.target)
+
+    try:
+        os.rename(source, target)                                               # Rename file from input_name to output_name
+    except OSError as error:
+        # interrupted after the rename but before it was journaled
+        if not os.path.lexists(source) and os.path.lexists(target):
+            journal.mark_done(index)
+            return None
+
+        return f"{step.source} -> {step.target} | {type(error).__name__}: {error}"
+
+    journal.mark_done(index)
+
+    return None
+
+
+def run_plan(directory, steps, journal, workers = 1):
+    """Run the steps that are not yet journaled as done, wave by wave.
+
+    With more than one worker each wave's renames are spread over a thread
+    pool, which pays off on network shares where every rename is a round
+    trip. The run stops after the first wave with a failure, so later
+    renames never act on a half-finished earlier one.
+
+    Returns:
+        list: Error messages; empty if every step succeeded.
+
+    """
+    pool = concurrent.futures.ThreadPoolExecutor(workers) if workers > 1 else None
+
+    try:
+        for wave in step_waves(steps):
+            remaining = [index for index in wave if index not in journal.done]
+
+            if pool is None:
+                errors = [run_step(directory, steps[index], index, journal) for index in remaining]
+            else:
+                errors = list(pool.map(lambda index: run_step(directory, steps[index], index, journal), remaining))
+
+            errors = [error for error in errors if error is not None]
+
+            if errors:
+                return errors
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    return []
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Rename files using a table of 'Input Filename' and 'Output Filename'.")
+    parser.add_argument("directory", nargs = "?", default = dir, help = "directory where the files are")
+    parser.add_argument("table", nargs = "?", default = renameTable, help = "rename table (.xlsx or .csv)")
+    parser.add_argument("--dry-run", action = "store_true", help = "check the table and print the plan without renaming")
+    parser.add_argument("--workers", type = int, default = 1,
+                        help = "renames run at once; more helps on network shares (default: 1)")
+    parser.add_argument("--journal", help = "journal used to resume an interrupted run, removed once every rename is done "
+                                            "(default: <table>.journal.jsonl)")
+    args = parser.parse_args(argv)
+
+    columns = ['Input Filename', 'Output Filename']
+    filenameTable = read_table(args.table, text_columns = columns, usecols = columns)
+
+    pairs = [(str(input_name), str(output_name)) for input_name, output_name
+             in zip(filenameTable["Input Filename"], filenameTable["Output Filename"])]
+
+    journal = RenameJournal(args.journal or args.table + ".journal.jsonl")
+    fingerprint = table_fingerprint(args.directory, pairs)
+
+    if journal.fingerprint == fingerprint:
+        steps = journal.steps                                                   # the directory is part renamed, so reuse the saved plan
+        print("Resuming: " + str(len(journal.done)) + " of " + str(len(steps)) + " renames already done")
+    else:
+        steps, problems = plan_renames(pairs, list_directory(args.directory))
+
+        if problems:
+            for problem in problems:
+                print(problem)
+
+            sys.exit(str(len(problems)) + " problems found, nothing renamed")
+
+    if args.dry_run:
+        for step in steps:
+            print(step.source + " -> " + step.target)
+
+        print("\n" + str(len(steps)) + " renames planned")
+        return
+
+    if journal.fingerprint == fingerprint:
+        journal.resume()
+    else:
+        journal.start(fingerprint, steps)
+
+    try:
+        errors = run_plan(args.directory, steps, journal, args.workers)
+    finally:
+        journal.close()
+
+    for error in errors:
+        print("Failed: " + error)
+
+    print("\n" + str(len(journal.done)) + " of " + str(len(steps)) + " renames done")
+
+    if errors:
+        sys.exit("Stopped after a failed rename; fix it and run again to resume")
 
-for index, row in filenameTable.iterrows():                 # For each row  
-    input_name = str(row["Input Filename"])                 # Input/original filename
-    output_name = str(row["Output Filename"])               # Output/new filename
+    os.remove(journal.path)                                                     # a rerun of the same table plans afresh
 
-    input_name = dir + "\\" + input_name                    # 
-    output_name = dir + "\\" + output_name                  # Append filename to directory
 
-    os.rename(input_name, output_name)                      # Rename file from input_name to output_name
+if __name__ == "__main__":
+    main()
@@ -1,50 +1,292 @@
 ## This file transforms tables from Azure JSON files into Excel
+##
+## Usage:  python "Table Extractor JSON v0.2.py" [JSON directory] [-o output.xlsx|.csv|.parquet] [--processes N]
+##
+## Tables are streamed one at a time from the JSON files straight into the output file, so memory use
+## is proportional to the largest single table rather than to the whole set of statements.
+## Each output row starts with its source file, table number and row within the table, then the cells.
+## A table that carries on over the next page, repeating its header row, is stitched back into one table
+## with the repeated header dropped (--no-stitch keeps every page as its own table).
 
+import argparse
+import collections
+import concurrent.futures
+import itertools
 import json
-import pprint as pp
-import pandas as pd
-import numpy as np
+import operator
 import os
 
-array = np.chararray(shape=(100000, 20), itemsize=1000, unicode = True)                     # array where values are stored
-docNumber = 0                                                                               # variable keeps track of document number
-index = 0                                                                                   # need this index to add new page rows to bottom of array
+import numpy as np
+
+from spreadsheetIO import write_rows                                                        # streaming .xlsx/.csv/.parquet writers
+
+try:
+    import orjson                                                                           # much faster parser, used when installed
+except ImportError:
+    orjson = None
 
 rootDir = r'C:\Users\om11\Documents\Work Tasks\(11) Jun 2022\Bank Statement Analysis - David Merritt\HSBC Type 1 That Failed\JSONs'
 
-dirTree = os.walk(rootDir)                                                                  # creates tree of directory and subpaths
+storage_location = 'C:\\Users\\om11\\Documents\\Work Tasks\\(11) Jun 2022\\Bank Statement Analysis - David Merritt\\Results\\'
+
 
-for dirPaths, subPaths, files in dirTree:                                                   # for each subpath
-    
-    for currentFile in files:                                                               # for each file
+def iter_json_files(root):
+    """Yield the path of every file under root, in a stable (sorted) order."""
+    for dirPaths, subPaths, files in os.walk(root):                                         # for each subpath
+        subPaths.sort()                                                                     # walk subdirectories in name order
 
-        docNumber += 1
+        for currentFile in sorted(files):                                                   # for each file
+            yield os.path.join(dirPaths, currentFile)
 
-        filePath = os.path.join(dirPaths, currentFile)                                      # get file path
-        
-        JSON_file = open(filePath)                                                          # open JSON file
 
-        JSON_data = json.load(JSON_file)                                                    # convert JSON to dict
+def load_json(path):
+    """Read one Azure form recognizer JSON file, with orjson if it is installed."""
+    with open(path, 'rb') as JSON_file:
+        data = JSON_file.read()
 
-        for i in range(len(JSON_data['tables'])):                                           # iterate through tables/pages
-    
-            for j in range(len(JSON_data['tables'][str(i+1)][0]['cells'])):                 # iterate through cells in table
-        
-                row = JSON_data['tables'][str(i+1)][0]['cells'][j]['row']
-                column = JSON_data['tables'][str(i+1)][0]['cells'][j]['column']
-                value = JSON_data['tables'][str(i+1)][0]['cells'][j]['text']
-                array[index + row, column] = value
+    if orjson is not None:
+        return orjson.loads(data)
 
-            index += JSON_data['tables'][str(i+1)][0]['rows']
+    return json.loads(data)
 
-print('Number of documents: ' + str(docNumber))
 
-df = pd.DataFrame(data=array, dtype = str, index=None, columns=None)                        # write array to pandas dataframe
+def iter_tables(JSON_data):
+    """Yield the tables of one document, in page order."""
+    tables = JSON_data['tables']
 
-storage_location = 'C:\\Users\\om11\\Documents\\Work Tasks\\(11) Jun 2022\\Bank Statement Analysis - David Merritt\\Results\\'
+    for i in range(len(tables)):                                                            # tables are keyed "1", "2", ...
+        yield tables[str(i + 1)][0]
+
+
+#: callable: Gathers the position and text of a cell.
+_cell_fields = operator.itemgetter('row', 'column', 'text')
+
+
+def table_grid(table):
+    """Lay out one table's cells as a rectangular grid of text.
+
+    The cells are gathered into flat row, column and text sequences and
+    scattered into the grid with a single NumPy assignment, so the work is
+    proportional to the number of cells. The grid has as many rows and
+    columns as the table declares, or as the cells reach if more. Positions
+    without a cell are empty strings; a merged cell's text is in its top
+    left position.
+
+    Args:
+        table (dict): A table from the JSON, with "rows", "columns" and "cells".
+
+    Returns:
+        numpy.ndarray: 2-D object array of cell text.
+
+    """
+    cells = table['cells']
+
+    if not cells:
+        return np.full((table.get('rows', 0), table.get('columns', 0)), '', dtype = object)
+
+    rows, columns, texts = zip(*map(_cell_fields, cells))
+
+    grid = np.full((max(table.get('rows', 0), max(rows) + 1),
+                    max(table.get('columns', 0), max(columns) + 1)), '', dtype = object)
+    grid[rows, columns] = texts
+
+    return grid
+
+
+def header_key(grid):
+    """Return the first row of a grid normalised for comparison, or None if it is blank."""
+    if len(grid) == 0:
+        return None
+
+    key = tuple(" ".join(str(text).split()).casefold() for text in grid[0])
+
+    return key if any(key) else None
+
+
+def iter_stitched_tables(tables, stitch = True):
+    """Group a document's page tables into whole tables.
+
+    A page table continues the table before it when it has the same columns
+    and starts with the same header row (ignoring case and spacing), as
+    statements do when a table runs over a page break. The repeated header
+    is dropped from the continuation. Empty tables are skipped.
+
+    Args:
+        tables (iterable): The document's tables, in page order.
+        stitch (bool): Join continued tables. If False every page table is
+            a table of its own.
+
+    Yields:
+        tuple: (table number, grid of the page's rows, number of the grid's
+            first row within the whole table).
+
+    """
+    number = 0
+    header = None
+    next_row = 0
+
+    for table in tables:
+        grid = table_grid(table)
+
+        if grid.size == 0:                                                                  # empty tables neither start nor break one
+            continue
+
+        if stitch and header is not None and grid.shape[1] == len(header) and header_key(grid) == header:
+            grid = grid[1:]                                                                 # repeated header row
+        else:
+            number += 1
+            header = header_key(grid)
+            next_row = 0
+
+        yield number, grid, next_row
+
+        next_row += len(grid)
+
+
+def extract_file(path, root = None, provenance = True, stitch = True):
+    """Return the rows of every table in one file, pages stacked one under another.
+
+    Args:
+        path (str): The JSON file.
+        root (str): Source files are recorded relative to this directory.
+        provenance (bool): Start each row with the source file, table number
+            and row number within the table.
+        stitch (bool): Join tables continued over a page break into one
+            table, dropping their repeated header rows.
+
+    Returns:
+        list: The rows of the file.
+
+    """
+    source = os.path.relpath(path, root) if root else path
+    rows = []
+
+    for number, grid, first_row in iter_stitched_tables(iter_tables(load_json(path)), stitch):
+        if provenance:
+            rows.extend([source, number, first_row + i] + row for i, row in enumerate(grid.tolist()))
+        else:
+            rows.extend(grid.tolist())
+
+    return rows
+
+
+#: namedtuple: The rows of one file, or the reason it could not be read (rows is None).
+FileResult = collections.namedtuple("FileResult", ["path", "rows", "error"])
+
+
+def _extract_chunk(paths, root, provenance, stitch):
+    results = []
+
+    for path in paths:
+        try:
+            results.append(FileResult(path, extract_file(path, root, provenance, stitch), None))
+        except Exception as error:
+            results.append(FileResult(path, None, f"{type(error).__name__}: {error}"))
+
+    return results
+
+
+def _chunks(paths, chunksize):
+    iterator = iter(paths)
+
+    while True:
+        chunk = list(itertools.islice(iterator, chunksize))
+
+        if not chunk:
+            return
+
+        yield chunk
+
+
+def extract_files(paths, root = None, provenance = True, processes = None, chunksize = 16, max_pending = None,
+                  stitch = True):
+    """Read and lay out many files across a pool of worker processes.
+
+    Files are parsed in chunks by the workers, and the results are yielded in
+    input order whatever order the workers finish in, so the output is the
+    same from run to run. At most max_pending chunks (default: two per
+    process) are in flight at once, so memory stays bounded.
+
+    Args:
+        paths (iterable): JSON files. Consumed lazily.
+        root (str): Source files are recorded relative to this directory.
+        provenance (bool): Start each row with the source file, table number
+            and row number within the table.
+        processes (int): Worker processes. Defaults to the number of CPUs;
+            1 reads the files in this process.
+        chunksize (int): Files sent to a worker at a time.
+        max_pending (int): Chunks allowed in flight at once.
+        stitch (bool): Join tables continued over a page break.
+
+    Yields:
+        FileResult: One per file.
+
+    """
+    processes = processes or os.cpu_count() or 1
+    chunks = _chunks(paths, chunksize)
+
+    if processes == 1:
+        for chunk in chunks:
+            yield from _extract_chunk(chunk, root, provenance, stitch)
+        return
+
+    max_pending = max_pending or 2 * processes
+
+    with concurrent.futures.ProcessPoolExecutor(processes) as pool:
+        pending = collections.deque(pool.submit(_extract_chunk, chunk, root, provenance, stitch)
+                                    for chunk in itertools.islice(chunks, max_pending))
+
+        while pending:
+            future = pending.popleft()
+
+            for chunk in itertools.islice(chunks, 1):
+                pending.append(pool.submit(_extract_chunk, chunk, root, provenance, stitch))
+
+            yield from future.result()
+
+
+def iter_rows(results, failures = None):
+    """Yield the rows of each FileResult, adding files that failed to failures."""
+    for result in results:
+        if result.error is None:
+            yield from result.rows
+        else:
+            print("Failed: " + result.path + " | " + result.error)
+
+            if failures is not None:
+                failures.append(result)
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Stack the tables in Azure form recognizer JSON files into one sheet.")
+    parser.add_argument("root", nargs = "?", default = rootDir, help = "directory of JSON files")
+    parser.add_argument("-o", "--output", help = "output .xlsx, .csv or .parquet file (default: ask for a name)")
+    parser.add_argument("--chunksize", type = int, default = 10000, help = "rows written at a time (default: 10000)")
+    parser.add_argument("--columns", type = int, help = "number of columns in a .parquet output (default: widest row in the first chunk)")
+    parser.add_argument("--processes", type = int, default = None, help = "worker processes reading files (default: one per CPU)")
+    parser.add_argument("--files-per-task", type = int, default = 16, help = "files sent to a worker at a time (default: 16)")
+    parser.add_argument("--provenance", action = argparse.BooleanOptionalAction, default = True,
+                        help = "start each row with its source file, table number and row within the table")
+    parser.add_argument("--stitch", action = argparse.BooleanOptionalAction, default = True,
+                        help = "join tables continued over a page break and drop their repeated header rows")
+    args = parser.parse_args(argv)
+
+    if args.output is None:
+        filename = input("Please enter filename: ")                                         # enter name
+        args.output = storage_location + filename + '.xlsx'
+
+    paths = list(iter_json_files(args.root))
+
+    print('Number of documents: ' + str(len(paths)))
+
+    failures = []
+    results = extract_files(paths, args.root, args.provenance, args.processes, args.files_per_task, stitch = args.stitch)
+
+    written = write_rows(iter_rows(results, failures), args.output, args.chunksize, args.columns)   # write to excel as rows are read
+
+    print(str(written) + " rows written to " + args.output + ", " + str(len(failures)) + " files failed")
+    print("COMPLETE")
 
-filename = input("Please enter filename: ")                                                 # enter name
-    
-df.to_excel(storage_location + filename + '.xlsx', header=False, index=False)               # write to excel
 
-print("COMPLETE")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
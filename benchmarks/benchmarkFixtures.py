@@ -0,0 +1,453 @@
+## Generated inputs for the benchmarks: a stub Companies House API and its bulk snapshot, CoT documents, Azure table JSON and file trees ##
+
+import csv
+import hashlib
+import html
+import io
+import json
+import os
+import random
+import threading
+import time
+import urllib.parse
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubCompaniesHouse:
+    """A local stand-in for the Companies House API.
+
+    Serves company profiles, paged officer and charge lists and company
+    searches, with a fixed delay per request and, optionally, the API's
+    fixed-window rate limit: every response carries the X-Ratelimit headers,
+    and requests over the limit get 429 with Retry-After.
+
+    Company numbers ending in "99" are not found (404).
+
+    Attributes:
+        url (str): Scheme, host and port to use as the client's api_root.
+        requests (int): Requests served, including throttled ones.
+        throttled (int): Requests answered with 429.
+        not_modified (int): Requests answered with 304.
+
+    """
+
+    def __init__(self, latency = 0.005, rate_limit = None, rate_window = 300,
+                 officers = 3, charges = 2, etags = False):
+        """
+        Args:
+            latency (float): Seconds each response is delayed by.
+            rate_limit (int): Requests allowed per window. None for no limit.
+            rate_window (float): Length of the rate limit window in seconds.
+            officers (int): Officers listed for every company.
+            charges (int): Charges listed for every company.
+            etags (bool): Send an ETag with every 200 response, and answer
+                304 to a request whose If-None-Match still matches it.
+
+        """
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.officers = officers
+        self.charges = charges
+        self.etags = etags
+
+        self.requests = 0
+        self.throttled = 0
+        self.not_modified = 0
+
+        self._lock = threading.Lock()
+        self._window_start = time.time()
+        self._window_count = 0
+        self._server = None
+
+
+    def __enter__(self):
+        self.start()
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+    def start(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True                                      # headers and body are sent separately
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                status, body, headers = stub.respond(self.path, self.headers.get("If-None-Match"))
+                data = b"" if body is None else json.dumps(body).encode("utf-8")
+
+                time.sleep(stub.latency)
+
+                self.send_response(status)
+
+                for name, value in headers.items():
+                    self.send_header(name, value)
+
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target = self._server.serve_forever, daemon = True).start()
+
+        self.url = "http://127.0.0.1:" + str(self._server.server_address[1])
+
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+    def _rate_headers(self):
+        """Count a request against the window; return (allowed, headers)."""
+        with self._lock:
+            self.requests += 1
+
+            if self.rate_limit is None:
+                return True, {}
+
+            now = time.time()
+
+            if now - self._window_start >= self.rate_window:
+                self._window_start = now
+                self._window_count = 0
+
+            self._window_count += 1
+            reset = self._window_start + self.rate_window
+            allowed = self._window_count <= self.rate_limit
+
+            if not allowed:
+                self.throttled += 1
+
+            headers = {"X-Ratelimit-Limit": str(self.rate_limit),
+                       "X-Ratelimit-Remain": str(max(self.rate_limit - self._window_count, 0)),
+                       "X-Ratelimit-Reset": f"{reset:.3f}"}
+
+            if not allowed:
+                headers["Retry-After"] = str(max(int(reset - now + 0.999), 0))
+
+            return allowed, headers
+
+
+    def respond(self, path, if_none_match = None):
+        """Return (status, JSON body or None, headers) for a request path."""
+        allowed, headers = self._rate_headers()
+
+        if not allowed:
+            return 429, None, headers
+
+        status, body, headers = self.route(path, headers)
+
+        if self.etags and status == 200:
+            headers["ETag"] = '"' + hashlib.sha1(json.dumps(body, sort_keys = True).encode("utf-8")).hexdigest() + '"'
+
+            if if_none_match == headers["ETag"]:
+                with self._lock:
+                    self.not_modified += 1
+
+                return 304, None, headers
+
+        return status, body, headers
+
+
+    def route(self, path, headers):
+        """Return (status, JSON body, headers) for an allowed request."""
+        parsed = urllib.parse.urlsplit(path)
+        query = urllib.parse.parse_qs(parsed.query)
+        parts = parsed.path.strip("/").split("/")
+
+        if parts[:2] == ["search", "companies"]:
+            return 200, self.search(query.get("q", [""])[0], int(query.get("items_per_page", ["20"])[0])), headers
+
+        if parts[0] != "company" or len(parts) not in (2, 3):
+            return 404, {}, headers
+
+        number = parts[1]
+
+        if number.endswith("99"):
+            return 404, {}, headers
+
+        if len(parts) == 2:
+            return 200, self.profile(number), headers
+
+        start = int(query.get("start_index", ["0"])[0])
+        per_page = int(query.get("items_per_page", ["35"])[0])
+
+        if parts[2] == "officers":
+            items = [{"officer_role": "director", "name": f"DIRECTOR {number}-{i}"} for i in range(self.officers)]
+            return 200, {"items": items[start:start + per_page], "total_results": len(items)}, headers
+
+        if parts[2] == "charges":
+            items = [{"status": "outstanding", "classification": {"description": "legal charge"},
+                      "created_on": "2020-01-01", "delivered_on": "2020-01-02",
+                      "persons_entitled": [{"name": f"BANK {i}"}],
+                      "particulars": {"description": f"Land at plot {number}-{i}"}} for i in range(self.charges)]
+            return 200, {"items": items[start:start + per_page], "total_count": len(items)}, headers
+
+        return 404, {}, headers
+
+
+    def profile(self, number):
+        return {"company_name": f"EXAMPLE {number} LIMITED", "company_number": number,
+                "company_status": "active", "jurisdiction": "england-wales", "type": "ltd",
+                "has_insolvency_history": False,
+                "registered_office_address": {"address_line_1": f"{int(number) % 200 + 1} High Street",
+                                              "locality": "London", "postal_code": "EC1A 1AA"},
+                "links": {"self": f"/company/{number}", "officers": f"/company/{number}/officers",
+                          "charges": f"/company/{number}/charges", "insolvency": f"/company/{number}/insolvency"}}
+
+
+    def search(self, name, items_per_page):
+        seed = sum(name.encode("utf-8"))
+        items = [{"company_number": f"{(seed * 31 + i) % 10 ** 8:08d}", "title": f"{name.upper()} {suffix}",
+                  "company_status": "active"}
+                 for i, suffix in enumerate(["LIMITED", "HOLDINGS LIMITED", "GROUP PLC", "SERVICES LTD"])]
+
+        return {"items": items[:items_per_page]}
+
+
+def company_numbers(count, seed = 0):
+    """Return count company numbers with leading zeros, some not found and some repeated."""
+    rng = random.Random(seed)
+
+    return [f"{rng.randrange(10 ** 7):08d}" if i % 10 else "00000099" for i in range(count)]
+
+
+#: list: Header of the bulk company snapshot CSV, stray leading spaces included.
+SNAPSHOT_HEADER = ["CompanyName", " CompanyNumber", "RegAddress.CareOf", "RegAddress.POBox",
+                   "RegAddress.AddressLine1", " RegAddress.AddressLine2", "RegAddress.PostTown",
+                   "RegAddress.County", "RegAddress.Country", "RegAddress.PostCode", "CompanyCategory",
+                   "CompanyStatus", "CountryOfOrigin", "DissolutionDate", "IncorporationDate",
+                   "Accounts.AccountRefDay", "Accounts.AccountRefMonth", "Accounts.NextDueDate",
+                   "Accounts.LastMadeUpDate", "Accounts.AccountCategory", "Returns.NextDueDate",
+                   "Returns.LastMadeUpDate", "Mortgages.NumMortCharges", "Mortgages.NumMortOutstanding",
+                   "Mortgages.NumMortPartSatisfied", "Mortgages.NumMortSatisfied", "SICCode.SicText_1",
+                   "SICCode.SicText_2", "SICCode.SicText_3", "SICCode.SicText_4",
+                   "LimitedPartnerships.NumGenPartners", "LimitedPartnerships.NumLimPartners", "URI",
+                   "ConfStmtNextDueDate", "ConfStmtLastMadeUpDate"]
+
+
+def write_company_snapshot(path, numbers, seed = 0):
+    """Write a synthetic bulk company snapshot listing numbers; zipped if path ends in .zip.
+
+    Numbers ending in "99" are left out, as they are by the stub API.
+
+    """
+    rng = random.Random(seed)
+    categories = ["Private Limited Company", "Public Limited Company", "Limited Liability Partnership",
+                  "PRI/LTD BY GUAR/NSC (Private, limited by guarantee, no share capital)"]
+    statuses = ["Active"] * 8 + ["Liquidation", "Active - Proposal to Strike off"]
+    rows = []
+
+    for number in dict.fromkeys(numbers):
+        if number.endswith("99"):
+            continue
+
+        charges = rng.choice([0, 0, 0, 1, 3])
+        row = dict.fromkeys(SNAPSHOT_HEADER, "")
+        row.update({"CompanyName": f"EXAMPLE {number} LIMITED", " CompanyNumber": number,
+                    "RegAddress.AddressLine1": f"{rng.randint(1, 200)} High Street",
+                    " RegAddress.AddressLine2": rng.choice(["", "Floor 2"]),
+                    "RegAddress.PostTown": "LONDON", "RegAddress.Country": "ENGLAND",
+                    "RegAddress.PostCode": "EC1A 1AA", "CompanyCategory": rng.choice(categories),
+                    "CompanyStatus": rng.choice(statuses), "CountryOfOrigin": "United Kingdom",
+                    "IncorporationDate": f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(1990, 2023)}",
+                    "Mortgages.NumMortCharges": str(charges), "Mortgages.NumMortOutstanding": str(charges),
+                    "SICCode.SicText_1": rng.choice(["62012 - Business and domestic software development",
+                                                     "68209 - Other letting and operating of own or leased real estate",
+                                                     "None Supplied"]),
+                    "URI": f"http://business.data.gov.uk/id/company/{number}"})
+        rows.append(row)
+
+    text = io.StringIO(newline = "")
+    writer = csv.DictWriter(text, SNAPSHOT_HEADER)
+    writer.writeheader()
+    writer.writerows(rows)
+
+    if path.endswith(".zip"):
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr(os.path.basename(path)[:-4] + ".csv", text.getvalue())
+    else:
+        with open(path, "w", encoding = "utf-8", newline = "") as csv_file:
+            csv_file.write(text.getvalue())
+
+    return len(rows)
+
+
+def cot_text(i, filler = 200):
+    """Return the text of a synthetic Certificate of Title containing every CoT heading."""
+    pad = ("Lorem ipsum dolor sit amet. " * filler) + "\n"
+
+    return f"""CERTIFICATE OF TITLE
+Company means Tenant Co {i} Limited; and others
+{pad}
+Brief Description: Land at plot {i}
+Tenure: leasehold
+Registered Title Number: AB{i}
+Conveyancing notes
+Contractual term expiry date: 1 January 20{i % 90 + 10}
+Options and rights of first refusal
+{pad}Disclosures: Tenants Right to Terminate on notice {i}
+1995 Act
+Charges
+{pad}Disclosures: charge to Bank {i}
+Agreements
+Original annual rent including details of any premium paid: £{i}000
+Current annual rent: £{i}500
+Rent review frequency: 5 years
+Remaining rent review dates: none
+Summary of the rights granted to the tenant: access {i}
+Summary of the rights reserved to the landlord: drainage
+Specified insured risks
+Name and address of present landlord, provided by the Company: Landlord {i} Ltd
+Name and address of any present guarantor of the tenant: Parent {i} plc
+Alienation
+{pad}Disclosures: change of control {i}
+Insurance
+Access
+Disclosures: via public road
+Benefits
+Pending applications
+Disclosures: none
+Planning agreements
+No other material matters
+Disclosures: indemnity {i}
+SCHEDULE 5
+LIMITATION OF LIABILITY
+Liability capped at £{i}m
+Schedule 1
+""" + pad * 5
+
+
+def write_docx(path, text):
+    """Write text to a minimal .docx, one paragraph per line."""
+    paragraphs = "".join(f'<w:p><w:r><w:t xml:space="preserve">{html.escape(line)}</w:t></w:r></w:p>'
+                         for line in text.split("\n"))
+    document = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+                f'<w:body>{paragraphs}</w:body></w:document>')
+
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as docx:
+        docx.writestr("[Content_Types].xml",
+                      '<?xml version="1.0"?><Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                      '<Default Extension="xml" ContentType="application/xml"/></Types>')
+        docx.writestr("word/document.xml", document)
+
+
+def write_cot_documents(directory, count, filler = 200):
+    """Write count synthetic CoT documents; return their paths."""
+    os.makedirs(directory, exist_ok = True)
+    paths = []
+
+    for i in range(count):
+        path = os.path.join(directory, f"cot{i:05d}.docx")
+        write_docx(path, cot_text(i, filler))
+        paths.append(path)
+
+    return paths
+
+
+def azure_document(seed, pages = 3, rows = 40, columns = 6):
+    """Return a synthetic Azure form recognizer result with one table per page."""
+    rng = random.Random(seed)
+    tables = {}
+
+    for page in range(1, pages + 1):
+        table_rows = rng.randint(rows // 2, rows)
+        table_columns = rng.randint(3, columns)
+        cells = [{"row": row, "column": column, "rowSpan": 1, "columnSpan": 1,
+                  "text": f"{seed}/{page}/{row}/{column} {rng.random():.2f}"}
+                 for row in range(table_rows) for column in range(table_columns) if rng.random() > 0.1]
+
+        tables[str(page)] = [{"rows": table_rows, "columns": table_columns, "cells": cells}]
+
+    return {"tables": tables}
+
+
+def write_azure_json(directory, files, subdirectories = 4, **table_options):
+    """Write files synthetic Azure JSON results spread over subdirectories; return their paths."""
+    paths = []
+
+    for i in range(files):
+        subdirectory = os.path.join(directory, f"batch{i % subdirectories}")
+        os.makedirs(subdirectory, exist_ok = True)
+
+        path = os.path.join(subdirectory, f"statement{i:06d}.json")
+
+        with open(path, "w", encoding = "utf-8") as json_file:
+            json.dump(azure_document(i, **table_options), json_file)
+
+        paths.append(path)
+
+    return paths
+
+
+def write_file_tree(directory, files, fanout = 8, depth = 2, duplicates = 0.05, seed = 0):
+    """Create a tree of empty files; return their names.
+
+    Files are spread over fanout ** depth leaf directories. A fraction of the
+    names (duplicates) also appear in a second directory.
+
+    """
+    rng = random.Random(seed)
+    leaves = [directory]
+
+    for level in range(depth):
+        leaves = [os.path.join(parent, f"d{level}{n}") for parent in leaves for n in range(fanout)]
+
+    for leaf in leaves:
+        os.makedirs(leaf, exist_ok = True)
+
+    names = []
+
+    for i in range(files):
+        name = f"file{i:07d}.pdf"
+        names.append(name)
+        open(os.path.join(rng.choice(leaves), name), "wb").close()
+
+        if rng.random() < duplicates:
+            open(os.path.join(rng.choice(leaves), name), "wb").close()
+
+    return names
+
+
+def write_flat_directory(directory, files):
+    """Create files empty files in one directory; return their names."""
+    os.makedirs(directory, exist_ok = True)
+    names = [f"scan{i:07d}.pdf" for i in range(files)]
+
+    for name in names:
+        open(os.path.join(directory, name), "wb").close()
+
+    return names
+
+
+def rename_table(names, swaps = 0.1, seed = 0):
+    """Return (input, output) pairs renaming every name, with a share of pairwise swaps."""
+    rng = random.Random(seed)
+    names = list(names)
+    rng.shuffle(names)
+
+    swap_count = int(len(names) * swaps) // 2 * 2
+    pairs = []
+
+    for i in range(0, swap_count, 2):
+        pairs.append((names[i], names[i + 1]))
+        pairs.append((names[i + 1], names[i]))
+
+    pairs.extend((name, "renamed-" + name) for name in names[swap_count:])
+
+    return pairs
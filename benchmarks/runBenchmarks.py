@@ -0,0 +1,580 @@
+## Benchmarks every pipeline in the repository against generated, offline fixtures ##
+##
+## Usage:  python benchmarks/runBenchmarks.py [--only NAME ...] [--scale 1.0] [--repeat 3]
+##         python benchmarks/runBenchmarks.py --save-baseline            (after a change that is meant to be slower)
+##
+## Each benchmark reports throughput, latency percentiles and peak Python memory (tracemalloc), and is compared
+## against benchmarks/baseline.json. The exit status is 1 if any benchmark regressed by more than --tolerance.
+## Baselines are machine specific: save one on the machine the comparison runs on.
+
+import argparse
+import asyncio
+import contextlib
+import gc
+import importlib.util
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+
+sys.path[:0] = [BENCHMARK_DIR, REPO_DIR, os.path.join(REPO_DIR, "CompaniesHouse")]
+
+import benchmarkFixtures as fixtures
+
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, "baseline.json")
+KEY = "benchmark-key"
+
+#: dict: Benchmark setup functions by name, in the order they run.
+BENCHMARKS = {}
+
+
+def benchmark(name, unit):
+    """Register a benchmark.
+
+    The decorated function is called as setup(workdir, scale, stack) before
+    every timed run. It builds the fixtures (not timed), registers any
+    cleanup on the ExitStack, and returns the function to time. That function
+    returns (items processed, per-item latencies in seconds or None, dict of
+    extra figures to report).
+
+    """
+    def register(setup):
+        BENCHMARKS[name] = (setup, unit)
+        return setup
+
+    return register
+
+
+def load_script(filename, module_name):
+    """Import a script whose file name is not a valid module name."""
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(REPO_DIR, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    return module
+
+
+def timed_calls(function, arguments):
+    """Call function on each argument; return the latency of every call."""
+    latencies = []
+
+    for argument in arguments:
+        tic = time.perf_counter()
+        function(argument)
+        latencies.append(time.perf_counter() - tic)
+
+    return latencies
+
+
+def percentile(sorted_values, fraction):
+    """Return the nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+
+    rank = max(int(round(fraction * len(sorted_values) + 0.5)) - 1, 0)
+
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def unlimited_bucket():
+    from CompaniesHouseRateLimiter import TokenBucket
+
+    return TokenBucket(capacity = 10 ** 9, period = 1)
+
+
+@benchmark("ch_profiles_sync", "companies")
+def bench_ch_profiles_sync(workdir, scale, stack):
+    from CompaniesHouseService import CompaniesHouseService
+
+    stub = stack.enter_context(fixtures.StubCompaniesHouse(latency = 0.005))
+    api = stack.enter_context(CompaniesHouseService(KEY, api_root = stub.url, rate_limiter = unlimited_bucket()))
+    numbers = fixtures.company_numbers(int(200 * scale))
+
+    def run():
+        latencies = timed_calls(api.get_company_profile, numbers)
+        return len(numbers), latencies, {"requests": stub.requests}
+
+    return run
+
+
+@benchmark("ch_details_async", "companies")
+def bench_ch_details_async(workdir, scale, stack):
+    from AsyncCompaniesHouseService import AsyncCompaniesHouseService
+
+    stub = stack.enter_context(fixtures.StubCompaniesHouse(latency = 0.02))
+    numbers = list(dict.fromkeys(fixtures.company_numbers(int(200 * scale))))
+
+    async def fetch():
+        async with AsyncCompaniesHouseService(KEY, concurrency = 20, api_root = stub.url,
+                                              rate_limiter = unlimited_bucket()) as api:
+            await api.get_many_company_details(numbers, officers = True, charges = True)
+            return [timing.elapsed for timing in api.request_timings]
+
+    def run():
+        latencies = asyncio.run(fetch())
+        return len(numbers), latencies, {"requests": stub.requests}
+
+    return run
+
+
+@benchmark("ch_rate_limited", "companies")
+def bench_ch_rate_limited(workdir, scale, stack):
+    from CompaniesHouseRateLimiter import TokenBucket
+    from CompaniesHouseService import CompaniesHouseService
+
+    # the client's bucket matches the stub's window, so nothing should be throttled
+    stub = stack.enter_context(fixtures.StubCompaniesHouse(latency = 0.002, rate_limit = 50, rate_window = 1))
+    api = stack.enter_context(CompaniesHouseService(KEY, api_root = stub.url,
+                                                    rate_limiter = TokenBucket(capacity = 50, period = 1,
+                                                                               api_window = 1)))
+    numbers = fixtures.company_numbers(int(120 * scale), seed = 1)
+
+    def run():
+        latencies = timed_calls(api.get_company_profile, numbers)
+        return len(numbers), latencies, {"requests": stub.requests, "throttled": stub.throttled}
+
+    return run
+
+
+class FakeClock:
+    """A clock that only moves when something sleeps on it."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += max(seconds, 0)
+
+
+@benchmark("rate_limiter_fake_clock", "requests")
+def bench_rate_limiter_fake_clock(workdir, scale, stack):
+    from CompaniesHouseRateLimiter import TokenBucket
+
+    count = int(120000 * scale)
+    quota, window = 600, 300
+
+    # a simulated API counting requests in fixed windows and answering with its rate limit headers
+    def run():
+        clock = FakeClock()
+        bucket = TokenBucket(clock = clock, sleep = clock.sleep, wall_clock = clock)
+        window_start = 0.0
+        window_count = 0
+        throttled = 0
+
+        for _ in range(count):
+            bucket.acquire()
+
+            if clock.now - window_start >= window:
+                window_start += window * ((clock.now - window_start) // window)
+                window_count = 0
+
+            window_count += 1
+            throttled += window_count > quota
+
+            bucket.update_from_headers({"X-Ratelimit-Limit": str(quota),
+                                        "X-Ratelimit-Remain": str(max(quota - window_count, 0)),
+                                        "X-Ratelimit-Reset": str(window_start + window)})
+
+        per_window = count / (clock.now // window + 1)
+
+        return count, None, {"per_window": round(per_window, 1), "quota_share": round(per_window / quota, 3),
+                             "throttled": throttled}
+
+    return run
+
+
+@benchmark("ch_name_resolution", "names")
+def bench_ch_name_resolution(workdir, scale, stack):
+    from CompaniesHouseService import CompaniesHouseService
+
+    stub = stack.enter_context(fixtures.StubCompaniesHouse(latency = 0.005))
+    api = stack.enter_context(CompaniesHouseService(KEY, api_root = stub.url, rate_limiter = unlimited_bucket()))
+    names = [f"Tenant Co {i % int(50 * scale)} Limited" if i % 3 else f"TENANT CO {i % int(50 * scale)} LTD."
+             for i in range(int(300 * scale))]
+
+    def run():
+        api.resolve_company_names(names)
+        return len(names), None, {"searches": stub.requests}
+
+    return run
+
+
+@benchmark("snapshot_import", "companies")
+def bench_snapshot_import(workdir, scale, stack):
+    from CompaniesHouseSnapshot import build_snapshot_index
+
+    snapshot = os.path.join(workdir, "BasicCompanyDataAsOneFile-2024-05-01.zip")
+    companies = fixtures.write_company_snapshot(snapshot, fixtures.company_numbers(int(50000 * scale), seed = 2))
+    index = os.path.join(workdir, "snapshot.sqlite")
+
+    def run():
+        build_snapshot_index([snapshot], index)
+        return companies, None, {"index_mb": round(os.path.getsize(index) / 2 ** 20, 2)}
+
+    return run
+
+
+@benchmark("ch_profiles_snapshot", "companies")
+def bench_ch_profiles_snapshot(workdir, scale, stack):
+    from CompaniesHouseService import CompaniesHouseService
+    from CompaniesHouseSnapshot import SnapshotIndex, build_snapshot_index
+
+    numbers = [number for number in fixtures.company_numbers(int(20000 * scale), seed = 3) if not number.endswith("99")]
+    snapshot = os.path.join(workdir, "snapshot.csv")
+    fixtures.write_company_snapshot(snapshot, numbers)
+    build_snapshot_index([snapshot], os.path.join(workdir, "snapshot.sqlite"))
+
+    # every number is indexed, so the stub should see no requests
+    stub = stack.enter_context(fixtures.StubCompaniesHouse(latency = 0.005))
+    index = stack.enter_context(SnapshotIndex(os.path.join(workdir, "snapshot.sqlite")))
+    api = stack.enter_context(CompaniesHouseService(KEY, api_root = stub.url, rate_limiter = unlimited_bucket(),
+                                                    snapshot = index))
+
+    def run():
+        latencies = timed_calls(api.get_company_profile, numbers)
+        return len(numbers), latencies, {"requests": stub.requests}
+
+    return run
+
+
+@benchmark("cot_regex", "documents")
+def bench_cot_regex(workdir, scale, stack):
+    cot = load_script("CoTExtractor.py", "CoTExtractor")
+
+    engine = cot.default_engine()
+    texts = [fixtures.cot_text(i) for i in range(int(300 * scale))]
+
+    def run():
+        return len(texts), timed_calls(engine.extract, texts), {}
+
+    return run
+
+
+@benchmark("cot_documents", "documents")
+def bench_cot_documents(workdir, scale, stack):
+    cot = load_script("CoTExtractor.py", "CoTExtractor")
+    from docxTextCache import TextCache
+
+    engine = cot.default_engine()
+    paths = fixtures.write_cot_documents(os.path.join(workdir, "cot"), int(150 * scale))
+    text_cache = TextCache(os.path.join(workdir, "text-cache"), reader = "stream")
+
+    # every document is read once, through the streaming reader into a cold text cache
+    def run():
+        results = []
+        latencies = timed_calls(lambda path: results.append(cot.extract_document(path, engine, text_cache)), paths)
+        failed = sum(result.error is not None for result in results)
+        return len(paths), latencies, {"failed": failed}
+
+    return run
+
+
+def cot_batch_benchmark(processes):
+    """Register a benchmark of extract_batch over the .docx corpus with a fixed number of worker processes."""
+
+    @benchmark(f"cot_batch_{processes}p", "documents")
+    def bench_cot_batch(workdir, scale, stack):
+        import CoTExtractor as cot                                              # imported, not loaded, so workers can unpickle its functions
+
+        paths = fixtures.write_cot_documents(os.path.join(workdir, "cot"), int(600 * scale))
+
+        # pool start-up is timed too, as every CoTExtractor run pays for it
+        def run():
+            results = list(cot.extract_batch(paths, processes, reader = "stream"))
+            failed = sum(result.error is not None for result in results)
+            return len(paths), None, {"processes": processes, "cpus": os.cpu_count(), "failed": failed}
+
+        return run
+
+
+# the same corpus at each size of pool shows how extraction scales with processes
+for cot_batch_processes in (1, 2, 4):
+    cot_batch_benchmark(cot_batch_processes)
+
+
+@benchmark("cot_worker", "documents")
+def bench_cot_worker(workdir, scale, stack):
+    import http.client
+    import threading
+    import cotWorker
+
+    paths = fixtures.write_cot_documents(os.path.join(workdir, "docs"), int(150 * scale))
+    worker = cotWorker.CotWorker()
+    server = cotWorker.make_server(worker, port = 0)
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+    stack.callback(server.server_close)
+    stack.callback(server.shutdown)
+
+    connection = http.client.HTTPConnection("127.0.0.1", server.server_address[1])
+    stack.callback(connection.close)
+
+    # one document per request, as the intake system sends them
+    def post(path):
+        connection.request("POST", "/extract", body = json.dumps({"path": path}),
+                           headers = {"Content-Type": "application/json"})
+        connection.getresponse().read()
+
+    def run():
+        latencies = timed_calls(post, paths)
+        return len(paths), latencies, {"extracted": worker.extracted}
+
+    return run
+
+
+@benchmark("table_extract", "files")
+def bench_table_extract(workdir, scale, stack):
+    tables = load_script("Table Extractor JSON v0.2.py", "tableExtractor")
+
+    root = os.path.join(workdir, "json")
+    paths = fixtures.write_azure_json(root, int(300 * scale))
+    output = os.path.join(workdir, "tables.csv")
+
+    def run():
+        results = tables.extract_files(paths, root, processes = 1)
+        rows = tables.write_rows(tables.iter_rows(results), output)
+        return len(paths), None, {"rows": rows}
+
+    return run
+
+
+@benchmark("spreadsheet_xlsx", "rows")
+def bench_spreadsheet_xlsx(workdir, scale, stack):
+    import pandas as pd
+    import spreadsheetIO
+
+    rows = int(20000 * scale)
+    df = pd.DataFrame({"Company Number": [f"{n:08d}" for n in range(rows)],
+                       "Company Name": [f"EXAMPLE {n} LIMITED" for n in range(rows)],
+                       "Value": range(rows)})
+    path = os.path.join(workdir, "table.xlsx")
+
+    def run():
+        spreadsheetIO.write_table(df, path, index = False)
+        read = spreadsheetIO.read_table(path, text_columns = ["Company Number"])
+        return rows, None, {"read_back": len(read)}
+
+    return run
+
+
+@benchmark("delete_files", "files")
+def bench_delete_files(workdir, scale, stack):
+    deleter = load_script("deleteFiles.py", "deleteFiles")
+
+    root = os.path.join(workdir, "tree")
+    names = fixtures.write_file_tree(root, int(20000 * scale))
+    requested = names[::3] + ["missing-file.pdf"]
+
+    def run():
+        index = deleter.build_name_index(root)
+        to_delete, not_found, duplicates = deleter.resolve_names(requested, index)
+        failed = deleter.delete_paths(to_delete)
+        return len(names), None, {"deleted": len(to_delete) - len(failed), "not_found": len(not_found)}
+
+    return run
+
+
+@benchmark("rename_files", "files")
+def bench_rename_files(workdir, scale, stack):
+    renamer = load_script("Rename Files.py", "renameFiles")
+
+    directory = os.path.join(workdir, "flat")
+    pairs = fixtures.rename_table(fixtures.write_flat_directory(directory, int(3000 * scale)))
+    journal_path = os.path.join(workdir, "rename.journal.jsonl")
+
+    def run():
+        steps, problems = renamer.plan_renames(pairs, renamer.list_directory(directory))
+        journal = renamer.RenameJournal(journal_path)
+        journal.start("benchmark", steps)
+
+        try:
+            errors = renamer.run_plan(directory, steps, journal)
+        finally:
+            journal.close()
+
+        return len(pairs), None, {"steps": len(steps), "errors": len(errors) + len(problems)}
+
+    return run
+
+
+def run_once(setup, scale, trace_memory = False):
+    """Build fresh fixtures and run a benchmark once.
+
+    Returns:
+        tuple: (seconds, items, latencies, extra, peak bytes or None).
+
+    """
+    workdir = tempfile.mkdtemp(prefix = "benchmark-")
+
+    try:
+        with contextlib.ExitStack() as stack:
+            run = setup(workdir, scale, stack)
+            gc.collect()
+
+            if trace_memory:
+                tracemalloc.start()
+
+            tic = time.perf_counter()
+            items, latencies, extra = run()
+            seconds = time.perf_counter() - tic
+
+            peak = None
+
+            if trace_memory:
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+
+        return seconds, items, latencies, extra, peak
+    finally:
+        shutil.rmtree(workdir, ignore_errors = True)
+
+
+def measure(name, scale, repeat):
+    """Run a benchmark repeat times for speed and once more for memory.
+
+    Memory is traced in its own run because tracemalloc slows allocation
+    heavy code down. Time is the best of the repeats; percentiles are over
+    the latencies of every repeat.
+
+    Returns:
+        dict: The benchmark's figures.
+
+    """
+    setup, unit = BENCHMARKS[name]
+    runs = [run_once(setup, scale) for _ in range(repeat)]
+    peak = run_once(setup, scale, trace_memory = True)[4]
+
+    seconds, items, latencies, extra, _ = min(runs, key = lambda run: run[0])
+    all_latencies = sorted(latency for run in runs for latency in (run[2] or ()))
+
+    result = {"unit": unit, "items": items, "seconds": round(seconds, 4),
+              "throughput": round(items / seconds, 2) if seconds > 0 else None,
+              "peak_mb": round(peak / 1024 ** 2, 2)}
+
+    if all_latencies:
+        for label, fraction in (("p50_ms", 0.5), ("p95_ms", 0.95), ("p99_ms", 0.99)):
+            result[label] = round(percentile(all_latencies, fraction) * 1000, 3)
+
+    result.update(extra)
+
+    return result
+
+
+def compare(result, baseline, tolerance):
+    """Return a list of regressions of result against its baseline entry."""
+    regressions = []
+
+    if baseline is None:
+        return regressions
+
+    if baseline.get("throughput") and result["throughput"] < baseline["throughput"] * (1 - tolerance):
+        regressions.append(f"throughput {result['throughput']} < baseline {baseline['throughput']}")
+
+    if baseline.get("peak_mb") and result["peak_mb"] > max(baseline["peak_mb"] * (1 + tolerance), baseline["peak_mb"] + 1):
+        regressions.append(f"peak memory {result['peak_mb']} MB > baseline {baseline['peak_mb']} MB")
+
+    if baseline.get("p95_ms") and result.get("p95_ms") and result["p95_ms"] > baseline["p95_ms"] * (1 + tolerance) + 1:
+        regressions.append(f"p95 latency {result['p95_ms']} ms > baseline {baseline['p95_ms']} ms")
+
+    return regressions
+
+
+#: tuple: Result keys that are not extra figures reported by the benchmark itself.
+STANDARD_KEYS = ("unit", "items", "seconds", "throughput", "peak_mb", "p50_ms", "p95_ms", "p99_ms")
+
+
+def format_row(name, result, baseline):
+    latency = "" if "p50_ms" not in result else \
+        f"p50 {result['p50_ms']:8.2f}  p95 {result['p95_ms']:8.2f}  p99 {result['p99_ms']:8.2f} ms"
+    change = ""
+
+    if baseline and baseline.get("throughput"):
+        change = f"{(result['throughput'] / baseline['throughput'] - 1) * 100:+6.1f}% vs baseline"
+
+    extra = ", ".join(f"{key} {value}" for key, value in result.items() if key not in STANDARD_KEYS)
+
+    return (f"{name:20} {result['items']:7} {result['unit']:10} {result['seconds']:8.3f} s  "
+            f"{result['throughput']:10.1f}/s  {result['peak_mb']:8.2f} MB  {latency:42} {change:20} {extra}").rstrip()
+
+
+def parse_args(argv = None):
+    parser = argparse.ArgumentParser(description = "Benchmark the repository's pipelines against generated fixtures.")
+    parser.add_argument("--only", nargs = "+", choices = list(BENCHMARKS), help = "benchmarks to run (default: all)")
+    parser.add_argument("--scale", type = float, default = 1.0, help = "multiplier for the size of every fixture (default: 1)")
+    parser.add_argument("--repeat", type = int, default = 3, help = "timed runs per benchmark; the best is kept (default: 3)")
+    parser.add_argument("--baseline", default = DEFAULT_BASELINE, help = "baseline JSON to compare against")
+    parser.add_argument("--save-baseline", action = "store_true", help = "write these results as the new baseline")
+    parser.add_argument("--tolerance", type = float, default = 0.25,
+                        help = "fractional slowdown or memory growth treated as a regression (default: 0.25)")
+    parser.add_argument("--json", help = "also write the results to this JSON file")
+
+    return parser.parse_args(argv)
+
+
+def main(argv = None):
+    args = parse_args(argv)
+
+    baseline = {}
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding = "utf-8") as baseline_file:
+            saved = json.load(baseline_file)
+
+        if saved.get("scale") == args.scale:
+            baseline = saved["results"]
+        else:
+            print(f"Baseline was saved at scale {saved.get('scale')}, not {args.scale}: not comparing")
+
+    results = {}
+    regressions = {}
+
+    for name in args.only or BENCHMARKS:
+        try:
+            results[name] = measure(name, args.scale, args.repeat)
+        except ImportError as error:
+            print(f"{name:20} skipped: {error}")
+            continue
+
+        print(format_row(name, results[name], baseline.get(name)), flush = True)
+
+        found = compare(results[name], baseline.get(name), args.tolerance)
+
+        if found:
+            regressions[name] = found
+
+    for name, found in regressions.items():
+        for regression in found:
+            print("REGRESSION " + name + ": " + regression)
+
+    report = {"scale": args.scale, "python": sys.version.split()[0], "results": results}
+
+    if args.json:
+        with open(args.json, "w", encoding = "utf-8") as json_file:
+            json.dump(report, json_file, indent = 2)
+
+    if args.save_baseline:
+        if os.path.exists(args.baseline) and args.only:
+            with open(args.baseline, "r", encoding = "utf-8") as baseline_file:
+                saved = json.load(baseline_file)
+
+            if saved.get("scale") == args.scale:
+                report["results"] = {**saved["results"], **results}
+
+        with open(args.baseline, "w", encoding = "utf-8") as baseline_file:
+            json.dump(report, baseline_file, indent = 2)
+
+        print("Baseline saved to " + args.baseline)
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
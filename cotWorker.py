@@ -0,0 +1,406 @@
+## Resident CoT extraction worker: the field regexes stay compiled and the .docx readers imported between requests ##
+##
+## Usage:  python cotWorker.py [--port 8765] [--watch INBOX --results OUTBOX] [--store fields.json]
+##
+## HTTP (local only by default):
+##   GET  /health                                   worker status and counters
+##   POST /extract  {"paths": ["C:\\CoTs\\a.docx"]}  extract documents on disk
+##   POST /extract  {"text": "..."}                  extract already converted text
+##   POST /extract?name=a.docx  <raw .docx bytes>     extract an uploaded document
+## Every reply is JSON: {"results": [{"path", "fields", "error", "milliseconds", "reused"}, ...]}
+##
+## Watch mode polls the INBOX directories and extracts every .docx that appears or changes, writing
+## <OUTBOX>/<path under INBOX, without .docx>.json for each (under a folder per INBOX if several are watched). With --store, values of unchanged documents are reused across
+## restarts exactly as CoTExtractor.py --store does.
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from CoTExtractor import FIELDS, ResultStore, default_engine, document_stamp, find_documents
+from docxTextCache import READERS, TextCache
+
+
+class CotWorker:
+    """One warm extraction engine shared by the HTTP server and the directory watcher.
+
+    The engine, the text reader and (optionally) the text cache and result
+    store are built once, so a request only pays for reading its documents
+    and running the regexes. Documents are read concurrently, but the regexes
+    run for one document at a time, as they share the engine's counters.
+
+    Attributes:
+        engine (ExtractionEngine): Compiled patterns for every CoT field.
+        store (ResultStore): Values of earlier extractions, or None.
+        extracted (int): Documents extracted since the worker started.
+        reused (int): Documents answered from the store.
+        failed (int): Documents that could not be extracted.
+
+    """
+
+    def __init__(self, reader = 'docx2txt', text_cache_options = None, store_path = None):
+        """
+        Args:
+            reader (str): Text reader, a key of ``docxTextCache.READERS``.
+            text_cache_options (dict): TextCache arguments. If given,
+                document text is read through a TextCache built with them.
+            store_path (str): JSON ResultStore of earlier values, or None.
+
+        """
+        self.engine = default_engine()
+        self.read_bytes = READERS[reader]
+        self.read_text = TextCache(**text_cache_options).get_text if text_cache_options else READERS[reader]
+
+        if reader == 'docx2txt':
+            import docx2txt                                                     # imported now rather than on the first request
+
+        self.store = None
+
+        if store_path is not None:
+            self.store = ResultStore(store_path, reader)
+
+        self.extracted = 0
+        self.reused = 0
+        self.failed = 0
+        self.started = time.time()
+
+        self._lock = threading.Lock()
+        self._dirty = False
+
+
+    def _run(self, path, read):
+        """Extract one document with read(); return its result dict."""
+        tic = time.perf_counter()
+
+        try:
+            text = read()
+
+            with self._lock:
+                fields = self.engine.extract_fields(text)
+                self.extracted += 1
+        except Exception as error:
+            with self._lock:
+                self.failed += 1
+
+            return {"path": path, "fields": None, "error": f"{type(error).__name__}: {error}",
+                    "milliseconds": round((time.perf_counter() - tic) * 1000, 3), "reused": False}
+
+        return {"path": path, "fields": fields, "error": None,
+                "milliseconds": round((time.perf_counter() - tic) * 1000, 3), "reused": False}
+
+
+    def extract_path(self, path):
+        """Extract a document on disk, reusing stored values if it is unchanged."""
+        tic = time.perf_counter()
+
+        if self.store is not None:
+            with self._lock:
+                if not self.store.stale_labels(path, FIELDS):
+                    values = self.store.stored_values(path)
+                    self.reused += 1
+
+                    return {"path": path, "fields": {label: values[label] for label in self.engine.labels},
+                            "error": None, "milliseconds": round((time.perf_counter() - tic) * 1000, 3),
+                            "reused": True}
+
+        result = self._run(path, lambda: self.read_text(path))
+
+        if self.store is not None:
+            with self._lock:
+                if result["error"] is None:
+                    self.store.update(path, result["fields"], FIELDS)
+                else:
+                    self.store.forget(path)
+
+                self._dirty = True
+
+        return result
+
+
+    def extract_bytes(self, data, name = None):
+        """Extract an uploaded .docx held in memory."""
+        return self._run(name, lambda: self.read_bytes(io.BytesIO(data)))
+
+
+    def extract_text(self, text, name = None):
+        """Extract text that has already been converted from a document."""
+        return self._run(name, lambda: text)
+
+
+    def save(self):
+        """Write the store if anything has been extracted since it was last saved."""
+        with self._lock:
+            if self.store is not None and self._dirty:
+                self.store.save(FIELDS)
+                self._dirty = False
+
+
+    def status(self):
+        return {"status": "ok",
+                "uptime_seconds": round(time.time() - self.started, 1),
+                "fields": self.engine.labels,
+                "extracted": self.extracted,
+                "reused": self.reused,
+                "failed": self.failed,
+                "stored_documents": len(self.store.documents) if self.store is not None else None}
+
+
+class DirectoryWatcher:
+    """Polls directories and extracts each .docx that is new or has changed.
+
+    A file is only read once its stamp (mtime and size) is the same on two
+    polls in a row, so documents still being copied in are not read half
+    written. A document that fails is retried when it next changes.
+
+    """
+
+    def __init__(self, worker, directories, results_dir = None, interval = 1.0):
+        """
+        Args:
+            worker (CotWorker): Does the extraction.
+            directories (list): Directories to watch, recursively.
+            results_dir (str): Where to write each result, as .json at the
+                document's path relative to its watched directory. None only
+                logs them.
+            interval (float): Seconds between polls.
+
+        """
+        self.worker = worker
+        self.directories = directories
+        self.results_dir = results_dir
+        self.interval = interval
+
+        #: dict: Stamp of every file at the last poll, by path.
+        self.seen = {}
+
+        #: dict: Stamp each document was last extracted at, by path.
+        self.done = {}
+
+        #: dict: Folder of results_dir each watched directory's results go in, by directory.
+        self.prefixes = {directory: "" for directory in directories}
+
+        if len(directories) > 1:
+            names = [os.path.basename(os.path.abspath(directory)) for directory in directories]
+
+            for directory, name in zip(directories, names):
+                if names.count(name) > 1:                                       # e.g. two "Inbox" folders
+                    name += "-" + hashlib.sha1(os.path.abspath(directory).encode('utf-8')).hexdigest()[:8]
+
+                self.prefixes[directory] = name
+
+        if results_dir is not None:
+            os.makedirs(results_dir, exist_ok = True)
+
+
+    def poll(self):
+        """Extract every settled document that is new or changed; return their results."""
+        stamps = {}
+        roots = {}
+
+        for directory in self.directories:
+            for path in find_documents([directory]):
+                try:
+                    stamps[path] = document_stamp(path)
+                except OSError:                                                 # removed since it was listed
+                    continue
+
+                roots[path] = directory
+
+        ready = [path for path, stamp in stamps.items()
+                 if self.seen.get(path) == stamp and self.done.get(path) != stamp]
+        self.seen = stamps
+
+        results = []
+
+        for path in ready:
+            result = self.worker.extract_path(path)
+            self.done[path] = stamps[path]
+            results.append(result)
+
+            self.write_result(result, self.result_name(path, roots[path]))
+
+        if results:
+            self.worker.save()
+
+        return results
+
+
+    def result_name(self, path, directory):
+        """Return where under results_dir a watched document's result goes.
+
+        Documents are named by their path under the watched directory, so
+        a/x.docx and b/x.docx in one inbox do not overwrite each other.
+
+        """
+        if os.path.isdir(directory):
+            relative = os.path.relpath(path, directory)
+        else:
+            relative = os.path.basename(path)
+
+        return os.path.join(self.prefixes[directory], os.path.splitext(relative)[0] + ".json")
+
+
+    def write_result(self, result, name = None):
+        state = "Failed" if result["error"] else "Extracted"
+        print(f"{state}: {result['path']} ({result['milliseconds']} ms)" + (" | " + result["error"] if result["error"] else ""))
+
+        if self.results_dir is None:
+            return
+
+        name = name or os.path.splitext(os.path.basename(result["path"]))[0] + ".json"
+        path = os.path.join(self.results_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+
+        with open(path + ".tmp", 'w', encoding = 'utf-8') as result_file:
+            json.dump(result, result_file, indent = 2)
+
+        os.replace(path + ".tmp", path)                                         # readers never see a partial file
+
+
+    def run(self, stop = None):
+        """Poll until stop (a threading.Event) is set, or forever."""
+        stop = stop or threading.Event()
+
+        while not stop.is_set():
+            self.poll()
+            stop.wait(self.interval)
+
+
+def make_server(worker, host = '127.0.0.1', port = 8765):
+    """Return an HTTP server answering extraction requests with worker."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"                                           # keep-alive, so a client pays for one connection
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def reply(self, status, body):
+            data = json.dumps(body).encode('utf-8')
+
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if urllib.parse.urlsplit(self.path).path == "/health":
+                self.reply(200, worker.status())
+            else:
+                self.reply(404, {"error": "unknown path " + self.path})
+
+        def do_POST(self):
+            url = urllib.parse.urlsplit(self.path)
+
+            if url.path != "/extract":
+                self.reply(404, {"error": "unknown path " + self.path})
+                return
+
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+            if self.headers.get("Content-Type", "").startswith("application/json"):
+                try:
+                    request = json.loads(body)
+                except ValueError as error:
+                    self.reply(400, {"error": "invalid JSON: " + str(error)})
+                    return
+
+                if not isinstance(request, dict):
+                    self.reply(400, {"error": "expected a JSON object"})
+                    return
+
+                if "text" in request:
+                    results = [worker.extract_text(request["text"], request.get("name"))]
+                elif "paths" in request or "path" in request:
+                    paths = request.get("paths") or [request["path"]]
+
+                    if not isinstance(paths, list) or not all(isinstance(path, str) for path in paths):
+                        self.reply(400, {"error": '"paths" must be a list of strings'})
+                        return
+
+                    results = [worker.extract_path(path) for path in paths]
+                else:
+                    self.reply(400, {"error": 'expected "paths", "path" or "text"'})
+                    return
+            else:
+                name = urllib.parse.parse_qs(url.query).get("name", [None])[0]
+                results = [worker.extract_bytes(body, name)]
+
+            self.reply(200, {"results": results})
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Keep a CoT extraction worker running for HTTP requests and/or dropped files.")
+    parser.add_argument("--host", default = "127.0.0.1", help = "address to listen on (default: local only)")
+    parser.add_argument("--port", type = int, default = 8765, help = "HTTP port (default: 8765)")
+    parser.add_argument("--no-http", action = "store_true", help = "only watch directories")
+    parser.add_argument("--watch", action = "append", default = [], help = "directory to watch for .docx files (repeatable)")
+    parser.add_argument("--results", help = "directory to write watched documents' results to, as <name>.json")
+    parser.add_argument("--interval", type = float, default = 1.0, help = "seconds between polls of watched directories (default: 1)")
+    parser.add_argument("--store", help = "JSON file of values from earlier runs, reused for unchanged documents")
+    parser.add_argument("--save-interval", type = float, default = 10.0,
+                        help = "seconds between writes of the store while serving HTTP (default: 10)")
+    parser.add_argument("--text-cache", help = "directory to cache extracted document text in between runs")
+    parser.add_argument("--text-cache-mb", type = int, default = 1024, help = "size limit of the text cache (default: 1024)")
+    parser.add_argument("--fast-reader", action = "store_true",
+                        help = "stream the document body only, skipping headers and footers")
+    args = parser.parse_args(argv)
+
+    if args.no_http and not args.watch:
+        parser.error("--no-http needs at least one --watch directory")
+
+    reader = 'stream' if args.fast_reader else 'docx2txt'
+    text_cache_options = None
+
+    if args.text_cache:
+        text_cache_options = {"directory": args.text_cache, "max_bytes": args.text_cache_mb * 1024 * 1024,
+                              "reader": reader}
+
+    tic = time.perf_counter()
+    worker = CotWorker(reader, text_cache_options, args.store)
+    stop = threading.Event()
+    threads = []
+
+    print(f"Worker ready in {(time.perf_counter() - tic) * 1000:.0f} ms with {len(worker.engine.labels)} fields")
+
+    if args.watch:
+        watcher = DirectoryWatcher(worker, args.watch, args.results, args.interval)
+        threads.append(threading.Thread(target = watcher.run, args = (stop,), daemon = True))
+        print("Watching " + ", ".join(args.watch))
+
+    def autosave():
+        while not stop.wait(args.save_interval):
+            worker.save()
+
+    threads.append(threading.Thread(target = autosave, daemon = True))
+
+    for thread in threads:
+        thread.start()
+
+    try:
+        if args.no_http:
+            while True:
+                time.sleep(3600)
+        else:
+            server = make_server(worker, args.host, args.port)
+            print(f"Listening on http://{args.host}:{server.server_address[1]}")
+            server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        worker.save()
+
+
+if __name__ == "__main__":
+    main()
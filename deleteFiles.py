@@ -1,20 +1,153 @@
 ## This script deletes a series of files defined in an excel spreadsheet ##
+##
+## Usage:  python deleteFiles.py [directory] [spreadsheet] [--dry-run] [--workers N]
+##
+## The directory is walked once to index every filename, each name in the spreadsheet's 'Filename'
+## column is looked up in that index, and every file found (in any subdirectory) is deleted.
 
-import pandas as pd
+import argparse
+import collections
+import concurrent.futures
 import os
 
+from spreadsheetIO import read_table
+
 dir = r'C:\Users\om11\Documents\Grosvenor Liverpool\Indexed and Flattened Files - Leases Only'
 
-filesToDelete = pd.read_excel(r'C:\Users\om11\Documents\Grosvenor Liverpool\Files to delete - leases only.xlsx', dtype = {'Filename': str})
+spreadsheet = r'C:\Users\om11\Documents\Grosvenor Liverpool\Files to delete - leases only.xlsx'
+
+
+def build_name_index(root):
+    """Walk root once and return {filename: [paths]} for every file beneath it.
+
+    Directories are read with os.scandir, whose entries already know whether
+    they are files, so no extra stat call is made per file. Symlinked
+    directories are not followed.
+
+    """
+    index = collections.defaultdict(list)
+    stack = [root]
+
+    while stack:
+        directory = stack.pop()
+
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks = False):
+                    stack.append(entry.path)
+                elif entry.is_file():
+                    index[entry.name].append(entry.path)
+
+    for paths in index.values():
+        paths.sort()                                                            # same order whichever way the tree was walked
+
+    return index
+
+
+def resolve_names(names, index):
+    """Look every requested name up in the index.
+
+    Args:
+        names (iterable): Filenames to delete. Blanks and repeats are ignored.
+        index (dict): ``build_name_index`` output.
+
+    Returns:
+        tuple: (paths to delete, names not found, {name: paths} for names
+            found in more than one place).
+
+    """
+    to_delete = []
+    not_found = []
+    duplicates = {}
+
+    for name in dict.fromkeys(names):                                           # unique, in spreadsheet order
+        if not isinstance(name, str) or not name:
+            continue
+
+        paths = index.get(name)
+
+        if not paths:
+            not_found.append(name)
+            continue
+
+        if len(paths) > 1:
+            duplicates[name] = paths
+
+        to_delete.extend(paths)
+
+    return to_delete, not_found, duplicates
+
+
+def _remove_batch(paths):
+    failed = []
+
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError as error:
+            failed.append((path, f"{type(error).__name__}: {error}"))
+
+    return failed
+
+
+def delete_paths(paths, workers = 8, batch_size = 64):
+    """Delete paths in batches on a thread pool.
+
+    Deleting is dominated by the file system round trip, particularly on
+    network drives, so several batches are removed at once.
+
+    Returns:
+        list: (path, error) for every file that could not be deleted.
+
+    """
+    batches = [paths[start:start + batch_size] for start in range(0, len(paths), batch_size)]
+    failed = []
+
+    with concurrent.futures.ThreadPoolExecutor(max(1, workers)) as pool:
+        for batch_failures in pool.map(_remove_batch, batches):
+            failed.extend(batch_failures)
+
+    return failed
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Delete the files named in a spreadsheet's 'Filename' column.")
+    parser.add_argument("directory", nargs = "?", default = dir, help = "directory to search, including subdirectories")
+    parser.add_argument("spreadsheet", nargs = "?", default = spreadsheet, help = "spreadsheet with a 'Filename' column")
+    parser.add_argument("--column", default = "Filename", help = "column holding the filenames (default: Filename)")
+    parser.add_argument("--dry-run", action = "store_true", help = "list what would be deleted without deleting it")
+    parser.add_argument("--workers", type = int, default = 8, help = "files deleted in parallel (default: 8)")
+    parser.add_argument("--not-found-report", help = "write the names that were not found to this .txt file")
+    args = parser.parse_args(argv)
+
+    filesToDelete = read_table(args.spreadsheet, text_columns = [args.column], usecols = [args.column])
+
+    index = build_name_index(args.directory)
+    to_delete, not_found, duplicates = resolve_names(filesToDelete[args.column], index)
+
+    for name, paths in duplicates.items():
+        print("Found in " + str(len(paths)) + " places: " + name)
+
+    for path in to_delete:
+        print(("Would delete: " if args.dry_run else "Deleting: ") + path)
+
+    failed = [] if args.dry_run else delete_paths(to_delete, args.workers)
+
+    for path, error in failed:
+        print("Failed: " + path + " | " + error)
+
+    for name in not_found:
+        print("Not found: " + name)
+
+    if args.not_found_report:
+        with open(args.not_found_report, 'w', encoding = 'utf-8') as report:
+            report.writelines(name + "\n" for name in not_found)
+
+    count = len(to_delete) - len(failed)
+
+    print("\n" + str(count) + " files " + ("would be deleted" if args.dry_run else "deleted") + ", "
+          + str(len(not_found)) + " names not found, " + str(len(failed)) + " failed")
 
-count = 0
 
-for index, row in filesToDelete.iterrows():
-    for dirPaths, subDirs, files in os.walk(dir):
-        for currentFile in files:
-            if currentFile == row['Filename']:
-                print("Deleting: " + currentFile)
-                os.remove(os.path.join(dir, currentFile))
-                count += 1
-        
-print("\n" + str(count) + " files deleted")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+## This module extracts text from .docx files and caches it on disk, so re-running the CoT regexes skips parsing ##
+
+import hashlib
+import os
+import tempfile
+import xml.etree.ElementTree as ET
+import zipfile
+import zlib
+
+W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+
+def read_docx_text(path):
+    """Stream the body text out of a .docx file.
+
+    Reads word/document.xml straight from the zip with iterparse, producing the
+    same text as docx2txt.process for the document body, but without reading
+    headers, footers or images, and without building the whole XML tree.
+    Paragraph elements are cleared as soon as they end, so memory stays flat on
+    very long documents.
+
+    Args:
+        path (str): The .docx file.
+
+    Returns:
+        str: The document text, stripped of surrounding whitespace.
+
+    """
+    parts = []
+
+    with zipfile.ZipFile(path) as docx:
+        with docx.open('word/document.xml') as document:
+            for event, element in ET.iterparse(document, events = ('start', 'end')):
+                tag = element.tag
+
+                if event == 'start':
+                    if tag == W + 'p':
+                        parts.append('\n\n')
+                    elif tag == W + 'tab':
+                        parts.append('\t')
+                    elif tag == W + 'br' or tag == W + 'cr':
+                        parts.append('\n')
+
+                elif tag == W + 't':
+                    if element.text is not None:
+                        parts.append(element.text)
+
+                elif tag == W + 'p':
+                    element.clear()
+
+    return ''.join(parts).strip()
+
+
+def read_docx2txt(path):
+    """Extract text with docx2txt, including headers and footers."""
+    import docx2txt
+
+    return docx2txt.process(path)
+
+
+#: dict: Text readers available to the cache, by name.
+READERS = {'docx2txt': read_docx2txt, 'stream': read_docx_text}
+
+
+class TextCache:
+    """A content-addressed, size-bounded on-disk cache of extracted text.
+
+    Each entry is the zlib-compressed UTF-8 text of one document, stored in a
+    file named after its key. The key is either the file's SHA-256 hash (robust
+    to renames and copies) or its path, modification time and size (no need to
+    read the file to look it up), combined with the name of the reader.
+
+    Reading an entry refreshes its modification time, and when the cache grows
+    past max_bytes the least recently used entries are deleted. Entries are
+    written atomically, so several worker processes can share one cache.
+
+    Attributes:
+        hits (int): Documents served from the cache.
+        misses (int): Documents that had to be parsed.
+
+    """
+
+    def __init__(self, directory, max_bytes = 1024 ** 3, key_mode = 'stat', reader = 'docx2txt'):
+        """
+        Args:
+            directory (str): Where the cache files are kept. Created if needed.
+            max_bytes (int): Size the cache is trimmed back to.
+            key_mode (str): 'stat' for path, mtime and size, or 'hash' for the
+                SHA-256 of the file contents.
+            reader (str): Name of the text reader in READERS.
+
+        """
+        if key_mode not in ('stat', 'hash'):
+            raise ValueError("key_mode must be 'stat' or 'hash'")
+
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.key_mode = key_mode
+        self.reader = reader
+        self.read_text = READERS[reader]
+
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(directory, exist_ok = True)
+
+        self._size = sum(entry.stat().st_size for entry in self._entries())
+
+
+    def _entries(self):
+        for sub in os.scandir(self.directory):
+            if sub.is_dir():
+                for entry in os.scandir(sub.path):
+                    if entry.name.endswith('.z'):
+                        yield entry
+
+
+    def key(self, path):
+        """Return the cache key of a document."""
+        digest = hashlib.sha256()
+
+        if self.key_mode == 'hash':
+            with open(path, 'rb') as docx:
+                for block in iter(lambda: docx.read(1024 * 1024), b''):
+                    digest.update(block)
+        else:
+            stat = os.stat(path)
+            digest.update(f"{os.path.abspath(path)}|{stat.st_mtime_ns}|{stat.st_size}".encode('utf-8'))
+
+        digest.update(self.reader.encode('utf-8'))
+
+        return digest.hexdigest()
+
+
+    def _entry_path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.z')
+
+
+    def get_text(self, path):
+        """Return a document's text, from the cache if possible."""
+        entry_path = self._entry_path(self.key(path))
+
+        try:
+            with open(entry_path, 'rb') as entry:
+                text = zlib.decompress(entry.read()).decode('utf-8')
+        except (FileNotFoundError, zlib.error):
+            pass
+        else:
+            try:
+                os.utime(entry_path)                                            # recency for eviction
+            except OSError:                                                     # evicted by another worker since the read
+                pass
+
+            self.hits += 1
+            return text
+
+        self.misses += 1
+        text = self.read_text(path)
+        self._put(entry_path, text)
+
+        return text
+
+
+    def _put(self, entry_path, text):
+        data = zlib.compress(text.encode('utf-8'), 6)
+
+        os.makedirs(os.path.dirname(entry_path), exist_ok = True)
+
+        # write to a temporary file and rename, so other processes never see a partial entry
+        handle, temp_path = tempfile.mkstemp(dir = os.path.dirname(entry_path), suffix = '.tmp')
+
+        with os.fdopen(handle, 'wb') as entry:
+            entry.write(data)
+
+        os.replace(temp_path, entry_path)
+
+        self._size += len(data)
+
+        if self._size > self.max_bytes:
+            self.evict()
+
+
+    def evict(self, fill = 0.9):
+        """Delete least recently used entries until the cache is below fill * max_bytes.
+
+        Trimming below the limit, rather than to it, means the directory is only
+        rescanned once every few puts when the cache is full.
+
+        """
+        entries = []
+
+        for entry in self._entries():
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue # evicted by another process
+
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        entries.sort()
+        size = sum(entry_size for mtime, entry_size, entry_path in entries)
+
+        for mtime, entry_size, entry_path in entries:
+            if size <= fill * self.max_bytes:
+                break
+
+            try:
+                os.remove(entry_path)
+            except FileNotFoundError:
+                pass
+
+            size -= entry_size
+
+        self._size = size
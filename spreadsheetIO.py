@@ -0,0 +1,467 @@
+## Shared spreadsheet reading and writing for the scripts in this folder ##
+##
+## The format is picked from the file extension (.csv, .xlsx/.xlsm/.xls or .parquet) and the fastest installed
+## engine is used for it: python-calamine for reading Excel, XlsxWriter's constant memory mode (or else
+## openpyxl's write-only mode) for writing it, and pyarrow for Parquet.
+## Identifier columns can be read as text so leading zeros (e.g. company numbers) survive.
+
+import csv
+import importlib.util
+import itertools
+import os
+
+import pandas as pd
+
+CSV = 'csv'
+EXCEL = 'excel'
+PARQUET = 'parquet'
+
+#: dict: File format by lower-case extension.
+FORMATS = {'.csv': CSV, '.xlsx': EXCEL, '.xlsm': EXCEL, '.xls': EXCEL, '.parquet': PARQUET}
+
+EXCEL_MAX_ROWS = 1048576                                                    # rows per worksheet in .xlsx
+EXCEL_MAX_CELL = 32767                                                      # characters per cell in .xlsx
+
+
+def file_format(path):
+    """Return CSV, EXCEL or PARQUET for a path, from its extension.
+
+    Raises:
+        ValueError: If the extension is not a supported format.
+
+    """
+    extension = os.path.splitext(path)[1].lower()
+
+    if extension not in FORMATS:
+        raise ValueError("unsupported file type (use .csv, .xlsx or .parquet): " + path)
+
+    return FORMATS[extension]
+
+
+def has_module(name):
+    """Return whether an optional module is installed, without importing it."""
+    return importlib.util.find_spec(name) is not None
+
+
+def excel_read_engine(path):
+    """Return the fastest installed pandas engine able to read an Excel file."""
+    if has_module('python_calamine'):
+        return 'calamine'                                                   # Rust reader, many times faster than openpyxl
+
+    return 'xlrd' if path.lower().endswith('.xls') else 'openpyxl'
+
+
+def _text_dtypes(text_columns):
+    return {column: str for column in text_columns or ()}
+
+
+def read_table(path, text_columns = None, sheet_name = 0, usecols = None):
+    """Read a whole .csv, Excel or .parquet file into a DataFrame.
+
+    Args:
+        path (str): The file to read.
+        text_columns (iterable): Columns to read as strings, so identifiers
+            such as company numbers keep their leading zeros.
+        sheet_name (str or int): Excel sheet to read.
+        usecols (list): Only read these columns.
+
+    Returns:
+        pandas.DataFrame: The table, with a default index.
+
+    """
+    form = file_format(path)
+    dtype = _text_dtypes(text_columns)
+
+    if form == CSV:
+        return pd.read_csv(path, dtype = dtype, usecols = usecols)
+
+    if form == PARQUET:
+        df = pd.read_parquet(path, columns = usecols)
+        return df.astype({column: str for column in dtype if column in df.columns})
+
+    return pd.read_excel(path, sheet_name = sheet_name, dtype = dtype, usecols = usecols,
+                         engine = excel_read_engine(path))
+
+
+def _excel_rows(path, sheet_name):
+    """Yield the rows of an Excel sheet as tuples of values, without loading it all."""
+    if has_module('python_calamine'):
+        from python_calamine import CalamineWorkbook
+
+        workbook = CalamineWorkbook.from_path(path)
+        sheet = (workbook.get_sheet_by_index(sheet_name) if isinstance(sheet_name, int)
+                 else workbook.get_sheet_by_name(sheet_name))
+
+        yield from sheet.iter_rows()
+        return
+
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only = True, data_only = True)
+
+    try:
+        sheet = workbook.worksheets[sheet_name] if isinstance(sheet_name, int) else workbook[sheet_name]
+        yield from sheet.iter_rows(values_only = True)
+    finally:
+        workbook.close()
+
+
+def _as_text(value):
+    """Return a cell value as text, writing whole numbers without a decimal point."""
+    if value is None or value == '':
+        return None
+    if isinstance(value, float):
+        if value != value:
+            return None # NaN
+        if value.is_integer():
+            return str(int(value))
+
+    return str(value)
+
+
+def iter_table_chunks(path, chunksize = 100000, text_columns = None, sheet_name = 0):
+    """Read a table a chunk of rows at a time.
+
+    Only one chunk is held in memory at once, so files far larger than memory
+    can be processed. Chunks keep a running index, as if the whole table had
+    been read in one go.
+
+    Args:
+        path (str): The file to read.
+        chunksize (int): Rows per chunk.
+        text_columns (iterable): Columns to read as strings.
+        sheet_name (str or int): Excel sheet to read.
+
+    Yields:
+        pandas.DataFrame: Consecutive chunks of the table.
+
+    """
+    form = file_format(path)
+    text_columns = list(text_columns or ())
+
+    if form == CSV:
+        with pd.read_csv(path, dtype = _text_dtypes(text_columns), chunksize = chunksize) as reader:
+            yield from reader
+        return
+
+    if form == PARQUET:
+        import pyarrow.parquet as pq
+
+        start = 0
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size = chunksize):
+            df = batch.to_pandas()
+            df.index = pd.RangeIndex(start, start + len(df))
+            start += len(df)
+
+            yield df.astype({column: str for column in text_columns if column in df.columns})
+        return
+
+    rows = _excel_rows(path, sheet_name)
+    header = [str(name) for name in next(rows, ())]
+    start = 0
+
+    while True:
+        chunk = list(itertools.islice(rows, chunksize))
+
+        if not chunk:
+            return
+
+        df = pd.DataFrame(chunk, columns = header, index = pd.RangeIndex(start, start + len(chunk)))
+        start += len(chunk)
+
+        for column in text_columns:
+            if column in df.columns:
+                df[column] = [_as_text(value) for value in df[column]]
+
+        yield df
+
+
+class CsvRowWriter:
+    """Writes rows to a .csv file as they arrive."""
+
+    def __init__(self, path):
+        self._file = open(path, 'w', newline = '', encoding = 'utf-8')
+        self._writer = csv.writer(self._file)
+
+
+    def write_rows(self, rows):
+        self._writer.writerows(rows)
+
+
+    def close(self):
+        self._file.close()
+
+
+class XlsxRowWriter:
+    """Writes rows to a .xlsx file with openpyxl's write-only mode.
+
+    Rows are serialised as they are appended rather than kept as cell objects,
+    so memory stays flat however many rows are written. A sheet that fills up
+    is continued on a new one, and text longer than Excel allows in a cell is
+    truncated.
+
+    """
+
+    def __init__(self, path, sheet_name = "Sheet1"):
+        self.path = path
+        self._sheet = None
+        self._sheet_name = sheet_name
+        self._sheet_rows = 0
+        self._sheet_count = 0
+        self._open()
+
+
+    def _open(self):
+        from openpyxl import Workbook
+
+        self._workbook = Workbook(write_only = True)
+
+
+    def _new_sheet(self, sheet_name):
+        return self._workbook.create_sheet(sheet_name)
+
+
+    def _append(self, row):
+        self._sheet.append(row)
+
+
+    def _save(self):
+        self._workbook.save(self.path)
+
+
+    def start_sheet(self, sheet_name):
+        """Write the following rows to a new sheet."""
+        self._sheet = self._new_sheet(sheet_name)
+        self._sheet_name = sheet_name
+        self._sheet_rows = 0
+        self._sheet_count += 1
+
+
+    def write_rows(self, rows):
+        for row in rows:
+            if self._sheet is None:
+                self.start_sheet(self._sheet_name)
+
+            elif self._sheet_rows == EXCEL_MAX_ROWS:
+                base_name = self._sheet_name
+                self.start_sheet(f"{base_name} ({self._sheet_count + 1})")
+                self._sheet_name = base_name
+
+            self._append([value[:EXCEL_MAX_CELL] if isinstance(value, str) and len(value) > EXCEL_MAX_CELL
+                          else value for value in row])
+            self._sheet_rows += 1
+
+
+    def close(self):
+        if self._sheet is None:
+            self.start_sheet(self._sheet_name)
+
+        self._save()
+
+
+class XlsxWriterRowWriter(XlsxRowWriter):
+    """An XlsxRowWriter using XlsxWriter's constant memory mode, which is faster than openpyxl."""
+
+    def _open(self):
+        import xlsxwriter
+
+        self._workbook = xlsxwriter.Workbook(self.path, {'constant_memory': True, 'nan_inf_to_errors': True})
+
+
+    def _new_sheet(self, sheet_name):
+        return self._workbook.add_worksheet(sheet_name)
+
+
+    def _append(self, row):
+        self._sheet.write_row(self._sheet_rows, 0, row)
+
+
+    def _save(self):
+        self._workbook.close()
+
+
+class ParquetRowWriter:
+    """Writes rows to a .parquet file one row group per chunk, with pyarrow.
+
+    A Parquet schema is fixed once the file is opened, so every row is padded
+    to the same number of string columns: the columns argument if given, or
+    else the widest row in the first chunk. A wider row later raises
+    ValueError instead of being cut short.
+
+    """
+
+    def __init__(self, path, columns = None):
+        self.path = path
+        self.columns = columns
+        self._writer = None
+
+
+    def write_rows(self, rows):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if not rows:
+            return
+
+        width = max(len(row) for row in rows)
+
+        if self._writer is None:
+            self.columns = max(self.columns or 0, width)
+            self._schema = pa.schema([(str(column), pa.string()) for column in range(self.columns)])
+            self._writer = pq.ParquetWriter(self.path, self._schema)
+
+        elif width > self.columns:
+            raise ValueError(f"row with {width} columns does not fit the {self.columns} column Parquet file; "
+                             "set the number of columns explicitly")
+
+        data = [[str(row[column]) if column < len(row) else '' for row in rows] for column in range(self.columns)]
+
+        self._writer.write_table(pa.Table.from_arrays(data, schema = self._schema))
+
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+def open_row_writer(path, columns = None):
+    """Return a streaming row writer for the file's format.
+
+    Args:
+        path (str): The file to write.
+        columns (int): Width of a .parquet file, see ParquetRowWriter.
+
+    """
+    form = file_format(path)
+
+    if form == CSV:
+        return CsvRowWriter(path)
+    if form == PARQUET:
+        return ParquetRowWriter(path, columns)
+    if not path.lower().endswith('.xlsx'):
+        raise ValueError("only .xlsx Excel files can be written: " + path)
+
+    if has_module('xlsxwriter'):
+        return XlsxWriterRowWriter(path)
+
+    return XlsxRowWriter(path)
+
+
+def write_rows(rows, path, chunksize = 10000, columns = None):
+    """Stream rows (lists of values) into a file in chunks of chunksize.
+
+    Returns:
+        int: Number of rows written.
+
+    """
+    writer = open_row_writer(path, columns)
+    written = 0
+    chunk = []
+
+    try:
+        for row in rows:
+            chunk.append(row)
+
+            if len(chunk) == chunksize:
+                writer.write_rows(chunk)
+                written += len(chunk)
+                chunk = []
+
+        writer.write_rows(chunk)
+        written += len(chunk)
+    finally:
+        writer.close()
+
+    return written
+
+
+def frame_rows(df, index = True, header = True):
+    """Yield a DataFrame's header and rows as lists, with blanks as None."""
+    if header:
+        names = [str(name) for name in df.columns]
+        yield ([df.index.name or ''] + names) if index else names
+
+    values = df.astype(object).where(df.notna(), None)
+
+    if index:
+        for label, row in zip(df.index, values.itertuples(index = False, name = None)):
+            yield [label, *row]
+    else:
+        yield from map(list, values.itertuples(index = False, name = None))
+
+
+def write_tables(path, sheets):
+    """Write several DataFrames to one file.
+
+    Excel files get one sheet per table. Formats without sheets write the
+    first table to path and each other one next to it, named
+    "<path stem>.<sheet name><extension>".
+
+    Args:
+        path (str): The file to write.
+        sheets (list): (sheet name, DataFrame, write the index) tuples.
+
+    """
+    form = file_format(path)
+
+    if form == EXCEL:
+        writer = open_row_writer(path)
+
+        try:
+            for sheet_name, df, index in sheets:
+                writer.start_sheet(sheet_name)
+                writer.write_rows(frame_rows(df, index))
+        finally:
+            writer.close()
+        return
+
+    stem, extension = os.path.splitext(path)
+
+    for number, (sheet_name, df, index) in enumerate(sheets):
+        sheet_path = path if number == 0 else f"{stem}.{sheet_name}{extension}"
+
+        if form == CSV:
+            df.to_csv(sheet_path, index = index)
+        else:
+            df.to_parquet(sheet_path, index = index)
+
+
+def write_table(df, path, index = True, sheet_name = "Sheet1"):
+    """Write a DataFrame as .csv, .xlsx or .parquet depending on the extension."""
+    write_tables(path, [(sheet_name, df, index)])
+
+
+if __name__ == "__main__":
+    import tempfile
+    import time
+
+    rows = 100000
+    df = pd.DataFrame({"Company Number": [f"{n:08d}" for n in range(rows)],
+                       "Company Name": [f"EXAMPLE {n} LIMITED" for n in range(rows)],
+                       "Value": range(rows)})
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "benchmark.xlsx")
+
+        tic = time.perf_counter()
+        df.to_excel(path, index = False)
+        print(f"pandas to_excel, {rows} rows: {time.perf_counter() - tic:0.2f} seconds")
+
+        tic = time.perf_counter()
+        write_table(df, path, index = False)
+        print(f"write_table, {rows} rows: {time.perf_counter() - tic:0.2f} seconds")
+
+        tic = time.perf_counter()
+        pd.read_excel(path, dtype = {"Company Number": str}, engine = 'openpyxl')
+        print(f"pandas read_excel (openpyxl), {rows} rows: {time.perf_counter() - tic:0.2f} seconds")
+
+        tic = time.perf_counter()
+        read = read_table(path, text_columns = ["Company Number"])
+        print(f"read_table ({excel_read_engine(path)}), {rows} rows: {time.perf_counter() - tic:0.2f} seconds")
+
+        tic = time.perf_counter()
+        chunks = sum(1 for chunk in iter_table_chunks(path, 10000, ["Company Number"]))
+        print(f"iter_table_chunks, {chunks} chunks: {time.perf_counter() - tic:0.2f} seconds")
+
+        assert read["Company Number"].iloc[1] == "00000001"
@@ -0,0 +1,9 @@
+## Lets the tests import the CompaniesHouse modules and the benchmark fixtures the way the scripts do ##
+
+import os
+import sys
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(TESTS_DIR)
+
+sys.path[:0] = [os.path.join(REPO_DIR, "benchmarks"), REPO_DIR, os.path.join(REPO_DIR, "CompaniesHouse")]
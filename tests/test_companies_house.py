@@ -0,0 +1,297 @@
+## Assertion tests for the Companies House clients, run against the stub API in benchmarks/benchmarkFixtures.py ##
+##
+## Usage:  python -m pytest tests
+
+import asyncio
+import socket
+import sqlite3
+
+import aiohttp
+import pytest
+
+import benchmarkFixtures as fixtures
+from AsyncCompaniesHouseService import AsyncCompaniesHouseService
+from CompaniesHouseCache import ResponseCache
+from CompaniesHouseRateLimiter import TokenBucket
+from CompaniesHouseService import CompaniesHouseError, CompaniesHouseService
+from CompaniesHouseSnapshot import SnapshotIndex, build_snapshot_index
+
+KEY = "test-key"
+
+
+def unlimited_bucket():
+    """Return a limiter that never holds a request back."""
+    return TokenBucket(capacity = 10 ** 9, period = 1, api_window = 1)
+
+
+def unused_port():
+    """Return a local port with nothing listening on it."""
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+class CountingBucket(TokenBucket):
+    """A token bucket which counts the tokens taken from it."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.taken = 0
+
+    def reserve(self, tokens = 1):
+        self.taken += tokens
+        return super().reserve(tokens)
+
+
+class FailingStub(fixtures.StubCompaniesHouse):
+    """The stub API, with every profile ending in "55" answered 503."""
+
+    def route(self, path, headers):
+        if path.rstrip("/").endswith("55"):
+            return 503, {}, headers
+
+        return super().route(path, headers)
+
+
+@pytest.fixture
+def stub():
+    with fixtures.StubCompaniesHouse(latency = 0) as server:
+        yield server
+
+
+def test_connection_is_reused(stub):
+    with CompaniesHouseService(KEY, api_root = stub.url, rate_limiter = unlimited_bucket()) as api:
+        for number in range(1, 21):
+            assert api.get_company_profile(f"{number:08d}")["company_number"] == f"{number:08d}"
+
+        summary = api.timing_summary()
+
+    assert summary["requests"] == 20
+    assert summary["new_connections"] == 1
+    assert summary["reused_connections"] == 19
+
+
+def test_throttled_request_waits_for_retry_after():
+    with fixtures.StubCompaniesHouse(latency = 0, rate_limit = 3, rate_window = 1) as stub:
+        # one client spends the window, so the next client's first request is throttled
+        with CompaniesHouseService(KEY, api_root = stub.url, rate_limiter = unlimited_bucket()) as first:
+            for number in ("00000001", "00000002", "00000003"):
+                first.get_company_profile(number)
+
+        with CompaniesHouseService(KEY, api_root = stub.url, rate_limiter = unlimited_bucket()) as second:
+            profile = second.get_company_profile("00000004")
+
+    assert profile["company_number"] == "00000004"
+    assert stub.throttled == 1
+    assert stub.requests == 5
+
+
+def test_retry_takes_a_token_and_retry_after_blocks_the_limiter():
+    with fixtures.StubCompaniesHouse(latency = 0, rate_limit = 3, rate_window = 1) as stub:
+        with CompaniesHouseService(KEY, api_root = stub.url, rate_limiter = unlimited_bucket()) as first:
+            for number in ("00000001", "00000002", "00000003"):
+                first.get_company_profile(number)
+
+        limiter = CountingBucket(capacity = 10 ** 9, period = 1, api_window = 1)
+
+        with CompaniesHouseService(KEY, api_root = stub.url, rate_limiter = limiter) as second:
+            second.get_company_profile("00000004")
+
+    assert stub.throttled == 1
+    assert limiter.taken == 2                                                   # the request and its retry
+
+
+def test_retry_after_header_holds_back_every_caller():
+    now = [0.0]
+    limiter = TokenBucket(capacity = 100, period = 1, clock = lambda: now[0], sleep = lambda seconds: None)
+
+    limiter.update_from_headers({"Retry-After": "2"})
+
+    assert limiter.acquire() == 2
+    now[0] += 1.5
+    assert limiter.acquire() == pytest.approx(0.5)
+    now[0] += 1
+    assert limiter.acquire() == 0
+
+
+def test_paged_lists_are_fetched_in_full():
+    with fixtures.StubCompaniesHouse(latency = 0, officers = 230, charges = 120) as stub:
+        with CompaniesHouseService(KEY, api_root = stub.url, rate_limiter = unlimited_bucket()) as api:
+            links = api.get_company_profile("00000001")["links"]
+            directors = api.get_company_directors(links["officers"])
+            charges = api.get_company_charges(links["charges"])
+
+    assert len(directors) == 230
+    assert len(charges) == 120
+    assert len(set(directors)) == 230
+    assert stub.requests == 1 + 3 + 2                                           # 100 items per page
+
+
+def test_stale_entry_is_revalidated_by_etag(tmp_path):
+    now = [1000000.0]
+    number = "00000001"
+
+    with fixtures.StubCompaniesHouse(latency = 0, etags = True) as stub, \
+            ResponseCache(str(tmp_path / "cache.sqlite"), clock = lambda: now[0]) as cache, \
+            CompaniesHouseService(KEY, api_root = stub.url, rate_limiter = unlimited_bucket(),
+                                  cache = cache) as api:
+        profile = api.get_company_profile(number)
+        assert api.get_company_profile(number) == profile
+        assert stub.requests == 1                                               # fresh: answered from the cache
+
+        now[0] += cache.ttls["profile"] + 1
+        assert api.get_company_profile(number) == profile
+        assert stub.requests == 2
+        assert stub.not_modified == 1
+        assert cache.revalidated == 1
+
+        assert api.get_company_profile(number) == profile
+        assert stub.requests == 2                                               # fresh again after the 304
+
+
+def test_snapshot_answers_profiles_and_misses_fall_back_to_api(stub, tmp_path):
+    snapshot = str(tmp_path / "snapshot.csv")
+    index = str(tmp_path / "snapshot.sqlite")
+    fixtures.write_company_snapshot(snapshot, ["00000001", "00000002"])
+    build_snapshot_index([snapshot], index)
+
+    with SnapshotIndex(index) as snapshot_index, \
+            CompaniesHouseService(KEY, api_root = stub.url, rate_limiter = unlimited_bucket(),
+                                  snapshot = snapshot_index) as api:
+        assert api.get_company_profile("00000001")["company_name"] == "EXAMPLE 00000001 LIMITED"
+        assert stub.requests == 0
+
+        assert api.get_company_profile("00000003")["company_number"] == "00000003"
+        assert stub.requests == 1
+
+
+def test_only_not_found_is_an_empty_result():
+    with FailingStub(latency = 0) as stub, \
+            CompaniesHouseService(KEY, api_root = stub.url, rate_limiter = unlimited_bucket(),
+                                  max_retries = 0, raise_on_error = True) as api:
+        assert api.get_company_profile("00000099") == {}
+
+        with pytest.raises(CompaniesHouseError) as error:
+            api.get_company_profile("00000055")
+
+    assert error.value.status_code == 503
+
+
+def test_failed_name_search_is_retried_and_does_not_stop_the_batch():
+    class FirstSearchFails(fixtures.StubCompaniesHouse):
+        searched = False
+
+        def route(self, path, headers):
+            if path.startswith("/search/") and not self.searched:
+                self.searched = True
+                return 503, {}, headers
+
+            return super().route(path, headers)
+
+    with FirstSearchFails(latency = 0) as stub, \
+            CompaniesHouseService(KEY, api_root = stub.url, rate_limiter = unlimited_bucket(),
+                                  max_retries = 0, raise_on_error = True) as api:
+        first = api.resolve_company_names(["Acme Ltd", "Beta Ltd"])
+        failed = dict(api.name_resolver.failed)
+        second = api.resolve_company_names(["Acme Ltd", "Beta Ltd"])
+
+    assert first["Acme Ltd"] == [] and first["Beta Ltd"]
+    assert list(failed) == ["acme ltd"]
+    assert second["Acme Ltd"][0].company_name == "ACME LTD LIMITED"
+    assert api.name_resolver.failed == {}
+    assert stub.requests == 3
+
+
+def test_async_throttled_requests_wait_for_retry_after():
+    numbers = [f"{number:08d}" for number in range(1, 7)]
+
+    async def fetch(url):
+        async with AsyncCompaniesHouseService(KEY, concurrency = 6, api_root = url,
+                                              rate_limiter = unlimited_bucket()) as api:
+            return await api.get_many_company_details(numbers)
+
+    # all six are sent before any rate limit headers come back, so three are throttled
+    with fixtures.StubCompaniesHouse(latency = 0.05, rate_limit = 3, rate_window = 1) as stub:
+        details = asyncio.run(fetch(stub.url))
+
+    assert sorted(details) == numbers
+    assert all(details[number]["profile"]["company_number"] == number for number in numbers)
+    assert stub.throttled == 3
+
+
+def test_async_retries_share_the_limiter_during_a_throttle():
+    numbers = [f"{number:08d}" for number in range(1, 7)]
+    limiter = CountingBucket(capacity = 10 ** 9, period = 1, api_window = 1)
+
+    async def fetch(url):
+        async with AsyncCompaniesHouseService(KEY, concurrency = 6, api_root = url, rate_limiter = limiter,
+                                              raise_on_error = True) as api:
+            return await api.get_many_company_details(numbers, officers = True, charges = True)
+
+    # far more requests than one window allows: retries must wait with everyone else, not spend their attempts
+    with fixtures.StubCompaniesHouse(latency = 0.02, rate_limit = 5, rate_window = 1, officers = 150) as stub:
+        details = asyncio.run(fetch(stub.url))
+
+    assert all(len(details[number]["directors"]) == 150 for number in numbers)
+    assert stub.throttled > 0
+    assert limiter.taken == stub.requests
+
+
+def test_async_details_fetch_every_page():
+    numbers = [f"{number:08d}" for number in range(1, 5)]
+
+    async def fetch(url):
+        async with AsyncCompaniesHouseService(KEY, concurrency = 4, api_root = url,
+                                              rate_limiter = unlimited_bucket()) as api:
+            return await api.get_many_company_details(numbers, officers = True, charges = True)
+
+    with fixtures.StubCompaniesHouse(latency = 0, officers = 150, charges = 201) as stub:
+        details = asyncio.run(fetch(stub.url))
+
+    assert all(len(details[number]["directors"]) == 150 for number in numbers)
+    assert all(len(details[number]["charges"]) == 201 for number in numbers)
+    assert stub.requests == len(numbers) * (1 + 2 + 3)
+
+
+def test_async_iter_company_details_raises_worker_errors():
+    url = "http://127.0.0.1:" + str(unused_port())
+
+    async def collect(return_exceptions):
+        async with AsyncCompaniesHouseService(KEY, concurrency = 2, api_root = url, max_retries = 0,
+                                              rate_limiter = unlimited_bucket()) as api:
+            return [item async for item in api.iter_company_details(
+                ["00000001", "00000002", "00000003"], return_exceptions = return_exceptions)]
+
+    with pytest.raises(aiohttp.ClientConnectionError):
+        asyncio.run(asyncio.wait_for(collect(False), 10))
+
+    results = asyncio.run(asyncio.wait_for(collect(True), 10))
+
+    assert sorted(number for number, _ in results) == ["00000001", "00000002", "00000003"]
+    assert all(isinstance(error, aiohttp.ClientConnectionError) for _, error in results)
+
+
+def test_cache_lookups_leave_no_write_transaction_open(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    now = [1000.0]
+
+    with ResponseCache(path, memory_entries = 10, clock = lambda: now[0], recency_batch = 3) as cache:
+        for number in range(4):
+            cache.put(f"/company/{number:08d}", {"company_number": f"{number:08d}"})
+
+        now[0] += 60
+        cache.get("/company/00000000")
+        cache.get("/company/00000001")
+        assert not cache._db.in_transaction
+
+        # another process can write to the file between lookups
+        other = sqlite3.connect(path, timeout = 0)
+        other.execute("UPDATE responses SET etag = 'x' WHERE key = '/company/00000003'")
+        other.commit()
+        other.close()
+
+        cache.get("/company/00000002")                                          # a full batch of last-use times is written
+        accessed = dict(cache._db.execute("SELECT key, accessed_at FROM responses"))
+
+    assert accessed == {"/company/00000000": 1060.0, "/company/00000001": 1060.0,
+                        "/company/00000002": 1060.0, "/company/00000003": 1000.0}